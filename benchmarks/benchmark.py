@@ -0,0 +1,337 @@
+"""Hermetic benchmark of the conversion pipeline.
+
+Synthesizes icon sets in a temporary directory, serves them from an
+in-process HTTP server with configurable latency and reports throughput and
+latency percentiles for every backend, target format and mode as JSON::
+
+    $ python benchmarks/benchmark.py --jobs 20 --latency 50 --output run.json
+"""
+
+import argparse, json, os, platform, shutil, subprocess, sys, tempfile, \
+    threading, time
+from multiprocessing.pool import ThreadPool
+
+from PIL import Image
+
+try:
+    from http.server import HTTPServer, SimpleHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import HTTPServer
+    from SimpleHTTPServer import SimpleHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from iconmaker import Converter, convert_many, FORMAT_ICO, FORMAT_ICNS, \
+    BACKEND_PILLOW, BACKEND_IMAGEMAGICK
+from iconmaker.stats import clock
+
+MODE_SINGLE = 'single'
+MODE_BATCH = 'batch'
+MODE_CONCURRENT = 'concurrent'
+MODES = [MODE_SINGLE, MODE_BATCH, MODE_CONCURRENT]
+
+ICON_SETS = [
+    # Complete set of 32 bit PNG images.
+    [('png', 'RGBA', (size, size)) for size in (16, 32, 48, 64, 128, 256)],
+    # Single large master.
+    [('png', 'RGBA', (1024, 1024))],
+    # Non-square images of lower depths.
+    [('png', 'RGB', (40, 32)), ('png', 'L', (64, 64)), ('png', 'P', (300, 200))],
+    # Palette GIF and JPEG images.
+    [('gif', 'P', (16, 16)), ('gif', 'P', (32, 32)), ('jpeg', 'RGB', (128, 128)),
+     ('jpeg', 'L', (100, 100))],
+]
+"""Synthesized icon sets as lists of ``(format, mode, size)`` tuples.
+"""
+
+
+def synthesize_image(path, image_format, mode, size):
+    """Write an image with a gradient and a transparent border.
+
+    :param path: Path to write the image to.
+    :param image_format: Pillow format name.
+    :param mode: Mode of the image.
+    :param size: ``Tuple`` consisting of the width and height of the image.
+    """
+
+    (width, height) = size
+    image = Image.new('RGBA', size, (0, 0, 0, 0))
+    pixels = image.load()
+    for y in range(height // 8, height - height // 8):
+        for x in range(width // 8, width - width // 8):
+            pixels[x, y] = (x * 255 // width, y * 255 // height, 128, 255)
+
+    if mode == 'P':
+        image = image.convert('RGB').convert('P', palette = Image.ADAPTIVE)
+    elif mode != 'RGBA':
+        image = image.convert(mode)
+
+    image.save(path, image_format.upper())
+
+
+def synthesize_icon_sets(directory):
+    """Synthesize the benchmark icon sets.
+
+    :param directory: Directory to write the images to.
+    :returns:
+        ``List`` of icon sets as lists of file names relative to
+        ``directory``.
+    """
+
+    icon_sets = []
+    for (index, icon_set) in enumerate(ICON_SETS):
+        filenames = []
+        for (image_format, mode, size) in icon_set:
+            filename = 'set%d_%s_%dx%d.%s' % (index,
+                                              mode,
+                                              size[0],
+                                              size[1],
+                                              image_format)
+            synthesize_image(os.path.join(directory, filename),
+                             image_format,
+                             mode,
+                             size)
+            filenames.append(filename)
+        icon_sets.append(filenames)
+
+    return icon_sets
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """HTTP server handling every request in a thread.
+    """
+
+    daemon_threads = True
+
+
+def serve(directory, latency):
+    """Serve a directory over HTTP on a background thread.
+
+    :param directory: Directory to serve.
+    :param latency: Delay in seconds added to every response.
+    :returns:
+        ``Tuple`` consisting of the server and its base URL.
+    """
+
+    class Handler(SimpleHTTPRequestHandler):
+        def translate_path(self, path):
+            return os.path.join(directory, os.path.basename(path))
+
+        def do_GET(self):
+            time.sleep(latency)
+            SimpleHTTPRequestHandler.do_GET(self)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target = server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    return (server, 'http://127.0.0.1:%d/' % (server.server_address[1]))
+
+
+def build_jobs(icon_sets, directory, base_url, target_format, count):
+    """Build conversion jobs cycling through the icon sets.
+
+    Every other image is referenced by URL, the rest by local path.
+
+    :param icon_sets: Icon sets as returned by ``synthesize_icon_sets``.
+    :param directory: Directory of the images.
+    :param base_url: Base URL the directory is served at.
+    :param target_format: Target icon format.
+    :param count: Number of jobs.
+    :returns:
+        ``List`` of ``(image_list, target_format, target_path)`` tuples.
+    """
+
+    jobs = []
+    for index in range(count):
+        icon_set = icon_sets[index % len(icon_sets)]
+        image_list = [base_url + filename if position % 2 else
+                      os.path.join(directory, filename)
+                      for (position, filename) in enumerate(icon_set)]
+        target_path = os.path.join(directory,
+                                   'out%d.%s' % (index, target_format))
+        jobs.append((image_list, target_format, target_path))
+
+    return jobs
+
+
+def run_job(converter_kwargs, job):
+    """Run a single job on a new converter.
+
+    :param converter_kwargs: Keyword arguments to create the converter with.
+    :param job: ``(image_list, target_format, target_path)`` tuple.
+    :returns:
+        the latency of the job in seconds.
+    """
+
+    started = clock()
+    Converter(**converter_kwargs).convert(*job)
+    return clock() - started
+
+
+def run_scenario(mode, jobs, workers, converter_kwargs):
+    """Run a list of jobs in a mode.
+
+    :param mode: One of ``MODES``.
+    :param jobs: Jobs as returned by ``build_jobs``.
+    :param workers: Number of worker processes or threads.
+    :param converter_kwargs: Keyword arguments to create converters with.
+    :returns:
+        ``Tuple`` consisting of the wall time in seconds and the list of job
+        latencies in seconds.
+    """
+
+    started = clock()
+
+    if mode == MODE_SINGLE:
+        converter = Converter(**converter_kwargs)
+        latencies = []
+        for job in jobs:
+            job_started = clock()
+            converter.convert(*job)
+            latencies.append(clock() - job_started)
+    elif mode == MODE_BATCH:
+        latencies = []
+        for result in convert_many(jobs, workers, **converter_kwargs):
+            if result.error:
+                raise RuntimeError(result.error)
+            latencies.append(result.stats['seconds'])
+    else:
+        pool = ThreadPool(workers)
+        try:
+            latencies = pool.map(lambda job: run_job(converter_kwargs, job),
+                                 jobs)
+        finally:
+            pool.terminate()
+
+    return (clock() - started, latencies)
+
+
+def percentile(values, fraction):
+    """Determine a percentile by the nearest-rank method.
+
+    :param values: Non-empty list of values.
+    :param fraction: Percentile as a fraction between 0 and 1.
+    :returns:
+        the percentile.
+    """
+
+    values = sorted(values)
+    rank = max(1, int(round(fraction * len(values) + 0.4999)))
+    return values[min(rank, len(values)) - 1]
+
+
+def git_revision():
+    """Determine the checked out git revision, if any.
+
+    :returns:
+        the revision or ``None``.
+    """
+
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                         cwd = os.path.dirname(__file__),
+                                         stderr = subprocess.STDOUT)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return output.decode('ascii').strip()
+
+
+def main(argv = None):
+    """Run the benchmark.
+
+    :param argv: Command line arguments.
+    """
+
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[0])
+    parser.add_argument('--jobs', type = int, default = 16,
+                        help = 'conversions per scenario')
+    parser.add_argument('--workers', type = int, default = 4,
+                        help = 'processes or threads for batch and concurrent '
+                        'modes')
+    parser.add_argument('--latency', type = float, default = 20,
+                        help = 'HTTP response latency in milliseconds')
+    parser.add_argument('--backend', action = 'append',
+                        choices = [BACKEND_PILLOW, BACKEND_IMAGEMAGICK],
+                        help = 'backend to run, may be repeated (default: all '
+                        'available)')
+    parser.add_argument('--format', action = 'append',
+                        choices = [FORMAT_ICO, FORMAT_ICNS],
+                        help = 'target format, may be repeated (default: all)')
+    parser.add_argument('--mode', action = 'append', choices = MODES,
+                        help = 'mode, may be repeated (default: all)')
+    parser.add_argument('--output', help = 'file to write the results to '
+                        '(default: standard output)')
+    args = parser.parse_args(argv)
+
+    capabilities = Converter().capabilities()
+    backends = args.backend or [backend for backend in (BACKEND_PILLOW,
+                                                        BACKEND_IMAGEMAGICK)
+                                if capabilities[backend]]
+
+    directory = tempfile.mkdtemp(prefix = 'iconmaker_benchmark_')
+    (server, base_url) = serve(directory, args.latency / 1000.0)
+    try:
+        icon_sets = synthesize_icon_sets(directory)
+
+        results = []
+        for backend in backends:
+            for target_format in args.format or [FORMAT_ICO, FORMAT_ICNS]:
+                jobs = build_jobs(icon_sets,
+                                  directory,
+                                  base_url,
+                                  target_format,
+                                  args.jobs)
+
+                for mode in args.mode or MODES:
+                    (seconds, latencies) = run_scenario(mode,
+                                                        jobs,
+                                                        args.workers,
+                                                        {'backend': backend})
+                    results.append({
+                        'backend': backend,
+                        'format': target_format,
+                        'mode': mode,
+                        'jobs': len(jobs),
+                        'seconds': seconds,
+                        'throughput': len(jobs) / seconds,
+                        'latency': {
+                            'p50': percentile(latencies, 0.5),
+                            'p90': percentile(latencies, 0.9),
+                            'p99': percentile(latencies, 0.99),
+                            'max': max(latencies),
+                        },
+                    })
+    finally:
+        server.shutdown()
+        shutil.rmtree(directory, ignore_errors = True)
+
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'settings': {
+            'jobs': args.jobs,
+            'workers': args.workers,
+            'latency_ms': args.latency,
+        },
+        'results': results,
+    }
+
+    output = json.dumps(report, indent = 2, sort_keys = True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
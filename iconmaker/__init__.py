@@ -1 +1,8 @@
-from .converter import Converter, FORMAT_PNG, FORMAT_GIF, FORMAT_ICNS, FORMAT_ICO, is_size_convertible_to_icon
+import sys
+
+from .converter import Converter, FORMAT_PNG, FORMAT_GIF, FORMAT_ICNS, FORMAT_ICO, BACKEND_PILLOW, BACKEND_IMAGEMAGICK, is_size_convertible_to_icon
+from .batch import convert_many, BatchResult
+from .compression import COMPRESSION_FAST, COMPRESSION_BALANCED, COMPRESSION_SMALLEST
+
+if sys.version_info >= (3, 7):
+    from .aio import AsyncConverter
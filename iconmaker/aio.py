@@ -0,0 +1,397 @@
+import asyncio, contextvars, subprocess
+from contextlib import asynccontextmanager
+from functools import partial
+
+from .converter import Converter, BACKEND_PILLOW, BACKEND_IMAGEMAGICK, unique_urls
+from .exceptions import ConversionError
+from .utils import write_file, read_file
+from .stats import STAGE_RESIZE
+from .logger import logging
+from . import imaging
+
+
+async def run_command_async(args, input_data = None):
+    """Run an external command without blocking the event loop.
+
+    :param args: Command and arguments to run.
+    :param input_data: Data to write to the standard input of the command.
+    :returns:
+        the standard output of the command.
+    :raises subprocess.CalledProcessError:
+        if the command exits with a non-zero status, with the standard error
+        output as its ``output``.
+    """
+
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdin = subprocess.PIPE,
+        stdout = subprocess.PIPE,
+        stderr = subprocess.PIPE)
+    (output, error) = await process.communicate(input_data)
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode,
+                                            args,
+                                            output = error)
+
+    return output
+
+
+class AsyncConverter(Converter):
+    """Converter with coroutine variants of the conversion stages.
+
+    External tools run as asyncio subprocesses, fetching and CPU bound Pillow
+    work run on an executor, so many conversions can be in flight on one
+    event loop.
+    """
+
+    def __init__(self, *args, executor = None, **kwargs):
+        """Initializer.
+
+        Accepts the same arguments as :class:`Converter`.
+
+        :param executor:
+            :class:`concurrent.futures.Executor` for fetching and Pillow work.
+            Defaults to the event loop's default executor.
+        """
+
+        super(AsyncConverter, self).__init__(*args, **kwargs)
+        self.executor = executor
+
+    async def run_in_executor(self, func, *args):
+        """Run a blocking function on the executor.
+
+        The function runs in a copy of the current context, so that it
+        records its measurements in the stats of the calling conversion.
+
+        :param func: Function to run.
+        :param args: Positional arguments to call ``func`` with.
+        :returns:
+            the return value of ``func``.
+        """
+
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor,
+                                          partial(context.run, func, *args))
+
+    @asynccontextmanager
+    async def workspace_async(self):
+        """Coroutine variant of ``workspace``.
+
+        The intermediate files are removed on the executor, so that a large
+        scratch directory doesn't hold up the event loop.
+
+        :returns:
+            an asynchronous context manager yielding a
+            :class:`iconmaker.workspace.Workspace`.
+        """
+
+        workspace = self.workspace()
+        try:
+            yield workspace
+        finally:
+            await self.run_in_executor(workspace.cleanup)
+
+    async def run_tool_async(self,
+                             stage,
+                             args,
+                             input_data):
+        """Coroutine variant of ``run_tool``.
+        """
+
+        logging.debug('Conversion call arguments: %r' % (args))
+
+        with self.stats.measure(stage) as measurement:
+            measurement.subprocesses = 1
+            measurement.bytes_in = len(input_data)
+            output = await run_command_async(args, input_data)
+            measurement.bytes_out = len(output)
+
+        return output
+
+    async def fetch_image_async(self, url):
+        """Coroutine variant of ``fetch_image``.
+        """
+
+        return await self.run_in_executor(self.fetch_image, url)
+
+    async def fetch_images_async(self, urls):
+        """Coroutine variant of ``fetch_images``.
+
+        At most ``fetch_workers`` images are fetched at a time.
+        """
+
+        semaphore = asyncio.Semaphore(self.fetch_workers)
+
+        async def fetch(url):
+            async with semaphore:
+                return await self.run_in_executor(self.try_fetch_image, url)
+
+        results = await asyncio.gather(*[fetch(url) for url in urls])
+        return self.collect_fetched_images(results)
+
+    async def promote_image_async(self,
+                                  image,
+                                  info = None):
+        """Coroutine variant of ``promote_image``.
+        """
+
+        return await self.run_in_executor(self.promote_image, image, info)
+
+    async def resize_image_async(self,
+                                 image,
+                                 image_width,
+                                 image_height,
+                                 transparency):
+        """Coroutine variant of ``resize_image``.
+        """
+
+        if self.backend == BACKEND_PILLOW:
+            return await self.run_in_executor(self.resize_image,
+                                              image,
+                                              image_width,
+                                              image_height,
+                                              transparency)
+
+        if not isinstance(image, bytes):
+            image = await self.run_in_executor(imaging.encode_png, image)
+
+        args = self.resize_command(image_width, image_height, transparency)
+
+        try:
+            return await self.run_tool_async(STAGE_RESIZE, args, image)
+        except subprocess.CalledProcessError as e:
+            raise ConversionError('Failed to resize image %s' % (e.output))
+
+    async def apply_resize_steps_async(self,
+                                       image,
+                                       steps):
+        """Coroutine variant of ``apply_resize_steps``.
+        """
+
+        if self.backend == BACKEND_PILLOW:
+            return await self.run_in_executor(self.apply_resize_steps,
+                                              image,
+                                              steps)
+
+        return await self.run_pipeline_async(image, steps)
+
+    async def run_pipeline_async(self,
+                                 image,
+                                 steps):
+        """Coroutine variant of ``run_pipeline``.
+        """
+
+        if not isinstance(image, bytes):
+            image = await self.run_in_executor(imaging.encode_png, image)
+
+        args = self.pipeline_command(steps)
+
+        try:
+            return await self.run_tool_async(STAGE_RESIZE, args, image)
+        except subprocess.CalledProcessError as e:
+            raise ConversionError('Failed to normalize image %s' % (e.output))
+
+    async def normalize_image_async(self,
+                                    image,
+                                    steps,
+                                    info = None):
+        """Coroutine variant of ``normalize_image``.
+        """
+
+        if self.backend == BACKEND_IMAGEMAGICK:
+            if steps:
+                return await self.run_pipeline_async(image, steps)
+            return await self.promote_image_async(image, info)
+
+        image = await self.promote_image_async(image, info)
+        if steps:
+            image = await self.apply_resize_steps_async(image, steps)
+
+        return image
+
+    async def generate_ladder_async(self,
+                                    image,
+                                    info,
+                                    steps,
+                                    sizes,
+                                    workspace = None):
+        """Coroutine variant of ``generate_ladder``.
+        """
+
+        if self.backend == BACKEND_PILLOW:
+            return await self.run_in_executor(self.generate_ladder,
+                                              image,
+                                              info,
+                                              steps,
+                                              sizes)
+
+        if workspace is None:
+            async with self.workspace_async() as workspace:
+                return await self.generate_ladder_async(image,
+                                                        info,
+                                                        steps,
+                                                        sizes,
+                                                        workspace)
+
+        # Allocating the paths may create the scratch directory.
+        (args, paths) = await self.run_in_executor(self.ladder_command,
+                                                   max(info.size),
+                                                   steps,
+                                                   sizes,
+                                                   workspace)
+
+        try:
+            await self.run_tool_async(STAGE_RESIZE, args, image)
+        except subprocess.CalledProcessError as e:
+            raise ConversionError('Failed to generate sizes %s' % (e.output))
+
+        versions = []
+        for path in paths:
+            versions.append(await self.run_in_executor(read_file, path))
+
+        return versions
+
+    async def build_container_async(self,
+                                    sources,
+                                    target_format,
+                                    workspace = None):
+        """Coroutine variant of ``build_container``.
+
+        Hashing and probing the sources run on the executor.
+        """
+
+        (sources, infos) = await self.run_in_executor(self.prepare_sources,
+                                                      sources)
+
+        key = await self.run_in_executor(self.result_key,
+                                         sources,
+                                         target_format,
+                                         infos)
+        if key is not None:
+            data = await self.run_in_executor(self.result_cache.get, key)
+            if data is not None:
+                logging.debug('Result cache hit: %s' % (key))
+                return data
+
+        data = await self.render_container_async(sources,
+                                                 target_format,
+                                                 infos,
+                                                 workspace)
+
+        if key is not None:
+            await self.run_in_executor(self.result_cache.put, key, data)
+
+        return data
+
+    async def render_container_async(self,
+                                     sources,
+                                     target_format,
+                                     infos = None,
+                                     workspace = None):
+        """Coroutine variant of ``render_container``.
+
+        Images are normalized concurrently. Probing runs on the executor.
+        """
+
+        if workspace is None:
+            async with self.workspace_async() as workspace:
+                return await self.render_container_async(sources,
+                                                         target_format,
+                                                         infos,
+                                                         workspace)
+
+        self.validate_sources(sources, target_format)
+
+        if infos is None:
+            infos = await self.run_in_executor(self.probe_sources, sources)
+
+        plan = self.plan_container(sources, target_format, infos)
+        (plan, ladder) = self.plan_ladder(sources, infos, plan, target_format)
+
+        sizes = [self.planned_size(info, steps)
+                 for (image, info, steps) in plan]
+        coroutines = [self.normalize_image_async(image, steps, info)
+                      for (image, info, steps) in plan]
+
+        if ladder is not None:
+            sizes.extend([(size, size) for size in ladder[3]])
+            coroutines.append(self.generate_ladder_async(*ladder,
+                                                         workspace = workspace))
+
+        results = await asyncio.gather(*coroutines)
+        if ladder is not None:
+            results = list(results[:-1]) + list(results[-1])
+
+        image_list = [image for (size, image) in sorted(zip(sizes, results),
+                                                        key = lambda x: x[0])]
+
+        return await self.run_in_executor(self.assemble_container,
+                                          image_list,
+                                          target_format)
+
+    async def convert_async(self,
+                            image_list,
+                            target_format,
+                            target_path):
+        """Coroutine variant of ``convert``.
+
+        Every conversion collects its own ``stats``, also when several are in
+        flight on the same converter, as long as each runs in its own task,
+        e.g. through ``asyncio.gather``. Cached containers are hard-linked to
+        the target path like in ``convert``.
+        """
+
+        # Validate the input arguments.
+        if target_format not in Converter.SUPPORTED_TARGET_FORMATS:
+            raise ConversionError('invalid target format identifier: %s' % (
+                target_format))
+
+        if len(image_list) == 0:
+            raise ValueError('image input list cannot be empty')
+
+        self.start_stats()
+        try:
+            # A single workspace holds the intermediate files of all stages.
+            async with self.workspace_async() as workspace:
+                # Load all input files into memory.
+                urls = unique_urls(image_list)
+
+                # Skip invalid/corrupt URLs
+                fetched = dict(zip(urls, await self.fetch_images_async(urls)))
+                sources = await self.run_in_executor(self.read_sources,
+                                                     image_list,
+                                                     fetched)
+
+                logging.debug('Target path: %r' % (target_path))
+
+                (sources, infos) = await self.run_in_executor(
+                    self.prepare_sources,
+                    sources)
+
+                key = await self.run_in_executor(self.result_key,
+                                                 sources,
+                                                 target_format,
+                                                 infos)
+                if key is not None:
+                    if await self.run_in_executor(self.result_cache.link,
+                                                  key,
+                                                  target_path):
+                        logging.debug('Result cache hit: %s' % (key))
+                        return
+
+                data = await self.render_container_async(sources,
+                                                         target_format,
+                                                         infos,
+                                                         workspace)
+
+                if key is not None:
+                    await self.run_in_executor(self.result_cache.put,
+                                               key,
+                                               data)
+
+                await self.run_in_executor(write_file, target_path, data)
+        finally:
+            self.finish_stats()
+
@@ -0,0 +1,193 @@
+import multiprocessing, os, threading
+
+from .converter import Converter
+
+worker_converter = None
+"""Converter of the current pool worker process.
+"""
+
+worker_skip_existing = False
+"""Whether the current pool worker process skips jobs with verified outputs.
+"""
+
+
+class BatchResult(object):
+    """Outcome of a single job of a batch conversion.
+    """
+
+    def __init__(self,
+                 index,
+                 target_path,
+                 error,
+                 notices,
+                 stats,
+                 skipped = False):
+        """Initializer.
+
+        :param index: Position of the job in the job list.
+        :param target_path: Target path of the job.
+        :param error:
+            Description of the error the job failed with or ``None`` if the
+            conversion succeeded.
+        :param notices: Notices raised during the conversion.
+        :param stats:
+            Stats of the conversion as returned by
+            ``iconmaker.stats.ConversionStats.as_dict``.
+        :param skipped:
+            Whether the job was skipped because its output already exists and
+            passes verification.
+        """
+
+        self.index = index
+        self.target_path = target_path
+        self.error = error
+        self.notices = notices
+        self.stats = stats
+        self.skipped = skipped
+
+    def __repr__(self):
+        return 'BatchResult(%d, %r, error=%r)' % (self.index,
+                                                  self.target_path,
+                                                  self.error)
+
+
+def init_worker(converter_kwargs, skip_existing = False):
+    """Initialize the converter of a pool worker process.
+
+    :param converter_kwargs: Keyword arguments to create the converter with.
+    :param skip_existing: Whether to skip jobs with verified outputs.
+    """
+
+    global worker_converter, worker_skip_existing
+    worker_converter = Converter(**converter_kwargs)
+    worker_skip_existing = skip_existing
+
+
+def is_converted(target_format, target_path):
+    """Check whether the output of a job exists and passes verification.
+
+    :param target_format: Target format of the job.
+    :param target_path: Target path of the job.
+    :returns:
+        ``True`` if the job can be skipped otherwise ``False``.
+    """
+
+    return (os.path.isfile(target_path) and
+            worker_converter.verify_generated_icon(target_format,
+                                                   target_path))
+
+
+def run_job(indexed_job):
+    """Run a single conversion job in a pool worker process.
+
+    :param indexed_job:
+        ``Tuple`` consisting of the position of the job and the job itself.
+    :returns:
+        a :class:`BatchResult`.
+    """
+
+    (index, (image_list, target_format, target_path)) = indexed_job
+
+    # Notices and stats are reported per job.
+    worker_converter.notices = []
+    worker_converter.start_stats()
+    skipped = False
+    try:
+        if worker_skip_existing and is_converted(target_format, target_path):
+            skipped = True
+            worker_converter.finish_stats()
+        else:
+            worker_converter.convert(image_list, target_format, target_path)
+        error = None
+    except Exception as e:
+        error = '%s: %s' % (e.__class__.__name__, str(e))
+
+    return BatchResult(index,
+                       target_path,
+                       error,
+                       worker_converter.notices,
+                       worker_converter.stats.as_dict(),
+                       skipped)
+
+
+def throttle(jobs, slots):
+    """Hold back jobs until a slot is free.
+
+    :param jobs: Iterable of jobs.
+    :param slots: :class:`threading.Semaphore` acquired for every job.
+    :returns:
+        generator of the jobs.
+    """
+
+    for job in jobs:
+        slots.acquire()
+        yield job
+
+
+def convert_many(jobs,
+                 workers = None,
+                 ordered = True,
+                 chunksize = 1,
+                 max_pending = None,
+                 skip_existing = False,
+                 **converter_kwargs):
+    """Convert many image lists on a pool of worker processes.
+
+    Every worker process creates one :class:`Converter` and reuses it for all
+    of its jobs. Failed jobs don't stop the batch; their errors are reported
+    in the results.
+
+    :param jobs:
+        Iterable of ``(image_list, target_format, target_path)`` tuples as
+        accepted by ``Converter.convert``.
+    :param workers:
+        Number of worker processes. Defaults to the number of CPUs.
+    :param ordered:
+        Whether to yield results in job order rather than as they finish.
+    :param chunksize:
+        Number of jobs sent to a worker at a time.
+    :param max_pending:
+        Maximum number of jobs taken from ``jobs`` whose results haven't been
+        yielded yet, which bounds the memory used for long job streams.
+        Must be at least ``chunksize``. Defaults to no limit.
+    :param skip_existing:
+        Whether to skip jobs whose output already exists and passes
+        verification, e.g. to resume an interrupted batch.
+    :param converter_kwargs:
+        Keyword arguments to create each worker's :class:`Converter` with.
+    :returns:
+        generator of :class:`BatchResult` instances.
+    """
+
+    if max_pending is not None and max_pending < chunksize:
+        raise ValueError('max_pending must be at least chunksize')
+
+    indexed_jobs = enumerate(jobs)
+    slots = None
+    if max_pending is not None:
+        slots = threading.Semaphore(max_pending)
+        indexed_jobs = throttle(indexed_jobs, slots)
+
+    pool = multiprocessing.Pool(workers,
+                                init_worker,
+                                (converter_kwargs, skip_existing))
+    try:
+        if ordered:
+            results = pool.imap(run_job, indexed_jobs, chunksize)
+        else:
+            results = pool.imap_unordered(run_job, indexed_jobs, chunksize)
+
+        for result in results:
+            if slots is not None:
+                slots.release()
+            yield result
+
+        pool.close()
+    finally:
+        # Unblock the pool's task feeder so that it can be shut down.
+        if slots is not None:
+            for i in range(max_pending):
+                slots.release()
+
+        pool.terminate()
+        pool.join()
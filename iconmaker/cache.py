@@ -0,0 +1,419 @@
+import os, json, hashlib, shutil, tempfile, threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from .logger import logging
+from .utils import temporary_path, replace_file
+
+LOCK_FILENAME = '.lock'
+"""Name of the lock file serializing writers across processes.
+"""
+
+
+class CachedSource(object):
+    """A fetched source image stored in a :class:`SourceCache`.
+    """
+
+    def __init__(self, data, etag, last_modified):
+        """Initializer.
+
+        :param data: Contents of the image.
+        :param etag: ``ETag`` response header of the image or ``None``.
+        :param last_modified:
+            ``Last-Modified`` response header of the image or ``None``.
+        """
+
+        self.data = data
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def validators(self):
+        """Build the conditional request headers revalidating the image.
+
+        :returns:
+            ``Dictionary`` of request headers.
+        """
+
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+
+        return headers
+
+
+class DiskCache(object):
+    """Size-bounded on-disk cache directory.
+
+    Every entry consists of a ``.data`` file and optional companion files
+    sharing its key. Entries are evicted least recently used first once the
+    total size of the data files exceeds ``max_bytes``; the modification time
+    of the ``USAGE_EXTENSION`` file records the last use.
+
+    The directory may be shared by several processes. Writers hold an
+    exclusive lock on a lock file in the directory where the platform
+    supports it, and the total size is determined from the directory itself
+    before evicting, so that it accounts for every process' entries.
+    """
+
+    EXTENSIONS = ['data']
+    """Extensions of the files making up an entry.
+    """
+
+    USAGE_EXTENSION = 'data'
+    """Extension of the file whose modification time records the last use.
+    """
+
+    DATA_MODE = None
+    """Permissions of the data files or ``None`` for the default ones.
+    """
+
+    def __init__(self, directory, max_bytes):
+        """Initializer.
+
+        :param directory: Directory to store the cache in.
+        :param max_bytes: Maximum total size of the data files.
+        """
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+    @property
+    def total_bytes(self):
+        """Total size of the data files in the cache directory.
+        """
+
+        return sum(size for (mtime, size, key) in self.entries())
+
+    @contextmanager
+    def locked(self):
+        """Hold the lock of the cache directory, shared by all threads and
+            processes using it.
+
+        :returns:
+            a context manager holding the lock.
+        """
+
+        with self.lock:
+            if fcntl is None:
+                yield
+                return
+
+            with open(os.path.join(self.directory, LOCK_FILENAME), 'a') as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def path(self, key, extension = 'data'):
+        """Determine the path of a cache file.
+
+        :param key: Cache key.
+        :param extension: Extension of the file.
+        :returns:
+            the path of the file.
+        """
+
+        return os.path.join(self.directory, '%s.%s' % (key, extension))
+
+    def entries(self):
+        """List the entries of the cache.
+
+        :returns:
+            ``List`` of ``(mtime, size, key)`` tuples.
+        """
+
+        entries = []
+        for filename in os.listdir(self.directory):
+            (key, extension) = os.path.splitext(filename)
+            if extension != '.data':
+                continue
+
+            try:
+                stat = os.stat(os.path.join(self.directory, filename))
+            except OSError:
+                continue
+
+            mtime = stat.st_mtime
+            if self.USAGE_EXTENSION != 'data':
+                try:
+                    mtime = os.path.getmtime(self.path(key,
+                                                       self.USAGE_EXTENSION))
+                except OSError:
+                    pass
+
+            entries.append((mtime, stat.st_size, key))
+
+        return entries
+
+    def touch_key(self, key):
+        """Mark an entry as recently used.
+
+        :param key: Cache key.
+        """
+
+        try:
+            os.utime(self.path(key, self.USAGE_EXTENSION), None)
+        except OSError:
+            pass
+
+    def store(self, key, files):
+        """Store an entry, replacing any previous entry with the same key.
+
+        :param key: Cache key.
+        :param files:
+            List of ``(extension, contents)`` tuples. The ``data`` file must
+            come last.
+        """
+
+        size = len(dict(files)['data'])
+        if size > self.max_bytes:
+            return
+
+        with self.locked():
+            # Write to temporary files first so that readers never see a
+            # partially written file.
+            for (extension, contents) in files:
+                (fd, temp_path) = tempfile.mkstemp(dir = self.directory,
+                                                   suffix = '.tmp')
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(contents)
+                if extension == 'data' and self.DATA_MODE is not None:
+                    os.chmod(temp_path, self.DATA_MODE)
+                replace_file(temp_path, self.path(key, extension))
+
+            self.evict()
+
+    def remove(self, key):
+        """Remove an entry from the cache.
+
+        :param key: Cache key.
+        :returns:
+            the size of the removed data file.
+        """
+
+        size = 0
+        for extension in self.EXTENSIONS:
+            path = self.path(key, extension)
+            try:
+                if extension == 'data':
+                    size = os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                pass
+
+        return size
+
+    def evict(self):
+        """Evict least recently used entries until the cache fits its budget.
+
+        The entries are listed from the directory, so entries stored by other
+        processes count as well. Must be called with the lock of ``locked``
+        held.
+        """
+
+        entries = self.entries()
+        total_bytes = sum(size for (mtime, size, key) in entries)
+
+        for (mtime, size, key) in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+
+            logging.debug('Evicting cache entry: %s' % (key))
+            self.remove(key)
+            total_bytes -= size
+
+
+class SourceCache(DiskCache):
+    """On-disk cache of fetched source images keyed by URL.
+
+    Every entry consists of a ``.data`` file with the image contents and a
+    ``.meta`` file with its URL, validators and the digest of the contents,
+    which pairs the two files up when they are replaced concurrently.
+    """
+
+    EXTENSIONS = ['data', 'meta']
+
+    def key(self, url):
+        """Determine the cache key of a URL.
+
+        :param url: URL of the image.
+        :returns:
+            the cache key.
+        """
+
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def get(self, url):
+        """Look up a cached image.
+
+        :param url: URL of the image.
+        :returns:
+            a :class:`CachedSource` or ``None`` if the image isn't cached.
+        """
+
+        key = self.key(url)
+        try:
+            with open(self.path(key, 'meta'), 'r') as f:
+                meta = json.load(f)
+            with open(self.path(key), 'rb') as f:
+                data = f.read()
+        except (IOError, OSError, ValueError):
+            return None
+
+        # The files may belong to different versions of the entry.
+        if (meta.get('url') != url or
+            meta.get('sha1') != hashlib.sha1(data).hexdigest()):
+            return None
+
+        return CachedSource(data, meta.get('etag'), meta.get('last_modified'))
+
+    def touch(self, url):
+        """Mark a cached image as recently used.
+
+        :param url: URL of the image.
+        """
+
+        self.touch_key(self.key(url))
+
+    def put(self, url, data, etag, last_modified):
+        """Store an image in the cache.
+
+        Images without validators cannot be revalidated and are not stored.
+
+        :param url: URL of the image.
+        :param data: Contents of the image.
+        :param etag: ``ETag`` response header of the image or ``None``.
+        :param last_modified:
+            ``Last-Modified`` response header of the image or ``None``.
+        """
+
+        if not etag and not last_modified:
+            return
+
+        meta = {
+            'url': url,
+            'etag': etag,
+            'last_modified': last_modified,
+            'sha1': hashlib.sha1(data).hexdigest(),
+        }
+        self.store(self.key(url),
+                   [('meta', json.dumps(meta).encode('utf-8')),
+                    ('data', data)])
+
+
+class ResultCache(DiskCache):
+    """On-disk cache of finished containers keyed by ``Converter.result_key``.
+
+    Every entry consists of a read-only ``.data`` file with the container,
+    which is hard-linked to the targets, and an empty ``.used`` file whose
+    modification time records the last use, so that marking an entry as
+    used doesn't touch the linked targets.
+    """
+
+    EXTENSIONS = ['data', 'used']
+
+    USAGE_EXTENSION = 'used'
+
+    DATA_MODE = 0o444
+
+    def __init__(self, directory, max_bytes):
+        """Initializer.
+
+        :param directory: Directory to store the cache in.
+        :param max_bytes: Maximum total size of the cached containers.
+        """
+
+        super(ResultCache, self).__init__(directory, max_bytes)
+        self.hits = 0
+        self.misses = 0
+
+    def count(self, hit):
+        """Update the hit and miss counters.
+
+        :param hit: Whether the lookup was a hit.
+        """
+
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key):
+        """Look up a cached container.
+
+        :param key: Cache key.
+        :returns:
+            the container data or ``None`` if it isn't cached.
+        """
+
+        try:
+            with open(self.path(key), 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            self.count(False)
+            return None
+
+        self.count(True)
+        self.touch_key(key)
+        return data
+
+    def link(self, key, target_path):
+        """Hard-link a cached container to a target path.
+
+        The container is linked to a temporary path next to the target, which
+        then replaces the target, so an existing target is kept if linking
+        fails. Falls back to copying where hard links are not possible, e.g.
+        across devices. A linked target shares its contents with the cache
+        entry and is read-only; ``utils.write_file`` replaces it rather than
+        writing to it.
+
+        :param key: Cache key.
+        :param target_path: Path to place the container at.
+        :returns:
+            ``True`` if the container was cached otherwise ``False``.
+        """
+
+        path = self.path(key)
+        if not os.path.isfile(path):
+            self.count(False)
+            return False
+
+        temp_path = temporary_path(target_path)
+        try:
+            try:
+                os.link(path, temp_path)
+            except OSError:
+                shutil.copyfile(path, temp_path)
+            replace_file(temp_path, target_path)
+        except (IOError, OSError):
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            self.count(False)
+            return False
+
+        self.count(True)
+        self.touch_key(key)
+        return True
+
+    def put(self, key, data):
+        """Store a container in the cache.
+
+        :param key: Cache key.
+        :param data: Container data.
+        """
+
+        self.store(key, [('used', b''), ('data', data)])
@@ -0,0 +1,204 @@
+"""Convert the jobs of a JSONL manifest.
+
+Every line of the manifest is a JSON object describing one job::
+
+    {"sources": ["16.png", "http://example.com/32.png"], "format": "ico",
+     "output": "icons/example.ico"}
+
+One JSON result line is written per job, in manifest order unless
+``--unordered`` is given; lines that aren't valid jobs get an error result
+line in their place::
+
+    $ iconmaker --workers 8 --resume jobs.jsonl > results.jsonl
+"""
+
+import argparse, json, multiprocessing, sys
+from collections import deque
+
+from .batch import convert_many
+from .converter import Converter
+from .compression import POLICIES
+
+BATCH_PENDING_PER_WORKER = 16
+"""Jobs read ahead of the results per worker process.
+"""
+
+STATUS_OK = 'ok'
+STATUS_SKIPPED = 'skipped'
+STATUS_ERROR = 'error'
+
+
+def parse_job(line):
+    """Parse a manifest line.
+
+    :param line: Line of the manifest.
+    :returns:
+        ``(image_list, target_format, target_path)`` tuple as accepted by
+        ``Converter.convert``.
+    :raises ValueError: if the line isn't a valid job.
+    """
+
+    job = json.loads(line)
+    if not isinstance(job, dict):
+        raise ValueError('job must be a JSON object')
+
+    for key in ('sources', 'format', 'output'):
+        if key not in job:
+            raise ValueError('job lacks %r' % (key))
+
+    if not isinstance(job['sources'], list) or not job['sources']:
+        raise ValueError('sources must be a non-empty list')
+
+    return (job['sources'], job['format'], job['output'])
+
+
+def read_manifest(lines,
+                  line_numbers,
+                  rejected):
+    """Parse the jobs of a manifest as they are needed.
+
+    Lines that aren't valid jobs are recorded in ``rejected`` rather than
+    stopping the batch.
+
+    :param lines: Iterable of manifest lines.
+    :param line_numbers:
+        ``Dictionary`` to record the line number of every job in, keyed by
+        the position of the job.
+    :param rejected:
+        ``collections.deque`` to append result lines of invalid jobs to.
+    :returns:
+        generator of jobs.
+    """
+
+    index = 0
+    for (line_number, line) in enumerate(lines, 1):
+        if not line.strip():
+            continue
+
+        try:
+            job = parse_job(line)
+        except ValueError as e:
+            rejected.append({
+                'line': line_number,
+                'status': STATUS_ERROR,
+                'error': 'Invalid job: %s' % (str(e)),
+            })
+            continue
+
+        line_numbers[index] = line_number
+        index += 1
+        yield job
+
+
+def format_result(line_number, result):
+    """Describe the outcome of a job.
+
+    :param line_number: Manifest line of the job.
+    :param result: :class:`iconmaker.batch.BatchResult` of the job.
+    :returns:
+        ``Dictionary`` to write as the result line.
+    """
+
+    if result.error:
+        status = STATUS_ERROR
+    elif result.skipped:
+        status = STATUS_SKIPPED
+    else:
+        status = STATUS_OK
+
+    return {
+        'line': line_number,
+        'output': result.target_path,
+        'status': status,
+        'error': result.error,
+        'notices': result.notices,
+        'stats': result.stats,
+    }
+
+
+def main(argv = None,
+         stdin = None,
+         stdout = None):
+    """Run the jobs of a manifest.
+
+    :param argv: Command line arguments.
+    :param stdin: Stream to read the manifest from if none is named.
+    :param stdout: Stream to write the result lines to.
+    :returns:
+        exit status, ``1`` if any job failed otherwise ``0``.
+    """
+
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[0])
+    parser.add_argument('manifest', nargs = '?', default = '-',
+                        help = 'JSONL manifest to read (default: standard '
+                        'input)')
+    parser.add_argument('--workers', type = int, default = None,
+                        help = 'worker processes (default: number of CPUs)')
+    parser.add_argument('--resume', action = 'store_true',
+                        help = 'skip jobs whose output exists and passes '
+                        'verification')
+    parser.add_argument('--unordered', action = 'store_true',
+                        help = 'write results as jobs finish rather than in '
+                        'manifest order')
+    parser.add_argument('--backend', choices = Converter.SUPPORTED_BACKENDS,
+                        default = Converter.SUPPORTED_BACKENDS[0],
+                        help = 'image resizing backend')
+    parser.add_argument('--compression', choices = sorted(POLICIES),
+                        help = 'compression policy of the PNG entries '
+                        '(default: keep 32 bit PNG sources as is)')
+    parser.add_argument('--retina', action = 'store_true',
+                        help = 'also store ICNS entries under their @2x '
+                        'OSTypes')
+    args = parser.parse_args(argv)
+
+    stdout = stdout or sys.stdout
+    if args.manifest == '-':
+        manifest = stdin or sys.stdin
+    else:
+        manifest = open(args.manifest)
+
+    workers = args.workers or multiprocessing.cpu_count()
+    max_pending = BATCH_PENDING_PER_WORKER * workers
+    line_numbers = {}
+    rejected = deque()
+
+    def write(document):
+        stdout.write(json.dumps(document, sort_keys = True) + '\n')
+        stdout.flush()
+
+    failed = False
+    try:
+        jobs = read_manifest(manifest, line_numbers, rejected)
+        results = convert_many(jobs,
+                               workers,
+                               ordered = not args.unordered,
+                               max_pending = max_pending,
+                               skip_existing = args.resume,
+                               backend = args.backend,
+                               compression = args.compression,
+                               retina = args.retina)
+        for result in results:
+            line_number = line_numbers.pop(result.index)
+
+            # Every line before the job has been read by now, so the invalid
+            # jobs preceding it are all known.
+            while rejected and (args.unordered or
+                                rejected[0]['line'] < line_number):
+                failed = True
+                write(rejected.popleft())
+
+            failed = failed or bool(result.error)
+            write(format_result(line_number, result))
+
+        while rejected:
+            failed = True
+            write(rejected.popleft())
+    finally:
+        if manifest is not stdin and manifest is not sys.stdin:
+            manifest.close()
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
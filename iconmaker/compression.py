@@ -0,0 +1,285 @@
+from array import array
+from io import BytesIO
+from multiprocessing.pool import ThreadPool
+
+from PIL import Image
+
+from .imaging import encode_png, open_image
+from .utils import is_png32, read_png_header
+
+COMPRESSION_FAST = 'fast'
+COMPRESSION_BALANCED = 'balanced'
+COMPRESSION_SMALLEST = 'smallest'
+COMPRESSION_WORKERS = 4
+
+ZLIB_DEFAULT_STRATEGY = -1
+ZLIB_FILTERED = 1
+ZLIB_RLE = 3
+
+
+class CompressionPolicy(object):
+    """Settings PNG container entries are encoded with.
+    """
+
+    __slots__ = ('name', 'level', 'strategies', 'recompress', 'palette')
+
+    def __init__(self,
+                 name,
+                 level,
+                 strategies = (ZLIB_DEFAULT_STRATEGY, ),
+                 recompress = False,
+                 palette = False):
+        """Initializer.
+
+        :param name: Name of the policy.
+        :param level: zlib compression level.
+        :param strategies:
+            zlib strategies to encode with. The smallest result is kept.
+        :param recompress:
+            Whether to also re-encode entries which already are 32 bit PNG
+            files. They are kept as is if the result isn't smaller.
+        :param palette:
+            Whether to try storing images of at most 256 colors as palette
+            images, where the container allows it.
+        """
+
+        self.name = name
+        self.level = level
+        self.strategies = strategies
+        self.recompress = recompress
+        self.palette = palette
+
+    def __repr__(self):
+        return 'CompressionPolicy(%r)' % (self.name)
+
+
+POLICIES = {
+    COMPRESSION_FAST: CompressionPolicy(COMPRESSION_FAST, 1),
+    COMPRESSION_BALANCED: CompressionPolicy(COMPRESSION_BALANCED, 6),
+    COMPRESSION_SMALLEST: CompressionPolicy(COMPRESSION_SMALLEST,
+                                            9,
+                                            (ZLIB_DEFAULT_STRATEGY,
+                                             ZLIB_FILTERED,
+                                             ZLIB_RLE),
+                                            recompress = True,
+                                            palette = True),
+}
+"""Compression policies by name.
+"""
+
+
+class EntryCompression(object):
+    """Outcome of compressing a single container entry.
+    """
+
+    __slots__ = ('width', 'height', 'bytes_before', 'bytes_after')
+
+    def __init__(self, width, height, bytes_before, bytes_after):
+        """Initializer.
+
+        :param width: Width of the entry.
+        :param height: Height of the entry.
+        :param bytes_before:
+            Size of the source PNG file, or of the entry encoded with the
+            default settings if it wasn't a PNG file.
+        :param bytes_after: Size of the encoded entry.
+        """
+
+        self.width = width
+        self.height = height
+        self.bytes_before = bytes_before
+        self.bytes_after = bytes_after
+
+    @property
+    def bytes_saved(self):
+        """Number of bytes saved by the compression.
+        """
+
+        return self.bytes_before - self.bytes_after
+
+    def as_dict(self):
+        """Convert the outcome to a dictionary.
+
+        :returns:
+            ``Dictionary`` of the size, byte counts and bytes saved.
+        """
+
+        return {
+            'width': self.width,
+            'height': self.height,
+            'bytes_before': self.bytes_before,
+            'bytes_after': self.bytes_after,
+            'bytes_saved': self.bytes_saved,
+        }
+
+
+def get_policy(policy):
+    """Look up a compression policy.
+
+    :param policy: Name of a policy or a :class:`CompressionPolicy`.
+    :returns:
+        the :class:`CompressionPolicy`.
+    :raises ValueError: if there is no policy of that name.
+    """
+
+    if isinstance(policy, CompressionPolicy):
+        return policy
+
+    try:
+        return POLICIES[policy]
+    except KeyError:
+        raise ValueError('invalid compression policy: %s' % (policy))
+
+
+def save_png(image, level, strategy, **params):
+    """Encode an image as PNG with the given zlib settings.
+
+    :param image: :class:`PIL.Image.Image` to encode.
+    :param level: zlib compression level.
+    :param strategy: zlib strategy.
+    :param params: Additional PNG encoder parameters.
+    :returns:
+        the encoded PNG data.
+    """
+
+    output = BytesIO()
+    image.save(output,
+               'PNG',
+               compress_level = level,
+               compress_type = strategy,
+               **params)
+    return output.getvalue()
+
+
+def reduce_palette(image):
+    """Convert an RGBA image of at most 256 colors to a palette image
+        without any loss.
+
+    Colors with transparency are placed first, so that the ``tRNS`` chunk is
+    as short as possible.
+
+    :param image: RGBA :class:`PIL.Image.Image` to convert.
+    :returns:
+        ``Tuple`` consisting of the palette :class:`PIL.Image.Image` and the
+        PNG encoder parameters carrying its transparency, or ``None`` if the
+        image has more than 256 colors.
+    """
+
+    colors = image.getcolors(256)
+    if colors is None:
+        return None
+
+    colors = sorted((color for (count, color) in colors),
+                    key = lambda color: (color[3] == 255, color))
+
+    # Pixels are mapped to palette indices as native 32 bit integers.
+    keys = array('I', bytes(bytearray(channel
+                                      for color in colors
+                                      for channel in color)))
+    indices = dict((key, index) for (index, key) in enumerate(keys))
+    pixels = array('I', image.tobytes())
+    data = bytes(bytearray(map(indices.__getitem__, pixels)))
+
+    palette_image = Image.frombytes('P', image.size, data)
+    palette_image.putpalette([channel
+                              for color in colors
+                              for channel in color[:3]])
+
+    params = {}
+    alphas = bytes(bytearray(color[3] for color in colors
+                             if color[3] != 255))
+    if alphas:
+        params['transparency'] = alphas
+
+    return (palette_image, params)
+
+
+def compress_entry(source,
+                   policy,
+                   palette = False):
+    """Encode a container entry as PNG under a compression policy.
+
+    :param source:
+        Either a :class:`PIL.Image.Image` or the contents of a PNG file.
+    :param policy: :class:`CompressionPolicy` to apply.
+    :param palette:
+        Whether the container allows palette PNG entries.
+    :returns:
+        ``Tuple`` consisting of the encoded entry and its
+        :class:`EntryCompression`.
+    """
+
+    original = None
+    bytes_before = None
+    if isinstance(source, bytes):
+        if read_png_header(source) is not None:
+            bytes_before = len(source)
+        if is_png32(source):
+            original = source
+            (width, height) = read_png_header(source)[:2]
+            if not policy.recompress:
+                return (source, EntryCompression(width,
+                                                  height,
+                                                  len(source),
+                                                  len(source)))
+        source = open_image(source)
+
+    if source.mode != 'RGBA':
+        source = source.convert('RGBA')
+    (width, height) = source.size
+
+    candidates = [(source, {})]
+    if palette and policy.palette:
+        reduced = reduce_palette(source)
+        if reduced is not None:
+            candidates.append(reduced)
+
+    encoded = [save_png(image, policy.level, strategy, **params)
+               for (image, params) in candidates
+               for strategy in policy.strategies]
+    if original is not None:
+        encoded.append(original)
+
+    data = min(encoded, key = len)
+
+    # Savings are measured against the encoding the container would use
+    # without a policy.
+    if bytes_before is None:
+        bytes_before = len(encode_png(source))
+
+    return (data, EntryCompression(width, height, bytes_before, len(data)))
+
+
+def compress_entries(sources,
+                     policy,
+                     palette = False,
+                     workers = COMPRESSION_WORKERS):
+    """Encode container entries as PNG under a compression policy in
+        parallel threads.
+
+    :param sources:
+        List of :class:`PIL.Image.Image` instances or 32 bit PNG file
+        contents.
+    :param policy: Name of a policy or a :class:`CompressionPolicy`.
+    :param palette:
+        Whether the container allows palette PNG entries.
+    :param workers: Maximum number of entries encoded concurrently.
+    :returns:
+        ``List`` of ``(data, compression)`` tuples in the order of
+        ``sources``, where ``compression`` is an :class:`EntryCompression`.
+    """
+
+    policy = get_policy(policy)
+
+    def compress(source):
+        return compress_entry(source, policy, palette)
+
+    workers = min(workers, len(sources))
+    if workers <= 1:
+        return [compress(source) for source in sources]
+
+    pool = ThreadPool(workers)
+    try:
+        return pool.map(compress, sources)
+    finally:
+        pool.terminate()
@@ -1,14 +1,21 @@
-import subprocess, os, tempfile, requests, struct
-
-try:
-    from cStringIO import StringIO
-except:
-    from StringIO import StringIO
-
-from utils import check_and_get_image_sizes, which, image_mode_to_bit_depth
-from logger import logging
-from exceptions import ConversionError, ImageError
-from PIL import Image
+import subprocess, requests, hashlib
+from multiprocessing.pool import ThreadPool
+
+from .utils import run_command, create_session, read_file, write_file, \
+    read_png_header
+from .logger import logging
+from .exceptions import ConversionError, ImageError
+from .ico import build_ico
+from .icns import build_icns, OSTYPES_BY_SIZE, LEGACY_MASK_OSTYPES
+from .probe import probe_image, sniff_format, SNIFF_BYTES
+from .inspector import inspect_container, inspect_buffer, sniff_container
+from .reader import ContainerReader
+from .tools import registry, TOOL_CONVERT
+from .workspace import Workspace
+from .compression import compress_entries, get_policy, COMPRESSION_WORKERS
+from .stats import StatsScope, STAGE_FETCH, STAGE_PROBE, STAGE_PROMOTE, \
+    STAGE_RESIZE, STAGE_ASSEMBLE, STAGE_VERIFY, STAGE_COMPRESS
+from . import imaging
 
 FORMAT_PNG = 'png'
 FORMAT_GIF = 'gif'
@@ -16,7 +23,17 @@ FORMAT_ICO = 'ico'
 FORMAT_ICNS = 'icns'
 FORMAT_JPG = 'jpg'
 FORMAT_JPG2 = 'jpeg'
-SUPPORTED_SIZES_ICNS = [16, 32, 48, 128, 256, 512, 1024]
+SUPPORTED_SIZES_ICNS = [16, 32, 48, 64, 128, 256, 512, 1024]
+STANDARD_SIZES_ICO = [16, 24, 32, 48, 64, 128, 256]
+BACKEND_PILLOW = 'pillow'
+BACKEND_IMAGEMAGICK = 'imagemagick'
+CAPABILITY_IN_PROCESS = 'in-process'
+CAPABILITY_EXTERNAL = 'external'
+FETCH_WORKERS = 8
+FETCH_TIMEOUT = 10
+FETCH_MAX_BYTES = 10 * 1024 * 1024
+FETCH_CHUNK_SIZE = 64 * 1024
+PNG32_MODES = ('RGB', 'RGBA')
 
 
 def is_size_convertible_to_icon(size_width, 
@@ -53,6 +70,49 @@ def is_size_convertible_to_icon(size_width,
     return True
 
 
+def is_url(image_location):
+    """Check whether an image location is a remote URL rather than a path.
+
+    :param image_location: Local path or URL of an image.
+    :returns:
+        ``True`` if the location is an http or https URL otherwise ``False``.
+    """
+
+    return (image_location.startswith("http:") or
+            image_location.startswith("https:"))
+
+
+def sniff_source(data):
+    """Identify the format of a source image from its magic bytes.
+
+    :param data: The first ``SNIFF_BYTES`` or more bytes of the image file.
+    :returns:
+        the format of the image, e.g. ``FORMAT_PNG`` or ``FORMAT_ICO``, or
+        ``None`` if it isn't recognized.
+    """
+
+    return sniff_container(data) or sniff_format(data)
+
+
+def unique_urls(image_list):
+    """Determine the remote URLs of a list of image locations.
+
+    :param image_list: List of image files (either local paths or URLs).
+    :returns:
+        List of the distinct URLs in ``image_list`` in order of their first
+        occurrence.
+    """
+
+    urls = []
+    seen = set()
+    for image_location in image_list:
+        if is_url(image_location) and not image_location in seen:
+            seen.add(image_location)
+            urls.append(image_location)
+
+    return urls
+
+
 class Converter(object):
     """Convert a set of PNG/GIF icons to either ICO or ICNS format.
     """
@@ -60,7 +120,9 @@ class Converter(object):
     SUPPORTED_SOURCE_FORMATS = [FORMAT_JPG,
                                 FORMAT_JPG2,
                                 FORMAT_GIF,
-                                FORMAT_PNG]
+                                FORMAT_PNG,
+                                FORMAT_ICO,
+                                FORMAT_ICNS]
     """Support source image formats.
     """
 
@@ -69,196 +131,674 @@ class Converter(object):
     """Supported target icon container formats.
     """
 
-    PNG2ICNS = '/usr/local/bin/png2icns'
-    ICNS2PNG = '/usr/local/bin/icns2png'
-    CONVERTTOOL = '/opt/local/bin/convert'
-    """Cache image manipulation binary locations.
+    SUPPORTED_BACKENDS = [BACKEND_PILLOW,
+                          BACKEND_IMAGEMAGICK]
+    """Supported image resizing backends.
     """
 
-    def __init__(self):
+    def __init__(self,
+                 backend = BACKEND_PILLOW,
+                 session = None,
+                 fetch_workers = FETCH_WORKERS,
+                 fetch_timeout = FETCH_TIMEOUT,
+                 fetch_max_bytes = FETCH_MAX_BYTES,
+                 source_cache = None,
+                 result_cache = None,
+                 tool_paths = None,
+                 scratch = None,
+                 generate_sizes = None,
+                 stats_hook = None,
+                 compression = None,
+                 compression_workers = COMPRESSION_WORKERS,
+                 retina = False):
         """Initializer.
+
+        :param backend:
+            Image resizing backend. Must be one of ``BACKEND_PILLOW`` and
+            ``BACKEND_IMAGEMAGICK``.
+        :param session:
+            :class:`requests.Session` to fetch remote images with. Defaults to
+            a new session with a connection pool of ``fetch_workers``
+            keep-alive connections per host.
+        :param fetch_workers:
+            Maximum number of remote images fetched concurrently.
+        :param fetch_timeout:
+            Connect and read timeout in seconds for each remote image.
+        :param fetch_max_bytes:
+            Maximum size of a remote image. Larger images are rejected while
+            they are being downloaded.
+        :param source_cache:
+            Optional :class:`iconmaker.cache.SourceCache` to keep fetched
+            images in and revalidate them against.
+        :param result_cache:
+            Optional :class:`iconmaker.cache.ResultCache` to memoize finished
+            containers in. Cached containers are hard-linked to the target
+            path where possible and are read-only there.
+        :param tool_paths:
+            Optional dictionary of tool names (``TOOL_CONVERT``) and the
+            paths to run them from. Tools without
+            a configured path are looked up through
+            :data:`iconmaker.tools.registry` on first use.
+        :param scratch:
+            Location of the intermediate files handed to external tools, as
+            accepted by :class:`iconmaker.workspace.Workspace`.
+        :param generate_sizes:
+            Sizes to generate from the largest source image when no source of
+            that size is given, or ``True`` for all ICNS sizes and the
+            standard ICO sizes respectively. Sizes are never scaled up.
+        :param stats_hook:
+            Optional callable invoked with the
+            :class:`iconmaker.stats.ConversionStats` of every conversion once
+            it finishes or fails.
+        :param compression:
+            Optional compression policy to encode the PNG entries of
+            containers with: ``COMPRESSION_FAST``, ``COMPRESSION_BALANCED``,
+            ``COMPRESSION_SMALLEST`` or a
+            :class:`iconmaker.compression.CompressionPolicy`. By default 32
+            bit PNG sources are embedded as is and other entries are encoded
+            with Pillow's defaults.
+        :param compression_workers:
+            Maximum number of entries compressed concurrently.
+        :param retina:
+            Whether ICNS containers store every entry under the high
+            resolution (@2x) OSTypes of its pixel size as well, e.g. 32 pixel
+            images as both ``icp5`` and 16@2x ``ic11``. Each pixel size is
+            encoded once.
         """
 
-        self.png2icns = ''
-        self.icns2png = ''
-        self.converttool = ''
+        if backend not in Converter.SUPPORTED_BACKENDS:
+            raise ValueError('invalid backend identifier: %s' % (backend))
+
+        if fetch_workers < 1:
+            raise ValueError('fetch_workers must be at least 1')
+
+        self.backend = backend
+        self.session = session or create_session(fetch_workers)
+        self.fetch_workers = fetch_workers
+        self.fetch_timeout = fetch_timeout
+        self.fetch_max_bytes = fetch_max_bytes
+        self.source_cache = source_cache
+        self.result_cache = result_cache
+        self.tool_paths = dict(tool_paths or {})
+        self.scratch = scratch
+        self.generate_sizes = generate_sizes
+        self.stats_hook = stats_hook
+        self.compression = (get_policy(compression)
+                            if compression is not None else None)
+        self.compression_workers = compression_workers
+        self.retina = retina
         self.notices = []
+        self.stats_scope = StatsScope()
 
-        # check and/or find the correct file locations
-        if not (os.path.isfile(Converter.PNG2ICNS)
-            or os.access(Converter.PNG2ICNS, os.X_OK)):
-            self.png2icns = which(os.path.basename(Converter.PNG2ICNS))
-            if not self.png2icns:
-                raise Exception("Unable to locate png2icns binary: %s" %
-                    Converter.PNG2ICNS)
-        else:
-            self.png2icns = Converter.PNG2ICNS
-
-        if not (os.path.isfile(Converter.ICNS2PNG)
-            or os.access(Converter.ICNS2PNG, os.X_OK)):
-            self.icns2png = which(os.path.basename(Converter.ICNS2PNG))
-            if not self.icns2png:
-                raise Exception("Unable to locate icns2png binary: %s" %
-                    Converter.ICNS2PNG)
-        else:
-            self.icns2png = Converter.ICNS2PNG
-
-        if not (os.path.isfile(Converter.CONVERTTOOL)
-            or os.access(Converter.CONVERTTOOL, os.X_OK)):
-            self.converttool = which(os.path.basename(Converter.CONVERTTOOL))
-            if not self.converttool:
-                raise Exception("Unable to locate image conversion tool: %s" %
-                    Converter.CONVERTTOOL)
-        else:
-            self.converttool = Converter.CONVERTTOOL
+    @property
+    def stats(self):
+        """Stats of the conversion running in the current thread or asyncio
+        task, as a :class:`iconmaker.stats.ConversionStats`.
+        """
+
+        return self.stats_scope.get()
+
+    @property
+    def converttool(self):
+        """Path of ImageMagick's ``convert``.
+
+        :raises ConversionError: if ``convert`` cannot be found.
+        """
+
+        return registry.require(TOOL_CONVERT,
+                                self.tool_paths.get(TOOL_CONVERT))
+
+    def capabilities(self):
+        """Report how each part of the conversion is carried out.
+
+        Looking up the external tools is cached process-wide, so this is cheap
+        after the first call.
+
+        :returns:
+            ``Dictionary`` of the target formats and backends, and either
+            ``CAPABILITY_IN_PROCESS``, ``CAPABILITY_EXTERNAL`` or ``None`` if
+            the external tool they need is missing.
+        """
+
+        convert = registry.find(TOOL_CONVERT,
+                                self.tool_paths.get(TOOL_CONVERT))
+
+        return {
+            FORMAT_ICO: CAPABILITY_IN_PROCESS,
+            FORMAT_ICNS: CAPABILITY_IN_PROCESS,
+            BACKEND_PILLOW: CAPABILITY_IN_PROCESS,
+            BACKEND_IMAGEMAGICK: CAPABILITY_EXTERNAL if convert else None,
+        }
 
     def fetch_image(self, url):
-        """Fetch the requested image and save it in a temporary file.
+        """Fetch the requested image.
 
         :params input: URL of the image to fetch.
         :returns:
-            Path of the fetched image.
+            Contents of the fetched image.
         """
 
+        # Revalidate the cached image if there is one.
+        cached = None
+        headers = {}
+        if self.source_cache is not None:
+            cached = self.source_cache.get(url)
+            if cached is not None:
+                headers = cached.validators()
+
         # Get the image.
-        response = requests.get(url)
-        response.raise_for_status(allow_redirects = False)
+        response = self.session.get(url,
+                                    headers = headers,
+                                    timeout = self.fetch_timeout,
+                                    stream = True)
+        try:
+            if cached is not None and response.status_code == 304:
+                logging.debug('Cached image is still valid: %s' % (url))
+                self.source_cache.touch(url)
+                return cached.data
+
+            response.raise_for_status()
 
-        # Save the image.
+            data = self.read_response(url, response)
+        finally:
+            response.close()
+
+        # Validate the image.
+        self.check_source_format(data)
         try:
-            im = Image.open(StringIO(response.content))
-        except IOError as e:
-            raise ImageError('Error opening image: %s %s' % (url, str(e)))
+            if sniff_container(data) is not None:
+                inspect_buffer(data)
+            else:
+                probe_image(data)
+        except ImageError as e:
+            raise ImageError('%s %s' % (str(e), url))
+
+        logging.debug('Fetched image: %s' % (url))
+
+        if self.source_cache is not None:
+            self.source_cache.put(url,
+                                  data,
+                                  response.headers.get('ETag'),
+                                  response.headers.get('Last-Modified'))
+
+        return data
+
+    def read_response(self,
+                      url,
+                      response):
+        """Download the body of a streamed image response.
+
+        The download is aborted as soon as the first bytes show that the body
+        isn't an image or container of a supported format, or once it grows
+        larger than ``fetch_max_bytes``. The body is returned as is.
+
+        :param url: URL of the image.
+        :param response: Streamed :class:`requests.Response` of the image.
+        :returns:
+            Contents of the image.
+        :raises ImageError: if the body is too large or not a supported image.
+        """
+
+        length = response.headers.get('Content-Length')
+        if length and length.isdigit() and int(length) > self.fetch_max_bytes:
+            raise ImageError('The source file exceeds %d bytes: %s' % (
+                self.fetch_max_bytes, url))
+
+        chunks = []
+        size = 0
+        sniffed = False
+        for chunk in response.iter_content(FETCH_CHUNK_SIZE):
+            chunks.append(chunk)
+            size += len(chunk)
+
+            if size > self.fetch_max_bytes:
+                raise ImageError('The source file exceeds %d bytes: %s' % (
+                    self.fetch_max_bytes, url))
+
+            # Reject anything but images once the magic bytes are in.
+            if not sniffed and size >= SNIFF_BYTES:
+                chunks = [b''.join(chunks)]
+                self.check_source_format(chunks[0])
+                sniffed = True
+
+        return b''.join(chunks)
 
-        image_format = im.format.lower()
-        if image_format not in Converter.SUPPORTED_SOURCE_FORMATS:
-            raise ImageError('The source file is not of a supported format.'
+    def check_source_format(self, data):
+        """Reject images which aren't of a supported source format.
+
+        :param data: The first ``SNIFF_BYTES`` or more bytes of the image file.
+        :raises ImageError: if the image isn't of a supported format.
+        """
+
+        if sniff_source(data) not in Converter.SUPPORTED_SOURCE_FORMATS:
+            raise ImageError('The source file is not of a supported format. '
                 'Supported formats are: %s' % (
                 ', '.join(Converter.SUPPORTED_SOURCE_FORMATS)))
 
-        # generate temp filename for it
-        saved_file = tempfile.NamedTemporaryFile(
-                        prefix='downloaded_',
-                        suffix='.' + image_format,
-                        delete=False)
-        saved_filename = saved_file.name
+    def try_fetch_image(self,
+                        url,
+                        stats = None):
+        """Fetch the requested image, capturing failures.
 
-        logging.debug('Fetching image to: %s' % (saved_filename))
+        :params url: URL of the image to fetch.
+        :param stats:
+            :class:`iconmaker.stats.ConversionStats` to record the fetch in.
+            Defaults to ``stats``.
+        :returns:
+            ``Tuple`` consisting of the contents of the fetched image and
+            ``None``, or ``None`` and an error message if fetching failed.
+        """
 
-        try:
-            im.save(saved_filename)
-        except IOError as e:
-            raise ImageError('Error saving image: %s %s' % (url, str(e)))
+        if stats is None:
+            stats = self.stats
+
+        with stats.measure(STAGE_FETCH) as measurement:
+            try:
+                image = self.fetch_image(url)
+            except requests.exceptions.RequestException as e:
+                return (None, 'Could not retrieve image: %s' % str(e))
+            except ImageError as e:
+                return (None, 'Could not save image: %s' % str(e))
+
+            measurement.bytes_out = len(image)
+            return (image, None)
+
+    def collect_fetched_images(self, results):
+        """Record the failures of a set of fetches in ``notices``.
+
+        :param results: List of ``try_fetch_image`` results.
+        :returns:
+            List of the contents of the fetched images, with ``None`` in
+            place of the images that failed.
+        """
+
+        images = []
+        for (image, err) in results:
+            if err:
+                self.notices.append(err)
+                logging.debug(err)
+            images.append(image)
+
+        return images
+
+    def fetch_images(self, urls):
+        """Fetch a list of images concurrently.
+
+        Images which cannot be fetched are skipped and reported in
+        ``notices``.
+
+        :param urls: URLs of the images to fetch.
+        :returns:
+            List of the contents of the fetched images in the order of
+            ``urls``, with ``None`` in place of the images that failed.
+        """
+
+        workers = min(self.fetch_workers, len(urls))
+        if workers <= 1:
+            results = [self.try_fetch_image(url) for url in urls]
+        else:
+            # The pool threads record their fetches in the caller's stats.
+            stats = self.stats
 
-        return saved_filename
+            pool = ThreadPool(workers)
+            try:
+                results = pool.map(lambda url: self.try_fetch_image(url,
+                                                                    stats),
+                                   urls)
+            finally:
+                pool.terminate()
+
+        return self.collect_fetched_images(results)
 
     def verify_generated_icon(self,
                               target_format,
                               result_path):
         """Verify the target (ICO or ICNS) image.
 
+        The whole directory or chunk table of the container is checked
+        against the file size, without decoding any images.
+
         :param target_format: Target icon format.
         :param result_path: Path to the generated icon.
 
         :returns:
             ``True`` if it's a valid icon otherwise ``False``
         """
-        # Simple check to see if it's a valid ICNS file
-        # from http://en.wikipedia.org/wiki/Apple_Icon_Image_format
-        if target_format == FORMAT_ICNS:
-            with open(result_path, 'rb') as f:
-                # parse header section (8 bytes)
-                header = f.read(8)
-                if len(header) != 8:
-                    return False
 
-                header_unpacked = struct.unpack('>4BI', header)
-                header_type = ''.join([chr(i) for i in header_unpacked[0:4]])
-                if header_type != 'icns' or header_unpacked[4] <= 0:
-                    return False
+        with self.stats.measure(STAGE_VERIFY):
+            try:
+                (container_format, entries) = inspect_container(result_path)
+            except ImageError as e:
+                logging.debug('Invalid icon: %s' % (str(e)))
+                return False
 
-                return True
+            return container_format == target_format and len(entries) > 0
 
-        # Simple check to see if it's a valid ICO file
-        # from http://en.wikipedia.org/wiki/ICO_(file_format)
-        elif target_format == FORMAT_ICO:
-            with open(result_path, 'rb') as f:
-                header = f.read(6)
-                if len(header) != 6:
-                    return False
+    def verify_container(self,
+                         target_format,
+                         data):
+        """Verify an assembled container before it is handed out.
 
-                header_unpacked = struct.unpack('<3H', header)
-                if header_unpacked[:2] != (0, 1) or header_unpacked[2] <= 0:
-                    return False
+        :param target_format: Target icon format.
+        :param data: Container data.
+        :raises ConversionError: if the container isn't valid.
+        """
 
-                return True
+        with self.stats.measure(STAGE_VERIFY) as measurement:
+            measurement.bytes_in = len(data)
+            try:
+                (container_format, entries) = inspect_buffer(data)
+            except ImageError as e:
+                raise ConversionError('Failed to create container icon: '
+                                      '%s: %s' % (target_format, str(e)))
 
-        return False
+            if container_format != target_format or len(entries) == 0:
+                raise ConversionError('Failed to create container icon: '
+                                      '%s' % (target_format))
 
     def resize_image(self,
-                     image_path,
+                     image,
                      image_width,
                      image_height,
                      transparency):
         """Resize image.
 
-        :param image_path: Path to the source icon.
+        :param image:
+            Source icon, either image file contents or a
+            :class:`PIL.Image.Image`.
         :param image_width: Width of the icon.
         :param image_height: Height of the icon.
-        :param image_format: Format of the icon.
-        :param target_format: Target icon format.
         :param transparency: Whether to add transparency or not.
 
         :returns:
-            Path to the resized image.
+            the resized image, as a :class:`PIL.Image.Image` with the Pillow
+            backend and as PNG file contents with the ImageMagick backend.
+        """
+
+        if self.backend == BACKEND_PILLOW:
+            return self.apply_resize_steps(image,
+                                           [(image_width,
+                                             image_height,
+                                             transparency)])
+
+        if not isinstance(image, bytes):
+            image = imaging.encode_png(image)
+
+        args = self.resize_command(image_width, image_height, transparency)
+
+        try:
+            return self.run_tool(STAGE_RESIZE, args, image)
+        except subprocess.CalledProcessError as e:
+            raise ConversionError('Failed to resize image %s' % (e.output))
+
+    def run_tool(self,
+                 stage,
+                 args,
+                 input_data):
+        """Run an external tool as part of a conversion stage.
+
+        :param stage: Name of the stage to record the call in ``stats`` for.
+        :param args: Command and arguments to run.
+        :param input_data: Data to write to the standard input of the tool.
+        :returns:
+            the standard output of the tool.
+        :raises subprocess.CalledProcessError:
+            if the tool exits with a non-zero status.
         """
 
-        resized_file = tempfile.NamedTemporaryFile(
-                    prefix='resized_',
-                    suffix='.' + os.path.splitext(image_path)[1][1:],
-                    delete=False)
-        resized_path = resized_file.name
+        logging.debug('Conversion call arguments: %r' % (args))
+
+        with self.stats.measure(stage) as measurement:
+            measurement.subprocesses = 1
+            measurement.bytes_in = len(input_data)
+            output = run_command(args, input_data)
+            measurement.bytes_out = len(output)
+
+        return output
+
+    def resize_command(self,
+                       image_width,
+                       image_height,
+                       transparency):
+        """Build the ImageMagick command resizing a PNG image from stdin to
+            stdout.
+
+        :param image_width: Width of the icon.
+        :param image_height: Height of the icon.
+        :param transparency: Whether to add transparency or not.
+
+        :returns:
+            ``List`` of command arguments.
+        """
+
+        return self.pipeline_command([(image_width,
+                                       image_height,
+                                       transparency)])
+
+    def resize_operations(self,
+                          image_width,
+                          image_height,
+                          transparency):
+        """Build the ImageMagick operations of a single resize step.
+
+        :param image_width: Width of the icon.
+        :param image_height: Height of the icon.
+        :param transparency: Whether to add transparency or not.
+
+        :returns:
+            ``List`` of command arguments.
+        """
 
         # Adding transparency to make a square image
         if transparency:
-            args_string = "%s %s -gravity center -background transparent " \
-                            "-extent %dx%d %s" % (self.converttool,
-                                        image_path,
-                                        image_width,
-                                        image_height,
-                                        resized_path)
+            return ['-gravity', 'center',
+                    '-background', 'transparent',
+                    '-extent', '%dx%d' % (image_width, image_height)]
         # Resizing square image to the closest supported size
         else:
-            args_string = "%s %s -resize %dx%d %s" % (
-                                        self.converttool,
-                                        image_path,
-                                        image_width,
-                                        image_height,
-                                        resized_path)
+            return ['-resize', '%dx%d' % (image_width, image_height)]
 
-        args = args_string.split()
+    def workspace(self):
+        """Create the scratch workspace of a conversion.
 
-        logging.debug('Conversion call arguments: %r' % (args))
+        The scratch directory or memory files are only created once an
+        intermediate file is needed.
+
+        :returns:
+            a :class:`iconmaker.workspace.Workspace`.
+        """
+
+        return Workspace(self.scratch)
+
+    def pipeline_command(self, steps):
+        """Build a single ImageMagick command normalizing an image from stdin
+            to stdout.
+
+        The image is decoded once, all resize steps are applied to it and the
+        result is written as a 32 bit PNG image.
+
+        :param steps:
+            List of resize steps as accepted by ``apply_resize_steps``. An
+            empty list only promotes the image to 32 bit.
+
+        :returns:
+            ``List`` of command arguments.
+        """
+
+        args = [self.converttool, '-']
+        for step in steps:
+            args.extend(self.resize_operations(*step))
+        args.append('png32:-')
+
+        return args
+
+    def run_pipeline(self,
+                     image,
+                     steps):
+        """Normalize an image with a single ImageMagick call.
+
+        :param image:
+            Source icon, either image file contents or a
+            :class:`PIL.Image.Image`.
+        :param steps:
+            List of resize steps as accepted by ``apply_resize_steps``.
+
+        :returns:
+            the contents of the normalized 32 bit PNG image.
+        """
+
+        if not isinstance(image, bytes):
+            image = imaging.encode_png(image)
+
+        args = self.pipeline_command(steps)
 
         try:
-            subprocess.check_output(args,
-                                    stderr = subprocess.STDOUT)
+            return self.run_tool(STAGE_RESIZE, args, image)
         except subprocess.CalledProcessError as e:
-            raise ConversionError('Failed to resize image %s' % (e.output))
+            raise ConversionError('Failed to normalize image %s' % (e.output))
+
+    def ladder_command(self,
+                       side,
+                       steps,
+                       sizes,
+                       workspace):
+        """Build a single ImageMagick command resizing a square image from
+            stdin to several sizes through a halving pyramid.
+
+        See ``imaging.resize_ladder``. All versions are written to
+        ``workspace`` as 32 bit PNG images.
+
+        :param side: Size of the image after applying ``steps``.
+        :param steps:
+            List of resize steps making the image square as accepted by
+            ``apply_resize_steps``.
+        :param sizes: List of target sizes, none larger than ``side``.
+        :param workspace:
+            :class:`iconmaker.workspace.Workspace` to write the versions to.
+
+        :returns:
+            ``Tuple`` consisting of the list of command arguments and the list
+            of paths the versions are written to in the order of ``sizes``.
+        """
+
+        args = [self.converttool, '-']
+        for step in steps:
+            args.extend(self.resize_operations(*step))
+
+        paths = {}
+        level = side
+        for size in sorted(set(sizes), reverse = True):
+            while level // 2 >= size:
+                level //= 2
+                args.extend(['-scale', '%dx%d' % (level, level)])
 
-        return resized_path
+            paths[size] = workspace.path('%d.png' % (size))
+            if level == size:
+                args.extend(['-write', 'png32:%s' % (paths[size])])
+            else:
+                args.extend(['(', '+clone',
+                             '-resize', '%dx%d' % (size, size),
+                             '-write', 'png32:%s' % (paths[size]),
+                             '+delete', ')'])
+        args.append('null:')
+
+        return (args, [paths[size] for size in sizes])
+
+    def generate_ladder(self,
+                        image,
+                        info,
+                        steps,
+                        sizes,
+                        workspace = None):
+        """Generate several sizes of an image through a halving pyramid.
+
+        :param image: Contents of the source image.
+        :param info: :class:`iconmaker.probe.ImageInfo` of the image.
+        :param steps:
+            List of resize steps making the image square as accepted by
+            ``apply_resize_steps``.
+        :param sizes: List of target sizes.
+        :param workspace:
+            :class:`iconmaker.workspace.Workspace` of the conversion. A
+            workspace of its own is used if not given.
+
+        :returns:
+            ``List`` of the resized images as returned by ``resize_image`` in
+            the order of ``sizes``.
+        """
+
+        if self.backend == BACKEND_PILLOW:
+            master = imaging.open_image(self.normalize_image(image,
+                                                             steps,
+                                                             info))
+            with self.stats.measure(STAGE_RESIZE):
+                return imaging.resize_ladder(master, sizes)
+
+        if workspace is None:
+            with self.workspace() as workspace:
+                return self.generate_ladder(image,
+                                            info,
+                                            steps,
+                                            sizes,
+                                            workspace)
+
+        (args, paths) = self.ladder_command(max(info.size),
+                                            steps,
+                                            sizes,
+                                            workspace)
+
+        try:
+            self.run_tool(STAGE_RESIZE, args, image)
+        except subprocess.CalledProcessError as e:
+            raise ConversionError('Failed to generate sizes %s' % (e.output))
+
+        return [read_file(path) for path in paths]
+
+    def apply_resize_steps(self,
+                           image,
+                           steps):
+        """Apply a sequence of resize steps to an image.
+
+        The Pillow backend performs all steps in memory, the ImageMagick
+        backend performs all steps in a single call.
+
+        :param image:
+            Source icon, either image file contents or a
+            :class:`PIL.Image.Image`.
+        :param steps:
+            List of ``(width, height, transparency)`` tuples as accepted by
+            ``resize_image``.
+
+        :returns:
+            the resized image as returned by ``resize_image``.
+        """
+
+        if self.backend != BACKEND_PILLOW:
+            return self.run_pipeline(image, steps)
+
+        with self.stats.measure(STAGE_RESIZE):
+            image = imaging.open_image(image)
+            for (image_width, image_height, transparency) in steps:
+                image = imaging.transform_image(image,
+                                                image_width,
+                                                image_height,
+                                                transparency)
+
+        return image
 
     def fix_image_size(self,
                        image_dict,
-                       image_path,
+                       image,
                        image_width,
                        image_height,
                        target_format):
         """Fix image size to the specifications of the target container icon 
             format.
 
-        :param image_dict: Dictionary of sizes and image path mappings.
-        :param image_path: Path to the source icon.
+        :param image_dict: Dictionary of sizes and image mappings.
+        :param image:
+            Source icon, either image file contents or a
+            :class:`PIL.Image.Image`.
         :param image_width: Width of the icon.
         :param image_height: Height of the icon.
         :param target_format: Target icon format.
@@ -268,7 +808,40 @@ class Converter(object):
             ``None`` if the would be fixed image already exists
         """
 
-        image_path_orig = image_path
+        (steps, image_width, image_height) = self.plan_image_size(
+            image_dict,
+            image_width,
+            image_height,
+            target_format)
+
+        # Do we need to generate a new image?
+        if not steps:
+            return None
+        else:
+            return (self.apply_resize_steps(image, steps),
+                    image_width,
+                    image_height)
+
+    def plan_image_size(self,
+                        image_dict,
+                        image_width,
+                        image_height,
+                        target_format):
+        """Plan the resize steps fixing an image size to the specifications
+            of the target container icon format.
+
+        :param image_dict: Dictionary of sizes and image mappings.
+        :param image_width: Width of the icon.
+        :param image_height: Height of the icon.
+        :param target_format: Target icon format.
+
+        :returns:
+            ``Tuple`` consisting of the list of ``(width, height,
+            transparency)`` resize steps, new width and new height. The list
+            is empty if the would be fixed image already exists.
+        """
+
+        steps = []
         if target_format == FORMAT_ICNS:
             # Ensure the image is square,
             # otherwise add transparency to smaller side
@@ -283,13 +856,9 @@ class Converter(object):
 
                 # check if the corrected size doesn't already exist
                 if not (image_width, image_height) in image_dict:
-                    logging.debug('Resizing with transparency: %s' % (
-                        image_path))
+                    logging.debug('Resizing with transparency')
 
-                    image_path = self.resize_image(image_path,
-                                                   image_width,
-                                                   image_height,
-                                                   True)
+                    steps.append((image_width, image_height, True))
 
             # Ensure the image is of supported sizes,
             # otherwise resize it.
@@ -309,55 +878,696 @@ class Converter(object):
 
                 # the corrected size doesn't already exist
                 if not (image_width, image_height) in image_dict:
-                    logging.debug('Resizing without transparency: %s' % (
-                        image_path))
+                    logging.debug('Resizing without transparency')
 
-                    image_path = self.resize_image(image_path,
-                                                   image_width,
-                                                   image_height,
-                                                   False)
+                    steps.append((image_width, image_height, False))
         elif target_format == FORMAT_ICO:
             # Downscale but mantain aspect ratio.
             if image_width > 256 or image_height > 256:
                 max_size = max(image_width, image_height)
-                ratio = max_size / 256
+                ratio = float(max_size) / 256
                 image_width = int(image_width / ratio)
                 image_height = int(image_height / ratio)
 
                 if not (image_width, image_height) in image_dict:
-                    image_path = self.resize_image(image_path,
-                                                   image_width,
-                                                   image_height,
-                                                   False)
+                    steps.append((image_width, image_height, False))
 
-        # Did we generate a new image?
-        if image_path_orig == image_path:
-            return None
+        return (steps, image_width, image_height)
+
+    def requires_png32(self,
+                       image,
+                       info = None):
+        """Determine whether an image must be converted to a 32 bit PNG image.
+
+        Only RGB and RGBA PNGs are passed on as is, which we're certain that
+        the container writers handle well. Grayscale images are promoted
+        whatever their bit depth, as 16 bit samples must be scaled down. The
+        decision is based on the contents of the image, not its file name.
+
+        :param image: Contents of the source image.
+        :param info:
+            :class:`iconmaker.probe.ImageInfo` of the image. Probed if not
+            given.
+        :returns:
+            ``True`` if the image must be converted otherwise ``False``.
+        :raises ImageError: if the image cannot be identified.
+        """
+
+        if info is None:
+            info = probe_image(image)
+
+        return info.format != FORMAT_PNG or not info.mode in PNG32_MODES
+
+    def promote_image(self,
+                      image,
+                      info = None):
+        """Convert an image to 32 bit RGBA if required.
+
+        The image is promoted in memory, without running any tools.
+
+        :param image: Contents of the source image.
+        :param info:
+            :class:`iconmaker.probe.ImageInfo` of the image. Probed if not
+            given.
+        :returns:
+            Contents of the source image or the promoted
+            :class:`PIL.Image.Image`.
+        :raises ImageError: if the image cannot be decoded.
+        """
+
+        if not self.requires_png32(image, info):
+            return image
+
+        logging.debug('Promoting input image to 32-bit RGBA')
+        with self.stats.measure(STAGE_PROMOTE) as measurement:
+            measurement.bytes_in = len(image)
+            return imaging.promote_image(imaging.open_image(image))
+
+    def normalize_image(self,
+                        image,
+                        steps,
+                        info = None):
+        """Promote an image to 32 bit PNG if required and apply resize steps.
+
+        The ImageMagick backend does both in a single call.
+
+        :param image: Contents of the source image.
+        :param steps:
+            List of ``(width, height, transparency)`` tuples as accepted by
+            ``resize_image``.
+        :param info:
+            :class:`iconmaker.probe.ImageInfo` of the image. Probed if not
+            given.
+
+        :returns:
+            the normalized image as returned by ``resize_image``, or the
+            source image if it needs no changes.
+        """
+
+        if self.backend == BACKEND_IMAGEMAGICK:
+            if steps:
+                return self.run_pipeline(image, steps)
+            return self.promote_image(image, info)
+
+        image = self.promote_image(image, info)
+        if steps:
+            image = self.apply_resize_steps(image, steps)
+
+        return image
+
+    def validate_sources(self,
+                         sources,
+                         target_format):
+        """Validate the input arguments of a container build.
+
+        :param sources: List of image file contents.
+        :param target_format: Target icon format.
+        :raises ConversionError: if the arguments are invalid.
+        """
+
+        if target_format not in Converter.SUPPORTED_TARGET_FORMATS:
+            raise ConversionError('invalid target format identifier: %s' % (
+                target_format))
+
+        if len(sources) == 0:
+            raise ConversionError('no valid input images to convert')
+
+    def dedupe_sources(self, sources):
+        """Drop byte-identical images from a list of sources.
+
+        :param sources: List of image file contents.
+        :returns:
+            List of the distinct image file contents in order of their first
+            occurrence.
+        """
+
+        unique = []
+        digests = set()
+        for image in sources:
+            digest = hashlib.sha1(image).digest()
+            if digest in digests:
+                logging.debug('Skipping duplicate image')
+                continue
+
+            digests.add(digest)
+            unique.append(image)
+
+        return unique
+
+    def expand_sources(self, sources):
+        """Replace ICO and ICNS containers among the sources by their frames.
+
+        The preferred frame of every size is used, PNG frames as stored.
+
+        :param sources: List of image file contents.
+        :returns:
+            List of image file contents.
+        """
+
+        expanded = []
+        for source in sources:
+            if sniff_container(source) is None:
+                expanded.append(source)
+                continue
+
+            logging.debug('Extracting frames from %s container' % (
+                sniff_container(source)))
+            expanded.extend(ContainerReader(source).extract())
+
+        return expanded
+
+    def probe_sources(self, sources):
+        """Probe a list of in-memory images.
+
+        :param sources: List of image file contents.
+        :returns:
+            ``List`` of :class:`iconmaker.probe.ImageInfo` instances in the
+            order of ``sources``.
+        :raises ImageError: if an image cannot be identified.
+        """
+
+        with self.stats.measure(STAGE_PROBE) as measurement:
+            measurement.bytes_in = sum(len(image) for image in sources)
+            return [probe_image(image) for image in sources]
+
+    def select_sources(self,
+                       sources,
+                       infos):
+        """Choose one image of each size.
+
+        Of several images of the same size, the image with the highest bit
+        depth is used, then PNG images over other formats, and then the image
+        with the lowest content hash, so that the choice doesn't depend on the
+        input order. Every size with several images is reported in
+        ``notices``.
+
+        :param sources: List of image file contents.
+        :param infos:
+            List of the :class:`iconmaker.probe.ImageInfo` instances of
+            ``sources``.
+        :returns:
+            ``Tuple`` consisting of the chosen image file contents and their
+            :class:`iconmaker.probe.ImageInfo` instances, ordered by size.
+        """
+
+        candidates = {}
+        for (image, info) in zip(sources, infos):
+            digest = hashlib.sha1(image).hexdigest()
+            candidates.setdefault(info.size, {})[digest] = (
+                -info.bit_depth,
+                info.format != FORMAT_PNG,
+                digest,
+                image,
+                info)
+
+        selected = []
+        for (size, images) in sorted(candidates.items()):
+            (_, _, _, image, info) = min(images.values(),
+                                         key = lambda x: x[:3])
+            selected.append((image, info))
+
+            if len(images) > 1:
+                err = ('Found %d images of %dx%d, using the %d bit %s '
+                       'image' % (len(images),
+                                  size[0],
+                                  size[1],
+                                  info.bit_depth,
+                                  info.format))
+                self.notices.append(err)
+                logging.debug(err)
+
+        return ([image for (image, info) in selected],
+                [info for (image, info) in selected])
+
+    def prepare_sources(self, sources):
+        """Prepare a list of in-memory images for a container build.
+
+        Byte-identical images are dropped before anything else, existing
+        containers are replaced by their frames, and the remaining images are
+        probed once for all stages, keeping one image of each size as chosen
+        by ``select_sources``.
+
+        :param sources: List of image file contents.
+        :returns:
+            ``Tuple`` consisting of the image file contents and their
+            :class:`iconmaker.probe.ImageInfo` instances.
+        """
+
+        sources = self.dedupe_sources(sources)
+
+        # Existing containers serve as sources through their frames.
+        sources = self.expand_sources(sources)
+
+        infos = self.probe_sources(sources)
+
+        return self.select_sources(sources, infos)
+
+    def plan_container(self,
+                       images,
+                       target_format,
+                       infos = None):
+        """Plan the entries of a container.
+
+        Images are deduplicated by size, keeping the first image of each
+        size, and images with sizes incompatible with the output format are
+        scheduled for resizing.
+
+        :param images: List of image file contents.
+        :param target_format: Target icon format.
+        :param infos:
+            List of the :class:`iconmaker.probe.ImageInfo` instances of
+            ``images`` as returned by ``probe_sources``. Probed if not given.
+        :returns:
+            ``List`` of ``(image, info, steps)`` tuples, one per container
+            entry, where ``steps`` are the resize steps to apply to ``image``.
+        """
+
+        if infos is None:
+            infos = self.probe_sources(images)
+
+        # Ensure that all images have sizes compatible with the output
+        # format.
+        image_dict = {}
+        for (image, info) in zip(images, infos):
+            if not info.size in image_dict:
+                image_dict[info.size] = (image, info)
+
+        # If they don't, we do our best job of correcting the wrongly-sized icons
+        plan = []
+        resized_sizes = set()
+        for (image_size, (image, info)) in sorted(image_dict.items()):
+            (image_width, image_height) = image_size
+
+            if is_size_convertible_to_icon(image_width,
+                                           image_height,
+                                           target_format):
+                plan.append((image, info, []))
+                continue
+
+            (steps, resized_width, resized_height) = self.plan_image_size(
+                image_dict,
+                image_width,
+                image_height,
+                target_format)
+
+            if steps and not (resized_width, resized_height) in resized_sizes:
+                resized_sizes.add((resized_width, resized_height))
+                plan.append((image, info, steps))
+
+        return plan
+
+    def planned_size(self,
+                     info,
+                     steps):
+        """Determine the size of a planned container entry.
+
+        :param info: :class:`iconmaker.probe.ImageInfo` of the source image.
+        :param steps: Resize steps to apply to the source image.
+        :returns:
+            ``Tuple`` consisting of the width and height of the entry.
+        """
+
+        if steps:
+            return steps[-1][:2]
+
+        return info.size
+
+    def plan_ladder(self,
+                    images,
+                    infos,
+                    plan,
+                    target_format):
+        """Plan generating the sizes missing from a container.
+
+        The sizes are generated from the largest source image, the first one
+        if there are several, after making it square. A container entry of
+        that image which must be resized or promoted is generated along with
+        them, so that it comes from the halving pyramid as well and the image
+        is decoded only once.
+
+        :param images: List of image file contents.
+        :param infos:
+            List of the :class:`iconmaker.probe.ImageInfo` instances of
+            ``images``.
+        :param plan: Container entries as returned by ``plan_container``.
+        :param target_format: Target icon format.
+        :returns:
+            ``Tuple`` consisting of the remaining container entries and the
+            ladder. The ladder is a tuple of the source image, its info, the
+            resize steps making it square and the list of sizes to generate,
+            or ``None`` if there is nothing to generate.
+        """
+
+        if not self.generate_sizes:
+            return (plan, None)
+
+        if self.generate_sizes is True:
+            if target_format == FORMAT_ICNS:
+                sizes = SUPPORTED_SIZES_ICNS
+            else:
+                sizes = STANDARD_SIZES_ICO
         else:
-            return (image_path, image_width, image_height)
+            sizes = self.generate_sizes
+
+        covered = set(self.planned_size(info, steps)
+                      for (image, info, steps) in plan)
+
+        (image, info) = max(zip(images, infos), key = lambda x: max(x[1].size))
+        side = max(info.size)
+
+        sizes = set(size for size in sizes
+                    if size <= side and
+                    not (size, size) in covered and
+                    is_size_convertible_to_icon(size, size, target_format))
+
+        remaining = []
+        for (entry_image, entry_info, entry_steps) in plan:
+            (width, height) = self.planned_size(entry_info, entry_steps)
+            if (entry_image is image and width == height and width <= side and
+                (entry_steps or self.requires_png32(entry_image, entry_info))):
+                sizes.add(width)
+            else:
+                remaining.append((entry_image, entry_info, entry_steps))
+
+        if not sizes:
+            return (plan, None)
+
+        steps = []
+        if info.width != info.height:
+            steps.append((side, side, True))
 
-    def convert_to_png32(self,
-                         source_path,
-                         target_path):
-        """Convert a source image to a 32 bit PNG image.
+        return (remaining, (image, info, steps, sorted(sizes)))
 
-        :param source_path: Path of the source image.
-        :param target_path: Path of the target image.
-        :raises ConversionError: if conversion fails.
+    def assemble_container(self,
+                           image_list,
+                           target_format):
+        """Assemble a container from its final entries.
+
+        The directory or chunk table of the container is verified before it
+        is returned.
+
+        :param image_list:
+            List of :class:`PIL.Image.Image` instances or image file contents.
+        :param target_format: Target icon format.
+        :returns:
+            the container data.
         """
 
-        logging.debug('Converting input image to 32-bit PNG: %s -> %s' % (
-            source_path, target_path))
-        # Perform the conversion.
+        # Container icons are assembled in-process.
+        logging.debug('Assembling %s container from %d images' % (
+            target_format, len(image_list)))
+
+        if self.compression is not None:
+            image_list = self.compress_entries(image_list, target_format)
+
+        with self.stats.measure(STAGE_ASSEMBLE) as measurement:
+            if target_format == FORMAT_ICNS:
+                data = build_icns(image_list, self.retina)
+            elif target_format == FORMAT_ICO:
+                data = build_ico(image_list)
+
+            measurement.bytes_out = len(data)
+
+        self.verify_container(target_format, data)
+
+        return data
+
+    def compress_entries(self,
+                         image_list,
+                         target_format):
+        """Encode the PNG entries of a container under the compression
+            policy.
+
+        Entries are encoded in parallel threads, and the outcome of every
+        entry is recorded in ``stats``. ICNS entries may become palette PNG
+        images; ICO entries stay 32 bit for compatibility. ICNS entries stored
+        in the legacy RLE encoding are left alone.
+
+        :param image_list:
+            List of :class:`PIL.Image.Image` instances or image file contents.
+        :param target_format: Target icon format.
+        :returns:
+            List of the entries with the PNG entries encoded.
+        """
+
+        indices = []
+        for (index, image) in enumerate(image_list):
+            if isinstance(image, bytes):
+                header = read_png_header(image)
+                if header is None:
+                    continue
+                size = header[:2]
+            else:
+                size = image.size
+
+            if (target_format == FORMAT_ICNS and
+                OSTYPES_BY_SIZE.get(size[0]) in LEGACY_MASK_OSTYPES):
+                continue
+
+            indices.append(index)
+
+        with self.stats.measure(STAGE_COMPRESS) as measurement:
+            results = compress_entries([image_list[index]
+                                        for index in indices],
+                                       self.compression,
+                                       target_format == FORMAT_ICNS,
+                                       self.compression_workers)
+
+            image_list = list(image_list)
+            for (index, (data, compression)) in zip(indices, results):
+                image_list[index] = data
+                measurement.bytes_in += compression.bytes_before
+                measurement.bytes_out += compression.bytes_after
+                self.stats.record_entry(compression)
+
+        return image_list
+
+    def result_key(self,
+                   sources,
+                   target_format,
+                   infos = None):
+        """Determine the result cache key of a container build.
+
+        Only one image of each size ends up in the container, the first one
+        unless the sources were chosen by ``select_sources``, so the key covers
+        the contents of those images ordered by size together with the target
+        format and the backend, and doesn't depend on the input order.
+
+        :param sources: List of image file contents.
+        :param target_format: Target icon format.
+        :param infos:
+            List of the :class:`iconmaker.probe.ImageInfo` instances of
+            ``sources`` as returned by ``probe_sources``. Probed if not given.
+        :returns:
+            the cache key, or ``None`` if there is no result cache.
+        """
+
+        if self.result_cache is None:
+            return None
+
+        if infos is None:
+            infos = self.probe_sources(sources)
+
+        digests = {}
+        for (image, info) in zip(sources, infos):
+            if not info.size in digests:
+                digests[info.size] = hashlib.sha1(image).hexdigest()
+
+        key = hashlib.sha1()
+        key.update(('%s:%s' % (target_format, self.backend)).encode('utf-8'))
+        if self.generate_sizes:
+            key.update((':%r' % (self.generate_sizes)).encode('utf-8'))
+        if self.compression is not None:
+            key.update((':%s' % (self.compression.name)).encode('utf-8'))
+        if self.retina and target_format == FORMAT_ICNS:
+            key.update(b':retina')
+        for (size, digest) in sorted(digests.items()):
+            key.update(('|%dx%d:%s' % (size[0], size[1], digest)).encode('utf-8'))
+
+        return key.hexdigest()
+
+    def render_container(self,
+                         sources,
+                         target_format,
+                         infos = None,
+                         workspace = None):
+        """Run the conversion pipeline on a list of in-memory images.
+
+        :param sources:
+            List of image file contents.
+        :param target_format:
+            Target format. Must be one of ``FORMAT_ICO`` and ``FORMAT_ICNS``.
+        :param infos:
+            List of the :class:`iconmaker.probe.ImageInfo` instances of
+            ``sources`` as returned by ``probe_sources``. Probed if not given.
+        :param workspace:
+            :class:`iconmaker.workspace.Workspace` holding the intermediate
+            files of the conversion. A workspace of its own is used if not
+            given.
+        :returns:
+            the container data.
+        """
+
+        if workspace is None:
+            with self.workspace() as workspace:
+                return self.render_container(sources,
+                                             target_format,
+                                             infos,
+                                             workspace)
+
+        self.validate_sources(sources, target_format)
+
+        if infos is None:
+            infos = self.probe_sources(sources)
+
+        plan = self.plan_container(sources, target_format, infos)
+        (plan, ladder) = self.plan_ladder(sources, infos, plan, target_format)
+
+        entries = [(self.planned_size(info, steps),
+                    self.normalize_image(image, steps, info))
+                   for (image, info, steps) in plan]
+
+        if ladder is not None:
+            (image, info, steps, sizes) = ladder
+            entries.extend(zip([(size, size) for size in sizes],
+                               self.generate_ladder(image,
+                                                    info,
+                                                    steps,
+                                                    sizes,
+                                                    workspace)))
+
+        image_list = [image for (size, image) in sorted(entries,
+                                                        key = lambda x: x[0])]
+
+        return self.assemble_container(image_list, target_format)
+
+    def build_container(self,
+                        sources,
+                        target_format,
+                        workspace = None):
+        """Build an ico/icns container from a list of in-memory images.
+
+        Containers are served from and stored in the result cache if there
+        is one.
+
+        :param sources:
+            List of image file contents.
+        :param target_format:
+            Target format. Must be one of ``FORMAT_ICO`` and ``FORMAT_ICNS``.
+        :param workspace:
+            :class:`iconmaker.workspace.Workspace` holding the intermediate
+            files of the conversion. A workspace of its own is used if not
+            given.
+        :returns:
+            the container data.
+        """
+
+        (sources, infos) = self.prepare_sources(sources)
+
+        key = self.result_key(sources, target_format, infos)
+        if key is not None:
+            data = self.result_cache.get(key)
+            if data is not None:
+                logging.debug('Result cache hit: %s' % (key))
+                return data
+
+        data = self.render_container(sources,
+                                     target_format,
+                                     infos,
+                                     workspace)
+
+        if key is not None:
+            self.result_cache.put(key, data)
+
+        return data
+
+    def convert_bytes(self,
+                      sources,
+                      target_format,
+                      target = None):
+        """Convert a list of in-memory images to an ico/icns container.
+
+        :param sources:
+            List of image file contents or file-like objects to read them from.
+        :param target_format:
+            Target format. Must be one of ``FORMAT_ICO`` and ``FORMAT_ICNS``.
+        :param target:
+            Optional file-like object to write the container to.
+        :returns:
+            the container data if no ``target`` is given, otherwise ``None``.
+        """
+
+        if len(sources) == 0:
+            raise ValueError('image input list cannot be empty')
+
+        self.start_stats()
         try:
-            subprocess.check_output([
-                    self.converttool,
-                    source_path,
-                    'png32:%s' % (target_path)
-                ], stderr = subprocess.STDOUT)
-        except subprocess.CalledProcessError as e:
-            raise ConversionError('Failed to convert input file to 32-bit PNG: %s' % (
-                e.output))
+            data = self.build_container([source if isinstance(source, bytes)
+                                         else source.read()
+                                         for source in sources],
+                                        target_format)
+        finally:
+            self.finish_stats()
+
+        if target is None:
+            return data
+
+        target.write(data)
+
+    def start_stats(self):
+        """Start collecting the stats of a new conversion in ``stats``.
+
+        The stats belong to the current thread or asyncio task, so
+        conversions running concurrently don't share them.
+
+        :returns:
+            the new :class:`iconmaker.stats.ConversionStats`.
+        """
+
+        return self.stats_scope.start()
+
+    def finish_stats(self):
+        """Finish collecting the stats of a conversion and report them to
+            ``stats_hook``.
+        """
+
+        stats = self.stats
+        stats.finish()
+        if self.stats_hook is not None:
+            self.stats_hook(stats)
+
+    def read_sources(self,
+                     image_list,
+                     fetched):
+        """Load a list of image files into memory.
+
+        :param image_list:
+            List of image files (either local paths or URLs).
+        :param fetched:
+            Dictionary of URLs and fetched image contents mappings, where
+            ``None`` marks an image that could not be fetched.
+        :returns:
+            List of the contents of the image files in the order of
+            ``image_list``, skipping images that could not be fetched and
+            repeated locations.
+        """
+
+        sources = []
+        seen = set()
+        for image_location in image_list:
+            if image_location in seen:
+                continue
+            seen.add(image_location)
+
+            if image_location in fetched:
+                image = fetched[image_location]
+            else:
+                image = read_file(image_location)
+
+            if image is not None:
+                sources.append(image)
+
+        return sources
 
     def convert(self, 
                 image_list, 
@@ -381,117 +1591,36 @@ class Converter(object):
         if len(image_list) == 0:
             raise ValueError('image input list cannot be empty')
 
-        # Make sure that all input files are stored locally and as PNGs.
-        # image_list can contain either a local path or an http url
-        local_image_list = []
-        for image_location in image_list:
-            if ((image_location.startswith("http:")) or
-                (image_location.startswith("https:"))):
+        self.start_stats()
+        try:
+            # A single workspace holds the intermediate files of all stages.
+            with self.workspace() as workspace:
+                # Load all input files into memory.
+                # image_list can contain either a local path or an http url
+                urls = unique_urls(image_list)
 
                 # Skip invalid/corrupt URLs
-                try:
-                    image_location = self.fetch_image(image_location)
-                except requests.exceptions.HTTPError as e:
-                    err = 'Could not retrieve image: %s' % str(e)
-                    self.notices.append(err)
-                    logging.debug(err)
-                    continue
-                except ImageError as e:
-                    err = 'Could not save image: %s' % str(e)
-                    self.notices.append(err)
-                    logging.debug(err)
-                    continue
+                fetched = dict(zip(urls, self.fetch_images(urls)))
+                sources = self.read_sources(image_list, fetched)
 
-            # Check the extension to see if we'll need to convert something
-            # else to PNG.
-            image_base, image_extension = os.path.splitext(image_location)
-            image_extension = image_extension[1:]
-
-            if image_extension in [FORMAT_GIF, FORMAT_JPG, FORMAT_JPG2]:
-                logging.debug('converting input GIF/JPG image to 32-bit PNG: %s' % (
-                    image_location))
-                image_location_png = "%s.%s" % (image_base, FORMAT_PNG)
-                self.convert_to_png32(image_location, 
-                                      image_location_png)
-                image_location = image_location_png
-
-            local_image_list.append(image_location)
-
-        # Validate the bit depth of each PNG file.
-        image_list = []
-
-        for image_path in local_image_list:
-            # Skip past the image if the bit depth is greater than or equal to 
-            # 24 bits, which we're certain that png2icns handles well.
-            image = Image.open(image_path)
-            image_bit_depth = image_mode_to_bit_depth(image.mode)
-            
-            if image_bit_depth >= 24:
-                image_list.append(image_path)
-                continue
-            
-            # Convert the PNG file to 32 bit if we're below 24 bit.
-            deeper_file = tempfile.NamedTemporaryFile(
-                prefix = 'deeper_',
-                suffix = '.png', 
-                delete = False)
-            deeper_filename = deeper_file.name
-
-            self.convert_to_png32(image_path, 
-                                  deeper_filename)
-            image_list.append(deeper_filename)
-
-        # Ensure that all image files have sizes compatible with the output
-        # format.
-        # If they don't, we do our best job of correcting the wrongly-sized icons
-        image_dict = {}
-        for image_path in image_list:
-            sizes = Image.open(image_path).size
-            if not sizes in image_dict:
-                image_dict[sizes] = image_path
-
-        image_list = []
-        resized_images = {}
-        for (image_size, image_path) in image_dict.iteritems():
-            (image_width, image_height) = image_size
-
-            if not is_size_convertible_to_icon(image_width,
-                                               image_height,
-                                               target_format):
+                logging.debug('Target path: %r' % (target_path))
 
-                fixed_image_tuple = self.fix_image_size(image_dict,
-                                                     image_path,
-                                                     image_width,
-                                                     image_height,
-                                                     target_format)
+                (sources, infos) = self.prepare_sources(sources)
 
-                if fixed_image_tuple:
-                    (resized_path, resized_width, resized_height) = fixed_image_tuple
-                    if not (resized_width, resized_height) in resized_images:
-                        resized_images[(resized_width, resized_height)] = resized_path
-                        image_list.append(resized_path)
+                key = self.result_key(sources, target_format, infos)
+                if key is not None:
+                    if self.result_cache.link(key, target_path):
+                        logging.debug('Result cache hit: %s' % (key))
+                        return
 
-            else:
-                image_list.append(image_path)
+                data = self.render_container(sources,
+                                             target_format,
+                                             infos,
+                                             workspace)
 
-        # Execute conversion command.
-        logging.debug('Target path: %r' % (target_path))
-        logging.debug('Image list: %r' % (image_list))
+                if key is not None:
+                    self.result_cache.put(key, data)
 
-        if target_format == FORMAT_ICNS:
-            args = [self.png2icns, target_path] + image_list
-        elif target_format == FORMAT_ICO:
-            args = [self.converttool] + image_list + [target_path]
-
-        logging.debug('Conversion call arguments: %r' % (args))
-        logging.debug('Conversion call: %s' % (
-            ' '.join(['"%s"' % (a) if ' ' in a else a for a in args])))
-
-        # Verify libicns' bogus errors
-        try:
-            subprocess.check_output(args, 
-                                    stderr = subprocess.STDOUT)
-        except subprocess.CalledProcessError as e:
-            if not self.verify_generated_icon(target_format, target_path):
-                raise ConversionError('Failed to create container icon: %s: %s' % (
-                    target_format, e.output))
+                write_file(target_path, data)
+        finally:
+            self.finish_stats()
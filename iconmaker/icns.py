@@ -0,0 +1,272 @@
+import struct
+
+from .imaging import encode_png, open_image
+from .utils import is_png32, is_png_palette, read_png_header
+from .exceptions import ConversionError, ImageError
+
+ICNS_HEADER = struct.Struct('>4sI')
+"""Header of both the container and every chunk: OSType and length.
+"""
+
+OSTYPES_BY_SIZE = {
+    16: b'icp4',
+    32: b'icp5',
+    48: b'ih32',
+    64: b'icp6',
+    128: b'ic07',
+    256: b'ic08',
+    512: b'ic09',
+    1024: b'ic10',
+}
+"""Primary OSType for each supported pixel size.
+"""
+
+RETINA_OSTYPES = {
+    b'ic11': 32,
+    b'ic12': 64,
+    b'ic13': 256,
+    b'ic14': 512,
+    b'ic10': 1024,
+}
+"""High resolution (@2x) OSTypes and their pixel sizes.
+"""
+
+SIZES_BY_OSTYPE = dict((ostype, size)
+                       for (size, ostype) in OSTYPES_BY_SIZE.items())
+"""Pixel size of each primary OSType.
+"""
+
+LEGACY_MASK_OSTYPES = {
+    b'ih32': b'h8mk',
+}
+"""Legacy RLE encoded RGB OSTypes and their 8 bit mask companions.
+"""
+
+
+def encode_rle(data):
+    """Compress a single channel with the ICNS run length encoding.
+
+    Runs of 3 to 130 equal bytes are stored as ``0x80 + length - 3`` followed
+    by the byte, anything else as ``length - 1`` followed by up to 128
+    literal bytes.
+
+    :param data: Channel data.
+    :returns:
+        the compressed channel data.
+    """
+
+    data = bytearray(data)
+    output = bytearray()
+    literal = bytearray()
+    length = len(data)
+    index = 0
+
+    while index < length:
+        run = 1
+        while (index + run < length and
+               run < 130 and
+               data[index + run] == data[index]):
+            run += 1
+
+        if run >= 3:
+            if literal:
+                output.append(len(literal) - 1)
+                output.extend(literal)
+                literal = bytearray()
+            output.append(0x80 + run - 3)
+            output.append(data[index])
+            index += run
+        else:
+            literal.append(data[index])
+            index += 1
+            if len(literal) == 128:
+                output.append(127)
+                output.extend(literal)
+                literal = bytearray()
+
+    if literal:
+        output.append(len(literal) - 1)
+        output.extend(literal)
+
+    return bytes(output)
+
+
+def decode_rle(data, length, offset = 0):
+    """Decompress a single channel compressed with ``encode_rle``.
+
+    :param data: ``bytearray`` of the compressed data.
+    :param length: Number of bytes of the decompressed channel.
+    :param offset: Offset of the channel in ``data``.
+    :returns:
+        ``Tuple`` consisting of the channel data and the offset following the
+        compressed channel.
+    :raises ImageError: if the data ends before the channel is complete.
+    """
+
+    output = bytearray()
+    while len(output) < length:
+        if offset >= len(data):
+            raise ImageError('Truncated RLE data')
+
+        control = data[offset]
+        if control & 0x80:
+            output.extend(data[offset + 1:offset + 2] * (control - 0x80 + 3))
+            offset += 2
+        else:
+            output.extend(data[offset + 1:offset + control + 2])
+            offset += control + 2
+
+    return (bytes(output[:length]), offset)
+
+
+def encode_legacy(image):
+    """Encode an image as a legacy RLE compressed RGB chunk and 8 bit mask.
+
+    :param image: :class:`PIL.Image.Image` to encode.
+    :returns:
+        ``Tuple`` consisting of the RGB chunk data and the mask chunk data.
+    """
+
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
+
+    (r, g, b, a) = image.split()
+    rgb_data = b''.join(encode_rle(channel.tobytes()) for channel in (r, g, b))
+
+    return (rgb_data, a.tobytes())
+
+
+def load_source(source):
+    """Determine the size of an ICNS source and decode it if necessary.
+
+    :param source:
+        Either a :class:`PIL.Image.Image` or the contents of an image file.
+    :returns:
+        ``Tuple`` consisting of the pixel size and the source, which is left
+        as is if it's a 32 bit or palette PNG file and decoded otherwise.
+    :raises ConversionError: if the source isn't a square image.
+    """
+
+    if isinstance(source, bytes) and (is_png32(source) or
+                                      is_png_palette(source)):
+        (width, height) = read_png_header(source)[:2]
+    else:
+        source = open_image(source)
+        (width, height) = source.size
+
+    if width != height:
+        raise ConversionError('ICNS entries must be square: %dx%d' % (
+            width, height))
+
+    return (width, source)
+
+
+def encode_chunks(source, ostype = None):
+    """Encode an ICNS source as one or more chunks.
+
+    :param source:
+        Either a :class:`PIL.Image.Image` or the contents of an image file.
+    :param ostype:
+        OSType to store the source as. Defaults to the primary OSType for the
+        size of the source.
+    :returns:
+        list of ``(ostype, data)`` tuples.
+    :raises ConversionError: if the size is not supported.
+    """
+
+    (size, source) = load_source(source)
+
+    if ostype is None:
+        if size not in OSTYPES_BY_SIZE:
+            raise ConversionError('Unsupported ICNS entry size: %dx%d' % (
+                size, size))
+        ostype = OSTYPES_BY_SIZE[size]
+
+    if ostype in LEGACY_MASK_OSTYPES:
+        (rgb_data, mask_data) = encode_legacy(open_image(source))
+        return [(ostype, rgb_data),
+                (LEGACY_MASK_OSTYPES[ostype], mask_data)]
+
+    if isinstance(source, bytes):
+        return [(ostype, source)]
+
+    return [(ostype, encode_png(source))]
+
+
+def retina_aliases(ostype):
+    """Determine the high resolution OSTypes sharing the pixel size of a
+        primary OSType.
+
+    E.g. the 32 pixel ``icp5`` image doubles as the 16@2x ``ic11`` image.
+
+    :param ostype: Primary OSType of an entry.
+    :returns:
+        sorted list of the other OSTypes to store the same PNG data under.
+    """
+
+    if ostype in LEGACY_MASK_OSTYPES:
+        return []
+
+    size = SIZES_BY_OSTYPE.get(ostype)
+    return sorted(alias for (alias, alias_size) in RETINA_OSTYPES.items()
+                  if alias_size == size and alias != ostype)
+
+
+def build_icns_chunks(chunks):
+    """Assemble an ICNS container from already encoded chunks.
+
+    :param chunks: List of ``(ostype, data)`` tuples.
+    :returns:
+        the ICNS container data.
+    """
+
+    body = []
+    for (ostype, data) in chunks:
+        body.append(ICNS_HEADER.pack(ostype, ICNS_HEADER.size + len(data)))
+        body.append(data)
+
+    length = ICNS_HEADER.size + sum(len(part) for part in body)
+    return b''.join([ICNS_HEADER.pack(b'icns', length)] + body)
+
+
+def build_icns(sources, retina = False):
+    """Build an ICNS container.
+
+    :param sources:
+        List of :class:`PIL.Image.Image` instances or image file contents.
+    :param retina:
+        Whether to also store every entry under the high resolution OSTypes
+        of its pixel size, reusing the encoded data.
+    :returns:
+        the ICNS container data.
+    """
+
+    if len(sources) == 0:
+        raise ValueError('ICNS source list cannot be empty')
+
+    chunks = []
+    for source in sources:
+        source_chunks = encode_chunks(source)
+        chunks.extend(source_chunks)
+
+        if retina:
+            (ostype, data) = source_chunks[0]
+            chunks.extend((alias, data) for alias in retina_aliases(ostype))
+
+    return build_icns_chunks(chunks)
+
+
+def write_icns(sources, target_path, retina = False):
+    """Write an ICNS container to disk.
+
+    :param sources:
+        List of :class:`PIL.Image.Image` instances or image file contents.
+    :param target_path: Target path of the container.
+    :param retina:
+        Whether to also store every entry under the high resolution OSTypes
+        of its pixel size.
+    """
+
+    data = build_icns(sources, retina)
+    with open(target_path, 'wb') as f:
+        f.write(data)
@@ -0,0 +1,145 @@
+import struct
+
+from PIL import Image
+
+from .imaging import encode_png, open_image
+from .utils import is_png32, read_png_header
+from .exceptions import ConversionError
+
+ENCODING_PNG = 'png'
+ENCODING_BMP = 'bmp'
+ICO_MAX_SIZE = 256
+
+ICONDIR = struct.Struct('<3H')
+ICONDIRENTRY = struct.Struct('<4B2H2I')
+BITMAPINFOHEADER = struct.Struct('<3I2H6I')
+
+
+def encode_bmp(image):
+    """Encode an image as an ICO bitmap entry.
+
+    ICO bitmaps are headerless DIBs: a ``BITMAPINFOHEADER`` with a doubled
+    height, bottom-up 32 bit BGRA rows and a 1 bit AND mask.
+
+    :param image: :class:`PIL.Image.Image` to encode.
+    :returns:
+        the encoded bitmap data.
+    """
+
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
+
+    (width, height) = image.size
+    flipped = image.transpose(Image.FLIP_TOP_BOTTOM)
+
+    # XOR bitmap: BGRA rows, always a multiple of 4 bytes at 32 bpp.
+    (r, g, b, a) = flipped.split()
+    xor_data = Image.merge('RGBA', (b, g, r, a)).tobytes()
+
+    # AND mask: 1 bit per pixel, set where the pixel is fully transparent,
+    # rows padded to 32 bits.
+    mask = a.point(lambda value: 255 if value == 0 else 0).convert('1')
+    row_size = ((width + 31) // 32) * 4
+    packed_row_size = (width + 7) // 8
+    mask_data = mask.tobytes()
+    and_data = b''.join(
+        mask_data[y * packed_row_size:(y + 1) * packed_row_size].ljust(
+            row_size, b'\x00')
+        for y in range(height))
+
+    header = BITMAPINFOHEADER.pack(BITMAPINFOHEADER.size,
+                                   width,
+                                   height * 2,
+                                   1,
+                                   32,
+                                   0,
+                                   len(xor_data) + len(and_data),
+                                   0,
+                                   0,
+                                   0,
+                                   0)
+
+    return header + xor_data + and_data
+
+
+def encode_entry(source, encoding = ENCODING_PNG):
+    """Encode a single ICO entry.
+
+    Sources which are already 32 bit PNG files are embedded as is when
+    encoding to PNG.
+
+    :param source:
+        Either a :class:`PIL.Image.Image` or the contents of an image file.
+    :param encoding:
+        Entry encoding. Must be one of ``ENCODING_PNG`` and ``ENCODING_BMP``.
+        256 pixel entries are always stored as PNG.
+    :returns:
+        ``Tuple`` consisting of width, height and the encoded entry data.
+    """
+
+    if (isinstance(source, bytes) and
+        encoding == ENCODING_PNG and
+        is_png32(source)):
+        (width, height) = read_png_header(source)[:2]
+        return (width, height, source)
+
+    source = open_image(source)
+    (width, height) = source.size
+    if encoding == ENCODING_BMP and max(width, height) < ICO_MAX_SIZE:
+        return (width, height, encode_bmp(source))
+
+    return (width, height, encode_png(source))
+
+
+def build_ico(sources, encoding = ENCODING_PNG):
+    """Build an ICO container.
+
+    :param sources:
+        List of :class:`PIL.Image.Image` instances or image file contents.
+    :param encoding:
+        Entry encoding. Must be one of ``ENCODING_PNG`` and ``ENCODING_BMP``.
+    :returns:
+        the ICO container data.
+    :raises ConversionError: if an image cannot be stored in an ICO file.
+    """
+
+    if len(sources) == 0:
+        raise ValueError('ICO source list cannot be empty')
+
+    entries = [encode_entry(source, encoding) for source in sources]
+
+    directory = [ICONDIR.pack(0, 1, len(entries))]
+    offset = ICONDIR.size + ICONDIRENTRY.size * len(entries)
+
+    for (width, height, data) in entries:
+        if not (1 <= width <= ICO_MAX_SIZE and 1 <= height <= ICO_MAX_SIZE):
+            raise ConversionError('Invalid ICO entry size: %dx%d' % (
+                width, height))
+
+        # A dimension of 256 pixels is stored as 0.
+        directory.append(ICONDIRENTRY.pack(width % ICO_MAX_SIZE,
+                                           height % ICO_MAX_SIZE,
+                                           0,
+                                           0,
+                                           1,
+                                           32,
+                                           len(data),
+                                           offset))
+        offset += len(data)
+
+    return b''.join(directory + [data for (width, height, data) in entries])
+
+
+def write_ico(sources, target_path, encoding = ENCODING_PNG):
+    """Write an ICO container to disk.
+
+    :param sources:
+        List of :class:`PIL.Image.Image` instances or image file contents.
+    :param target_path: Target path of the container.
+    :param encoding:
+        Entry encoding. Must be one of ``ENCODING_PNG`` and ``ENCODING_BMP``.
+    """
+
+    data = build_ico(sources, encoding)
+    with open(target_path, 'wb') as f:
+        f.write(data)
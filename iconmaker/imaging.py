@@ -0,0 +1,212 @@
+from io import BytesIO
+
+from PIL import Image, ImageChops
+
+from .exceptions import ImageError
+
+
+def open_image(source):
+    """Decode an image.
+
+    :param source:
+        Either a :class:`PIL.Image.Image` or the contents of an image file.
+    :returns:
+        the decoded :class:`PIL.Image.Image`.
+    :raises ImageError: if the image cannot be decoded.
+    """
+
+    if not isinstance(source, bytes):
+        return source
+
+    try:
+        image = Image.open(BytesIO(source))
+        image.load()
+    except IOError as e:
+        raise ImageError('Error opening image: %s' % (str(e)))
+
+    return image
+
+
+WIDE_SAMPLE_SCALE = 1 / 257.0
+"""Scale of 16 bit samples to 8 bits, mapping 65535 to 255.
+"""
+
+
+def wide_sample_mask(image, value):
+    """Mask the pixels of a 16 bit grayscale image with a given value.
+
+    The samples are compared exactly, as the high and low byte planes of the
+    image.
+
+    :param image: :class:`PIL.Image.Image` in mode ``I``.
+    :param value: Sample value to mask.
+    :returns:
+        an ``L`` mode :class:`PIL.Image.Image` which is 0 where the image has
+        ``value`` and 255 elsewhere.
+    """
+
+    data = image.tobytes('raw', 'I;16B')
+    planes = []
+    for (rawmode, byte) in (('L;16B', value >> 8), ('L;16', value & 0xff)):
+        plane = Image.frombytes('L', image.size, data, 'raw', rawmode)
+        planes.append(plane.point([255 if sample == byte else 0
+                                   for sample in range(256)]))
+
+    return ImageChops.invert(ImageChops.multiply(*planes))
+
+
+def promote_image(image):
+    """Convert an image of any mode to RGBA in memory.
+
+    Transparency is carried over from PNG ``tRNS`` chunks and GIF
+    transparent colors. Integer and float samples, as decoded from 16 bit
+    grayscale PNG files, are scaled down to 8 bits, and other color spaces are
+    converted through RGB.
+
+    :param image: :class:`PIL.Image.Image` to promote.
+    :returns:
+        the RGBA image.
+    """
+
+    mode = image.mode
+    if mode == 'RGBA':
+        return image
+
+    if mode in ('I', 'F') or mode.startswith('I;'):
+        transparency = image.info.get('transparency')
+        if mode != 'F':
+            image = image.convert('I')
+
+        # Rounded, as the conversion to 8 bits truncates.
+        grey = image.point(lambda sample: sample * WIDE_SAMPLE_SCALE + 0.5) \
+            .convert('L')
+        if isinstance(transparency, int) and mode != 'F':
+            alpha = wide_sample_mask(image, transparency)
+        else:
+            alpha = Image.new('L', image.size, 255)
+
+        return Image.merge('RGBA', (grey, grey, grey, alpha))
+
+    # Pillow applies the transparency of palette, grayscale, bilevel and RGB
+    # images while adding the alpha channel.
+    if mode in ('1', 'L', 'LA', 'La', 'P', 'PA', 'RGB', 'RGBX', 'RGBa'):
+        return image.convert('RGBA')
+
+    return image.convert('RGB').convert('RGBA')
+
+
+def encode_png(image):
+    """Encode an image as a 32 bit PNG.
+
+    :param image: :class:`PIL.Image.Image` to encode.
+    :returns:
+        the encoded PNG data.
+    """
+
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
+
+    output = BytesIO()
+    image.save(output, 'PNG')
+    return output.getvalue()
+
+
+def extent_image(image, width, height):
+    """Center an image on a transparent canvas of the given size.
+
+    Pillow counterpart of ImageMagick's
+    ``-gravity center -background transparent -extent WxH``.
+
+    :param image: :class:`PIL.Image.Image` to extend.
+    :param width: Width of the canvas.
+    :param height: Height of the canvas.
+    :returns:
+        the extended RGBA image.
+    """
+
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
+
+    if image.size == (width, height):
+        return image
+
+    canvas = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+    canvas.paste(image, ((width - image.size[0]) // 2,
+                         (height - image.size[1]) // 2))
+    return canvas
+
+
+def resize_image(image, width, height):
+    """Resample an image to the given size.
+
+    :param image: :class:`PIL.Image.Image` to resize.
+    :param width: Target width.
+    :param height: Target height.
+    :returns:
+        the resized RGBA image.
+    """
+
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
+
+    if image.size == (width, height):
+        return image
+
+    return image.resize((width, height), Image.LANCZOS)
+
+
+def transform_image(image, width, height, transparency):
+    """Apply a single resize step as planned by ``Converter.fix_image_size``.
+
+    :param image: :class:`PIL.Image.Image` to transform.
+    :param width: Target width.
+    :param height: Target height.
+    :param transparency:
+        Whether to extend the canvas with transparency rather than resample.
+    :returns:
+        the transformed RGBA image.
+    """
+
+    if transparency:
+        return extent_image(image, width, height)
+
+    return resize_image(image, width, height)
+
+
+def halve_image(image):
+    """Halve the size of an image by averaging blocks of 2x2 pixels.
+
+    :param image: :class:`PIL.Image.Image` to halve.
+    :returns:
+        the halved image.
+    """
+
+    return image.resize((max(1, image.size[0] // 2),
+                         max(1, image.size[1] // 2)),
+                        Image.BOX)
+
+
+def resize_ladder(image, sizes):
+    """Resize a square image to several sizes through a halving pyramid.
+
+    Every size is resampled from the smallest pyramid level at least as large
+    as itself rather than from the original image, so the total cost stays
+    close to linear in the number of output pixels.
+
+    :param image: Square :class:`PIL.Image.Image` to resize.
+    :param sizes: List of target sizes, none larger than the image.
+    :returns:
+        ``List`` of the resized RGBA images in the order of ``sizes``.
+    """
+
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
+
+    ladder = {}
+    level = image
+    for size in sorted(set(sizes), reverse = True):
+        while level.size[0] // 2 >= size:
+            level = halve_image(level)
+        ladder[size] = resize_image(level, size, size)
+
+    return [ladder[size] for size in sizes]
@@ -0,0 +1,301 @@
+import mmap
+
+from .exceptions import ImageError
+from .ico import ICONDIR, ICONDIRENTRY, BITMAPINFOHEADER, ENCODING_PNG, \
+    ENCODING_BMP
+from .icns import ICNS_HEADER
+from .utils import PNG_SIGNATURE, read_png_header
+
+CONTAINER_ICO = 'ico'
+CONTAINER_ICNS = 'icns'
+
+ICO_MAGIC = b'\x00\x00\x01\x00'
+ICNS_MAGIC = b'icns'
+
+ENCODING_RLE = 'rle'
+ENCODING_MASK = 'mask'
+ENCODING_ARGB = 'argb'
+ENCODING_JPEG2000 = 'jpeg2000'
+
+JPEG2000_SIGNATURES = (b'\x00\x00\x00\x0cjP  ', b'\xff\x4f\xff\x51')
+"""Magic bytes of JPEG 2000 files and codestreams.
+"""
+
+ICNS_IMAGE_OSTYPES = {
+    b'is32': 16,
+    b'il32': 32,
+    b'ih32': 48,
+    b'it32': 128,
+    b's8mk': 16,
+    b'l8mk': 32,
+    b'h8mk': 48,
+    b't8mk': 128,
+    b'ic04': 16,
+    b'ic05': 32,
+    b'icp4': 16,
+    b'icp5': 32,
+    b'icp6': 64,
+    b'ic07': 128,
+    b'ic08': 256,
+    b'ic09': 512,
+    b'ic10': 1024,
+    b'ic11': 32,
+    b'ic12': 64,
+    b'ic13': 256,
+    b'ic14': 512,
+}
+"""Pixel sizes of the ICNS OSTypes holding images or masks. Other chunks,
+such as ``TOC `` and ``icnV``, carry metadata.
+"""
+
+ICNS_RLE_OSTYPES = set([b'is32', b'il32', b'ih32', b'it32'])
+ICNS_MASK_OSTYPES = set([b's8mk', b'l8mk', b'h8mk', b't8mk'])
+
+
+class ContainerEntry(object):
+    """An image stored in an ICO or ICNS container.
+    """
+
+    __slots__ = ('width', 'height', 'encoding', 'offset', 'length', 'ostype')
+
+    def __init__(self, width, height, encoding, offset, length, ostype = None):
+        """Initializer.
+
+        :param width: Width of the image.
+        :param height: Height of the image.
+        :param encoding: Encoding of the image, e.g. ``ENCODING_PNG``.
+        :param offset: Offset of the image data in the container.
+        :param length: Length of the image data.
+        :param ostype: OSType of the ICNS chunk or ``None`` for ICO entries.
+        """
+
+        self.width = width
+        self.height = height
+        self.encoding = encoding
+        self.offset = offset
+        self.length = length
+        self.ostype = ostype
+
+    @property
+    def size(self):
+        """``Tuple`` consisting of the width and height of the image.
+        """
+
+        return (self.width, self.height)
+
+    def __repr__(self):
+        return 'ContainerEntry(%dx%d, %r, offset=%d, length=%d)' % (
+            self.width, self.height, self.encoding, self.offset, self.length)
+
+
+def inspect_ico(buf):
+    """Walk the directory of an ICO container without decoding any images.
+
+    :param buf: Contents of the container, e.g. bytes or an ``mmap``.
+    :returns:
+        ``List`` of :class:`ContainerEntry` instances in directory order.
+    :raises ImageError: if the directory is invalid or points outside the
+        container.
+    """
+
+    size = len(buf)
+    if size < ICONDIR.size:
+        raise ImageError('Truncated ICO header')
+
+    (reserved, image_type, count) = ICONDIR.unpack_from(buf, 0)
+    if reserved != 0 or image_type != 1 or count == 0:
+        raise ImageError('Invalid ICO header')
+
+    directory_end = ICONDIR.size + ICONDIRENTRY.size * count
+    if directory_end > size:
+        raise ImageError('Truncated ICO directory')
+
+    entries = []
+    for index in range(count):
+        (width, height, colors, reserved, planes, bit_count, length,
+         offset) = ICONDIRENTRY.unpack_from(buf,
+                                            ICONDIR.size +
+                                            ICONDIRENTRY.size * index)
+        width = width or 256
+        height = height or 256
+
+        if length == 0 or offset < directory_end or offset + length > size:
+            raise ImageError('ICO entry %d lies outside the container' % (
+                index))
+
+        if buf[offset:offset + len(PNG_SIGNATURE)] == PNG_SIGNATURE:
+            header = read_png_header(buf[offset:offset + 29])
+            if header is None:
+                raise ImageError('Invalid PNG in ICO entry %d' % (index))
+
+            (width, height) = header[:2]
+            encoding = ENCODING_PNG
+        else:
+            if length < BITMAPINFOHEADER.size:
+                raise ImageError('Truncated bitmap in ICO entry %d' % (index))
+
+            (header_size, bmp_width, bmp_height, bmp_planes,
+             bmp_bit_count) = BITMAPINFOHEADER.unpack_from(buf, offset)[:5]
+            if header_size < BITMAPINFOHEADER.size or bmp_bit_count == 0:
+                raise ImageError('Invalid bitmap in ICO entry %d' % (index))
+
+            # The color table and the XOR bitmap must fit, the AND mask is
+            # optional in practice.
+            palette_size = 0
+            if bmp_bit_count <= 8:
+                palette_size = 4 * (colors or 2 ** bmp_bit_count)
+            row_size = ((bmp_width * bmp_bit_count + 31) // 32) * 4
+            xor_size = row_size * (bmp_height // 2)
+            if header_size + palette_size + xor_size > length:
+                raise ImageError('Truncated bitmap in ICO entry %d' % (index))
+
+            (width, height) = (bmp_width, bmp_height // 2)
+            encoding = ENCODING_BMP
+
+        entries.append(ContainerEntry(width, height, encoding, offset, length))
+
+    return entries
+
+
+def icns_encoding(buf, ostype, offset):
+    """Determine the encoding of an ICNS image chunk.
+
+    :param buf: Contents of the container.
+    :param ostype: OSType of the chunk.
+    :param offset: Offset of the chunk data.
+    :returns:
+        the encoding of the chunk.
+    """
+
+    if ostype in ICNS_MASK_OSTYPES:
+        return ENCODING_MASK
+    if ostype in ICNS_RLE_OSTYPES:
+        return ENCODING_RLE
+
+    head = buf[offset:offset + 12]
+    if head[:len(PNG_SIGNATURE)] == PNG_SIGNATURE:
+        return ENCODING_PNG
+    if head[:4] == b'ARGB':
+        return ENCODING_ARGB
+    if head.startswith(JPEG2000_SIGNATURES):
+        return ENCODING_JPEG2000
+
+    return None
+
+
+def inspect_icns(buf):
+    """Walk the chunks of an ICNS container without decoding any images.
+
+    :param buf: Contents of the container, e.g. bytes or an ``mmap``.
+    :returns:
+        ``List`` of :class:`ContainerEntry` instances for the image and mask
+        chunks in container order.
+    :raises ImageError: if the container is truncated or a chunk is invalid.
+    """
+
+    size = len(buf)
+    if size < ICNS_HEADER.size:
+        raise ImageError('Truncated ICNS header')
+
+    (magic, total) = ICNS_HEADER.unpack_from(buf, 0)
+    if magic != ICNS_MAGIC:
+        raise ImageError('Invalid ICNS header')
+    if total > size:
+        raise ImageError('Truncated ICNS container: %d of %d bytes' % (
+            size, total))
+
+    entries = []
+    offset = ICNS_HEADER.size
+    while offset < total:
+        if offset + ICNS_HEADER.size > total:
+            raise ImageError('Truncated ICNS chunk header at %d' % (offset))
+
+        (ostype, length) = ICNS_HEADER.unpack_from(buf, offset)
+        if length < ICNS_HEADER.size or offset + length > total:
+            raise ImageError('ICNS chunk %r lies outside the container' % (
+                ostype))
+
+        if ostype in ICNS_IMAGE_OSTYPES:
+            data_offset = offset + ICNS_HEADER.size
+            encoding = icns_encoding(buf, ostype, data_offset)
+            if encoding is None:
+                raise ImageError('Unknown encoding of ICNS chunk %r' % (
+                    ostype))
+
+            if encoding == ENCODING_PNG:
+                header = read_png_header(buf[data_offset:data_offset + 29])
+                if header is None:
+                    raise ImageError('Invalid PNG in ICNS chunk %r' % (ostype))
+
+            pixels = ICNS_IMAGE_OSTYPES[ostype]
+            entries.append(ContainerEntry(pixels,
+                                          pixels,
+                                          encoding,
+                                          data_offset,
+                                          length - ICNS_HEADER.size,
+                                          ostype))
+
+        offset += length
+
+    return entries
+
+
+def sniff_container(buf):
+    """Identify an ICO or ICNS container from its magic bytes.
+
+    :param buf: Contents of the file, e.g. bytes or an ``mmap``.
+    :returns:
+        ``CONTAINER_ICO``, ``CONTAINER_ICNS`` or ``None``.
+    """
+
+    magic = buf[:4]
+    if magic == ICNS_MAGIC:
+        return CONTAINER_ICNS
+    if magic == ICO_MAGIC:
+        return CONTAINER_ICO
+
+    return None
+
+
+def inspect_buffer(buf):
+    """Walk the structure of an ICO or ICNS container in memory.
+
+    :param buf: Contents of the container, e.g. bytes or an ``mmap``.
+    :returns:
+        ``Tuple`` consisting of ``CONTAINER_ICO`` or ``CONTAINER_ICNS`` and
+        the list of :class:`ContainerEntry` instances.
+    :raises ImageError: if the data isn't a valid ICO or ICNS container.
+    """
+
+    container_format = sniff_container(buf)
+    if container_format == CONTAINER_ICNS:
+        return (container_format, inspect_icns(buf))
+    if container_format == CONTAINER_ICO:
+        return (container_format, inspect_ico(buf))
+
+    raise ImageError('Not an ICO or ICNS container')
+
+
+def inspect_container(path):
+    """Memory-map an ICO or ICNS file and walk its structure.
+
+    Only the directory, the chunk headers and the first bytes of every image
+    are read; no image is decoded or copied.
+
+    :param path: Path of the container.
+    :returns:
+        ``Tuple`` consisting of ``CONTAINER_ICO`` or ``CONTAINER_ICNS`` and
+        the list of :class:`ContainerEntry` instances.
+    :raises ImageError: if the file isn't a valid ICO or ICNS container.
+    """
+
+    with open(path, 'rb') as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        except ValueError:
+            raise ImageError('Empty container: %s' % (path))
+
+        try:
+            return inspect_buffer(buf)
+        finally:
+            buf.close()
@@ -0,0 +1,213 @@
+import struct
+from io import BytesIO
+
+from PIL import Image
+
+from .exceptions import ImageError
+from .utils import PNG_SIGNATURE, read_png_header, image_mode_to_bit_depth
+
+GIF_SIGNATURES = (b'GIF87a', b'GIF89a')
+"""Magic bytes GIF files start with.
+"""
+
+JPEG_SIGNATURE = b'\xff\xd8\xff'
+"""Magic bytes every JPEG file starts with.
+"""
+
+PNG_MODES = {
+    (1, 0): '1',
+    (2, 0): 'L',
+    (4, 0): 'L',
+    (8, 0): 'L',
+    (16, 0): 'I;16',
+    (8, 2): 'RGB',
+    (16, 2): 'RGB',
+    (1, 3): 'P',
+    (2, 3): 'P',
+    (4, 3): 'P',
+    (8, 3): 'P',
+    (8, 4): 'LA',
+    (16, 4): 'RGBA',
+    (8, 6): 'RGBA',
+    (16, 6): 'RGBA',
+}
+"""Image modes of the PNG ``(bit depth, color type)`` combinations, matching
+the modes Pillow decodes them to. Pillow decodes 16 bit grayscale with alpha
+to ``RGBA`` and, before version 7, 16 bit grayscale to ``I``.
+"""
+
+JPEG_MODES = {
+    1: 'L',
+    3: 'RGB',
+    4: 'CMYK',
+}
+"""Image modes of the JPEG component counts.
+"""
+
+SNIFF_BYTES = 8
+"""Number of leading bytes ``sniff_format`` needs to identify a format.
+"""
+
+JPEG_SOF_MARKERS = set(range(0xc0, 0xd0)) - set([0xc4, 0xc8, 0xcc])
+"""JPEG start of frame markers, which carry the image dimensions.
+"""
+
+
+class ImageInfo(object):
+    """Metadata of a source image as determined by ``probe_image``.
+    """
+
+    __slots__ = ('format', 'width', 'height', 'mode', 'bit_depth')
+
+    def __init__(self, image_format, width, height, mode):
+        """Initializer.
+
+        :param image_format:
+            Lower case format name, e.g. ``png``, ``gif`` or ``jpeg``.
+        :param width: Width of the image.
+        :param height: Height of the image.
+        :param mode: Pillow mode the image decodes to.
+        """
+
+        self.format = image_format
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.bit_depth = image_mode_to_bit_depth(mode)
+
+    @property
+    def size(self):
+        """``Tuple`` consisting of the width and height of the image.
+        """
+
+        return (self.width, self.height)
+
+    def __repr__(self):
+        return 'ImageInfo(%r, %dx%d, %r)' % (self.format,
+                                             self.width,
+                                             self.height,
+                                             self.mode)
+
+
+def sniff_format(data):
+    """Identify the format of an image from its magic bytes.
+
+    :param data: The first ``SNIFF_BYTES`` or more bytes of the image file.
+    :returns:
+        the lower case format name, or ``None`` if the data doesn't start
+        with the magic bytes of a PNG, GIF or JPEG file.
+    """
+
+    if data[:8] == PNG_SIGNATURE:
+        return 'png'
+    if data[:6] in GIF_SIGNATURES:
+        return 'gif'
+    if data[:3] == JPEG_SIGNATURE:
+        return 'jpeg'
+
+    return None
+
+
+def read_gif_header(data):
+    """Read the logical screen descriptor of a GIF file.
+
+    :param data: Contents of the file.
+    :returns:
+        ``Tuple`` consisting of the width and height of the image, or ``None``
+        if the data does not start with a valid GIF header.
+    """
+
+    if len(data) < 10 or data[:6] not in GIF_SIGNATURES:
+        return None
+
+    return struct.unpack('<HH', data[6:10])
+
+
+def read_jpeg_header(data):
+    """Read the start of frame segment of a JPEG file.
+
+    :param data: Contents of the file.
+    :returns:
+        ``Tuple`` consisting of the width, height and number of components of
+        the image, or ``None`` if the data is not a valid JPEG file.
+    """
+
+    if data[:3] != JPEG_SIGNATURE:
+        return None
+
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset:offset + 1] != b'\xff':
+            return None
+
+        marker = struct.unpack('>B', data[offset + 1:offset + 2])[0]
+
+        # Fill bytes and standalone markers have no segment length.
+        if marker == 0xff:
+            offset += 1
+            continue
+        if marker == 0x01 or 0xd0 <= marker <= 0xd7:
+            offset += 2
+            continue
+        if marker in (0xd9, 0xda):
+            return None
+
+        length = struct.unpack('>H', data[offset + 2:offset + 4])[0]
+        if marker in JPEG_SOF_MARKERS:
+            segment = data[offset + 4:offset + 10]
+            if len(segment) < 6:
+                return None
+
+            (precision, height, width, components) = struct.unpack('>BHHB',
+                                                                   segment)
+            return (width, height, components)
+
+        offset += 2 + length
+
+    return None
+
+
+def probe_image(data):
+    """Determine the format, size and mode of an image without decoding it.
+
+    The format is sniffed from the magic bytes of the data, so it doesn't
+    depend on the file name. PNG, GIF and JPEG headers are parsed directly,
+    other formats are left to Pillow's lazy header parsing.
+
+    :param data: Contents of the image file.
+    :returns:
+        an :class:`ImageInfo`.
+    :raises ImageError: if the image cannot be identified.
+    """
+
+    image_format = sniff_format(data)
+
+    if image_format == 'png':
+        header = read_png_header(data)
+        if header is None or header[2:] not in PNG_MODES:
+            raise ImageError('Error opening image: invalid PNG header')
+
+        (width, height, bit_depth, color_type) = header
+        return ImageInfo('png', width, height, PNG_MODES[(bit_depth,
+                                                          color_type)])
+
+    if image_format == 'gif':
+        header = read_gif_header(data)
+        if header is None:
+            raise ImageError('Error opening image: invalid GIF header')
+
+        return ImageInfo('gif', header[0], header[1], 'P')
+
+    if image_format == 'jpeg':
+        header = read_jpeg_header(data)
+        if header is None or header[2] not in JPEG_MODES:
+            raise ImageError('Error opening image: invalid JPEG header')
+
+        return ImageInfo('jpeg', header[0], header[1], JPEG_MODES[header[2]])
+
+    try:
+        im = Image.open(BytesIO(data))
+    except IOError as e:
+        raise ImageError('Error opening image: %s' % (str(e)))
+
+    return ImageInfo(im.format.lower(), im.size[0], im.size[1], im.mode)
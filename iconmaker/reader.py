@@ -0,0 +1,288 @@
+import mmap
+from io import BytesIO
+
+from PIL import Image
+
+from .exceptions import ImageError
+from .ico import ICONDIR, ICONDIRENTRY, ENCODING_PNG, ENCODING_BMP
+from .icns import decode_rle
+from .imaging import encode_png
+from .inspector import inspect_buffer, ENCODING_RLE, ENCODING_MASK, \
+    ENCODING_ARGB, ENCODING_JPEG2000
+
+ICNS_MASKS_BY_OSTYPE = {
+    b'is32': b's8mk',
+    b'il32': b'l8mk',
+    b'ih32': b'h8mk',
+    b'it32': b't8mk',
+}
+"""Legacy RLE compressed RGB OSTypes and their 8 bit mask OSTypes.
+"""
+
+ENCODING_PREFERENCE = [ENCODING_PNG,
+                       ENCODING_ARGB,
+                       ENCODING_JPEG2000,
+                       ENCODING_BMP,
+                       ENCODING_RLE]
+"""Encodings in the order frames of the same size are preferred in.
+"""
+
+
+class ContainerReader(object):
+    """Random access reader of ICO and ICNS containers.
+
+    The frames are listed from the directory or chunk table alone, and only
+    the frames that are read are decoded.
+    """
+
+    def __init__(self, buf):
+        """Initializer.
+
+        :param buf: Contents of the container, e.g. bytes or an ``mmap``.
+        :raises ImageError: if the data isn't a valid ICO or ICNS container.
+        """
+
+        self.buf = buf
+        (self.format, self.entries) = inspect_buffer(buf)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Release the memory map of a container opened by
+            ``open_container``.
+        """
+
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+
+    def frames(self):
+        """List the frames of the container.
+
+        :returns:
+            ``List`` of :class:`iconmaker.inspector.ContainerEntry` instances,
+            excluding ICNS masks.
+        """
+
+        return [entry for entry in self.entries
+                if entry.encoding != ENCODING_MASK]
+
+    def sizes(self):
+        """List the frame sizes of the container.
+
+        :returns:
+            sorted ``list`` of ``(width, height)`` tuples.
+        """
+
+        return sorted(set(frame.size for frame in self.frames()))
+
+    def find(self, width, height = None):
+        """Find the preferred frame of a size.
+
+        PNG frames are preferred over the other encodings, larger frames over
+        smaller ones of the same encoding.
+
+        :param width: Width of the frame.
+        :param height: Height of the frame. Defaults to ``width``.
+        :returns:
+            a :class:`iconmaker.inspector.ContainerEntry` or ``None`` if there
+            is no frame of that size.
+        """
+
+        if height is None:
+            height = width
+
+        candidates = [frame for frame in self.frames()
+                      if frame.size == (width, height)]
+        if not candidates:
+            return None
+
+        return min(candidates,
+                   key = lambda frame: (
+                       ENCODING_PREFERENCE.index(frame.encoding),
+                       -frame.length))
+
+    def payload(self, entry):
+        """Read the raw data of an entry.
+
+        :param entry: :class:`iconmaker.inspector.ContainerEntry` to read.
+        :returns:
+            the entry data.
+        """
+
+        return bytes(self.buf[entry.offset:entry.offset + entry.length])
+
+    def decode_ico_bitmap(self, entry):
+        """Decode a BMP encoded ICO frame.
+
+        The frame is wrapped in a single entry ICO container with a copy of
+        its directory entry, which carries the bit depth Pillow needs to
+        apply the AND mask.
+
+        :param entry: :class:`iconmaker.inspector.ContainerEntry` to decode.
+        :returns:
+            the decoded :class:`PIL.Image.Image`.
+        """
+
+        index = self.entries.index(entry)
+        directory_offset = ICONDIR.size + ICONDIRENTRY.size * index
+        fields = list(ICONDIRENTRY.unpack_from(self.buf, directory_offset))
+        fields[-1] = ICONDIR.size + ICONDIRENTRY.size
+
+        data = (ICONDIR.pack(0, 1, 1) +
+                ICONDIRENTRY.pack(*fields) +
+                self.payload(entry))
+        return Image.open(BytesIO(data))
+
+    def decode_icns_legacy(self, entry):
+        """Decode a legacy RLE compressed ICNS frame and its mask.
+
+        :param entry: :class:`iconmaker.inspector.ContainerEntry` to decode.
+        :returns:
+            the decoded :class:`PIL.Image.Image`.
+        """
+
+        pixels = entry.width * entry.height
+        data = bytearray(self.payload(entry))
+
+        # it32 data starts with four zero bytes.
+        offset = 4 if entry.ostype == b'it32' else 0
+
+        # Small legacy icons may be stored uncompressed.
+        if len(data) - offset == 3 * pixels:
+            channels = [bytes(data[offset + index * pixels:
+                                   offset + (index + 1) * pixels])
+                        for index in range(3)]
+        else:
+            channels = []
+            for index in range(3):
+                (channel, offset) = decode_rle(data, pixels, offset)
+                channels.append(channel)
+
+        mask_ostype = ICNS_MASKS_BY_OSTYPE[entry.ostype]
+        masks = [mask for mask in self.entries
+                 if mask.ostype == mask_ostype and mask.length == pixels]
+        if masks:
+            channels.append(self.payload(masks[0]))
+        else:
+            channels.append(b'\xff' * pixels)
+
+        return Image.merge('RGBA', [Image.frombytes('L', entry.size, channel)
+                                    for channel in channels])
+
+    def decode_icns_argb(self, entry):
+        """Decode an RLE compressed ARGB ICNS frame.
+
+        :param entry: :class:`iconmaker.inspector.ContainerEntry` to decode.
+        :returns:
+            the decoded :class:`PIL.Image.Image`.
+        """
+
+        pixels = entry.width * entry.height
+        data = bytearray(self.payload(entry))
+
+        channels = []
+        offset = 4
+        for index in range(4):
+            (channel, offset) = decode_rle(data, pixels, offset)
+            channels.append(Image.frombytes('L', entry.size, channel))
+
+        (a, r, g, b) = channels
+        return Image.merge('RGBA', (r, g, b, a))
+
+    def decode(self, entry):
+        """Decode a frame.
+
+        :param entry: :class:`iconmaker.inspector.ContainerEntry` to decode.
+        :returns:
+            the decoded RGBA :class:`PIL.Image.Image`.
+        :raises ImageError: if the frame cannot be decoded.
+        """
+
+        try:
+            if entry.encoding == ENCODING_RLE:
+                image = self.decode_icns_legacy(entry)
+            elif entry.encoding == ENCODING_ARGB:
+                image = self.decode_icns_argb(entry)
+            elif entry.encoding == ENCODING_BMP:
+                image = self.decode_ico_bitmap(entry)
+            else:
+                image = Image.open(BytesIO(self.payload(entry)))
+
+            image.load()
+        except (IOError, ValueError) as e:
+            raise ImageError('Error decoding %dx%d frame: %s' % (
+                entry.width, entry.height, str(e)))
+
+        if image.mode != 'RGBA':
+            image = image.convert('RGBA')
+
+        return image
+
+    def read(self, width, height = None):
+        """Decode the preferred frame of a size.
+
+        :param width: Width of the frame.
+        :param height: Height of the frame. Defaults to ``width``.
+        :returns:
+            the decoded RGBA :class:`PIL.Image.Image`.
+        :raises ImageError: if there is no frame of that size.
+        """
+
+        frame = self.find(width, height)
+        if frame is None:
+            raise ImageError('No %dx%d frame in the %s container' % (
+                width, height or width, self.format))
+
+        return self.decode(frame)
+
+    def read_png(self, entry):
+        """Read a frame as PNG file contents.
+
+        PNG frames are returned as stored, without decoding them.
+
+        :param entry: :class:`iconmaker.inspector.ContainerEntry` to read.
+        :returns:
+            the PNG file contents.
+        """
+
+        if entry.encoding == ENCODING_PNG:
+            return self.payload(entry)
+
+        return encode_png(self.decode(entry))
+
+    def extract(self):
+        """Read the preferred frame of every size as PNG file contents.
+
+        :returns:
+            ``List`` of PNG file contents ordered by size.
+        """
+
+        return [self.read_png(self.find(*size)) for size in self.sizes()]
+
+
+def open_container(path):
+    """Open an ICO or ICNS file for reading.
+
+    The file is memory-mapped, so only the frames that are read are loaded.
+
+    :param path: Path of the container.
+    :returns:
+        a :class:`ContainerReader`, which should be closed after use.
+    :raises ImageError: if the file isn't a valid ICO or ICNS container.
+    """
+
+    with open(path, 'rb') as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        except ValueError:
+            raise ImageError('Empty container: %s' % (path))
+
+    try:
+        return ContainerReader(buf)
+    except ImageError:
+        buf.close()
+        raise
@@ -0,0 +1,493 @@
+"""WSGI conversion service.
+
+Runs conversions on a bounded pool of worker threads and rejects requests
+with ``503 Service Unavailable`` once all workers are busy and the queue is
+full. Run it locally with::
+
+    $ python -m iconmaker.server --port 8080 --workers 4 --queue 16
+"""
+
+import argparse, email, json, threading
+from io import BytesIO
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+from wsgiref.simple_server import make_server, WSGIServer
+
+try:
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs
+except ImportError:
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs
+
+from .converter import Converter, FORMAT_ICO, FORMAT_ICNS, FETCH_CHUNK_SIZE
+from .compression import POLICIES
+from .exceptions import ConversionError, ImageError
+from .logger import logging
+
+SERVER_WORKERS = 4
+SERVER_QUEUE_SIZE = 16
+SERVER_TIMEOUT = 60
+SERVER_MAX_REQUEST_BYTES = 32 * 1024 * 1024
+SERVER_RETRY_AFTER = 1
+
+CONTENT_TYPES = {
+    FORMAT_ICO: 'image/x-icon',
+    FORMAT_ICNS: 'image/icns',
+}
+"""Content types of the target formats.
+"""
+
+STATUS_MESSAGES = {
+    200: 'OK',
+    400: 'Bad Request',
+    405: 'Method Not Allowed',
+    411: 'Length Required',
+    413: 'Request Entity Too Large',
+    422: 'Unprocessable Entity',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+    504: 'Gateway Timeout',
+}
+
+
+class RequestError(Exception):
+    """Request exception carrying the HTTP status to respond with.
+    """
+
+    def __init__(self, status, message, headers = None):
+        """Initializer.
+
+        :param status: HTTP status code.
+        :param message: Description of the error.
+        :param headers: Optional list of additional response headers.
+        """
+
+        Exception.__init__(self, message)
+        self.status = status
+        self.headers = headers or []
+
+
+def parse_multipart(content_type, body):
+    """Split a ``multipart/form-data`` body into its fields.
+
+    :param content_type: Content type of the body, including the boundary.
+    :param body: Request body.
+    :returns:
+        ``List`` of ``(name, filename, value)`` tuples, where ``filename`` is
+        ``None`` for fields other than file uploads.
+    """
+
+    document = (b'MIME-Version: 1.0\r\nContent-Type: ' +
+                content_type.encode('latin-1') + b'\r\n\r\n' + body)
+    if hasattr(email, 'message_from_bytes'):
+        message = email.message_from_bytes(document)
+    else:
+        message = email.message_from_string(document)
+
+    if not message.is_multipart():
+        raise RequestError(400, 'Invalid multipart body')
+
+    fields = []
+    for part in message.get_payload():
+        name = part.get_param('name', header = 'content-disposition')
+        fields.append((name,
+                       part.get_filename(),
+                       part.get_payload(decode = True) or b''))
+
+    return fields
+
+
+class ConversionServer(object):
+    """WSGI application converting uploaded or remote images to ico/icns
+    containers.
+
+    ``POST`` requests take the target format in the ``format`` parameter and
+    the images either as the raw request body, as file uploads of a
+    ``multipart/form-data`` body or as ``url`` parameters, which may be
+    combined. The container is streamed back in the response. ``GET``
+    requests report the load of the server as JSON.
+
+    Every worker thread uses its own :class:`Converter`.
+    """
+
+    def __init__(self,
+                 workers = SERVER_WORKERS,
+                 queue_size = SERVER_QUEUE_SIZE,
+                 timeout = SERVER_TIMEOUT,
+                 max_request_bytes = SERVER_MAX_REQUEST_BYTES,
+                 **converter_kwargs):
+        """Initializer.
+
+        :param workers: Number of conversions run concurrently.
+        :param queue_size:
+            Number of conversions waiting for a worker before further
+            requests are rejected.
+        :param timeout:
+            Time in seconds a request waits for its conversion before it is
+            answered with ``504 Gateway Timeout``.
+        :param max_request_bytes: Maximum size of a request body.
+        :param converter_kwargs:
+            Keyword arguments to create each worker's :class:`Converter` with.
+        """
+
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.max_request_bytes = max_request_bytes
+        self.converter_kwargs = converter_kwargs
+
+        # A slot is held from admission until the conversion has finished,
+        # so timed out conversions keep counting against the capacity.
+        self.capacity = workers + queue_size
+        self.slots = threading.BoundedSemaphore(self.capacity)
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.local = threading.local()
+        self.pool = ThreadPool(workers)
+
+    def close(self):
+        """Stop the worker pool after the pending conversions.
+        """
+
+        self.pool.close()
+        self.pool.join()
+
+    def converter(self):
+        """Get the converter of the current worker thread.
+
+        :returns:
+            a :class:`Converter`.
+        """
+
+        converter = getattr(self.local, 'converter', None)
+        if converter is None:
+            converter = Converter(**self.converter_kwargs)
+            self.local.converter = converter
+
+        return converter
+
+    def run_job(self,
+                uploads,
+                urls,
+                target_format):
+        """Run a conversion on a worker thread and release its slot.
+
+        :param uploads: List of uploaded image file contents.
+        :param urls: List of URLs of images to fetch.
+        :param target_format: Target format.
+        :returns:
+            ``Tuple`` consisting of the container data and the notices raised
+            during the conversion.
+        """
+
+        try:
+            converter = self.converter()
+            converter.notices = []
+            converter.start_stats()
+            try:
+                fetched = converter.fetch_images(urls) if urls else []
+                sources = uploads + [image for image in fetched
+                                     if image is not None]
+                converter.validate_sources(sources, target_format)
+                data = converter.build_container(sources, target_format)
+            finally:
+                converter.finish_stats()
+
+            return (data, converter.notices)
+        finally:
+            self.release()
+
+    def acquire(self):
+        """Admit a request if there is capacity left.
+
+        :raises RequestError: if all workers are busy and the queue is full.
+        """
+
+        if not self.slots.acquire(False):
+            raise RequestError(503,
+                               'Server is at capacity, retry later',
+                               [('Retry-After', str(SERVER_RETRY_AFTER))])
+
+        with self.lock:
+            self.pending += 1
+
+    def release(self):
+        """Give back the slot of a finished request.
+        """
+
+        with self.lock:
+            self.pending -= 1
+        self.slots.release()
+
+    def status(self):
+        """Describe the load of the server.
+
+        :returns:
+            ``Dictionary`` of the capacity and the number of admitted
+            conversions.
+        """
+
+        with self.lock:
+            pending = self.pending
+
+        return {
+            'workers': self.workers,
+            'queue_size': self.queue_size,
+            'pending': pending,
+            'available': self.capacity - pending,
+        }
+
+    def read_body(self, environ):
+        """Read the body of a request.
+
+        :param environ: WSGI environment.
+        :returns:
+            the request body.
+        :raises RequestError: if the length is missing or exceeds
+            ``max_request_bytes``.
+        """
+
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            raise RequestError(411, 'Invalid Content-Length')
+
+        if length > self.max_request_bytes:
+            raise RequestError(413, 'Request body exceeds %d bytes' % (
+                self.max_request_bytes))
+
+        body = environ['wsgi.input'].read(length) if length else b''
+        if len(body) != length:
+            raise RequestError(400, 'Truncated request body')
+
+        return body
+
+    def parse_request(self, environ):
+        """Extract the images and the target format of a conversion request.
+
+        :param environ: WSGI environment.
+        :returns:
+            ``Tuple`` consisting of the uploaded image file contents, the
+            image URLs and the target format.
+        :raises RequestError: if the request is invalid.
+        """
+
+        params = parse_qs(environ.get('QUERY_STRING', ''))
+        target_formats = params.get('format', [])
+        urls = params.get('url', [])
+        uploads = []
+
+        body = self.read_body(environ)
+        content_type = environ.get('CONTENT_TYPE', '')
+        if content_type.startswith('multipart/form-data'):
+            for (name, filename, value) in parse_multipart(content_type, body):
+                if filename is not None:
+                    uploads.append(value)
+                elif name == 'format':
+                    target_formats.append(value.decode('ascii', 'replace'))
+                elif name == 'url':
+                    urls.append(value.decode('utf-8'))
+        elif body:
+            uploads.append(body)
+
+        if len(target_formats) != 1:
+            raise RequestError(400, 'Exactly one target format is required')
+
+        target_format = target_formats[0]
+        if target_format not in Converter.SUPPORTED_TARGET_FORMATS:
+            raise RequestError(400, 'Invalid target format: %s' % (
+                target_format))
+
+        if not uploads and not urls:
+            raise RequestError(400, 'No images to convert')
+
+        return (uploads, urls, target_format)
+
+    def convert(self, environ):
+        """Run a conversion request.
+
+        :param environ: WSGI environment.
+        :returns:
+            ``Tuple`` consisting of the container data, the target format and
+            the notices raised during the conversion.
+        :raises RequestError: if the request is rejected or fails.
+        """
+
+        self.acquire()
+        try:
+            (uploads, urls, target_format) = self.parse_request(environ)
+        except:
+            self.release()
+            raise
+
+        result = self.pool.apply_async(self.run_job,
+                                       (uploads, urls, target_format))
+        try:
+            (data, notices) = result.get(self.timeout)
+        except TimeoutError:
+            raise RequestError(504, 'Conversion timed out after %g seconds' % (
+                self.timeout))
+        except (ConversionError, ImageError) as e:
+            raise RequestError(422, str(e))
+
+        return (data, target_format, notices)
+
+    def __call__(self,
+                 environ,
+                 start_response):
+        """Handle a request.
+
+        :param environ: WSGI environment.
+        :param start_response: WSGI ``start_response`` callable.
+        :returns:
+            iterable of response body chunks.
+        """
+
+        method = environ.get('REQUEST_METHOD', 'GET')
+        try:
+            if method == 'GET':
+                return self.respond_json(start_response, 200, self.status())
+
+            if method != 'POST':
+                raise RequestError(405,
+                                   'Method not allowed: %s' % (method),
+                                   [('Allow', 'GET, POST')])
+
+            (data, target_format, notices) = self.convert(environ)
+        except RequestError as e:
+            logging.debug('Request failed: %d %s' % (e.status, str(e)))
+            return self.respond_json(start_response,
+                                     e.status,
+                                     {'error': str(e)},
+                                     e.headers)
+        except Exception as e:
+            logging.exception('Conversion failed')
+            return self.respond_json(start_response,
+                                     500,
+                                     {'error': '%s: %s' % (
+                                         e.__class__.__name__, str(e))})
+
+        start_response(self.status_line(200), [
+            ('Content-Type', CONTENT_TYPES[target_format]),
+            ('Content-Length', str(len(data))),
+            ('Content-Disposition', 'attachment; filename="icon.%s"' % (
+                target_format)),
+            ('X-Iconmaker-Notices', str(len(notices))),
+        ])
+
+        stream = BytesIO(data)
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None:
+            return file_wrapper(stream, FETCH_CHUNK_SIZE)
+
+        return iter(lambda: stream.read(FETCH_CHUNK_SIZE), b'')
+
+    def status_line(self, status):
+        """Format an HTTP status line.
+
+        :param status: HTTP status code.
+        :returns:
+            the status line.
+        """
+
+        return '%d %s' % (status, STATUS_MESSAGES[status])
+
+    def respond_json(self,
+                     start_response,
+                     status,
+                     document,
+                     headers = None):
+        """Respond with a JSON document.
+
+        :param start_response: WSGI ``start_response`` callable.
+        :param status: HTTP status code.
+        :param document: Document to serialize.
+        :param headers: Optional list of additional response headers.
+        :returns:
+            the response body chunks.
+        """
+
+        body = json.dumps(document, sort_keys = True).encode('utf-8')
+        start_response(self.status_line(status), [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(body))),
+        ] + (headers or []))
+
+        return [body]
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    """WSGI server handling every request in a thread.
+    """
+
+    daemon_threads = True
+
+
+def serve(host = '127.0.0.1',
+          port = 8080,
+          **server_kwargs):
+    """Serve conversions over HTTP until interrupted.
+
+    :param host: Address to listen on.
+    :param port: Port to listen on.
+    :param server_kwargs:
+        Keyword arguments to create the :class:`ConversionServer` with.
+    """
+
+    application = ConversionServer(**server_kwargs)
+    httpd = make_server(host,
+                        port,
+                        application,
+                        server_class = ThreadingWSGIServer)
+    logging.info('Serving conversions on http://%s:%d/' % (host, port))
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        application.close()
+
+
+def main(argv = None):
+    """Run the conversion server.
+
+    :param argv: Command line arguments.
+    """
+
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[0])
+    parser.add_argument('--host', default = '127.0.0.1',
+                        help = 'address to listen on')
+    parser.add_argument('--port', type = int, default = 8080,
+                        help = 'port to listen on')
+    parser.add_argument('--workers', type = int, default = SERVER_WORKERS,
+                        help = 'conversions run concurrently')
+    parser.add_argument('--queue', type = int, default = SERVER_QUEUE_SIZE,
+                        help = 'conversions waiting for a worker before '
+                        'requests are rejected')
+    parser.add_argument('--timeout', type = float, default = SERVER_TIMEOUT,
+                        help = 'seconds a request waits for its conversion')
+    parser.add_argument('--backend', choices = Converter.SUPPORTED_BACKENDS,
+                        default = Converter.SUPPORTED_BACKENDS[0],
+                        help = 'image resizing backend')
+    parser.add_argument('--compression', choices = sorted(POLICIES),
+                        help = 'compression policy of the PNG entries '
+                        '(default: keep 32 bit PNG sources as is)')
+    parser.add_argument('--retina', action = 'store_true',
+                        help = 'also store ICNS entries under their @2x '
+                        'OSTypes')
+    args = parser.parse_args(argv)
+
+    serve(args.host,
+          args.port,
+          workers = args.workers,
+          queue_size = args.queue,
+          timeout = args.timeout,
+          backend = args.backend,
+          compression = args.compression,
+          retina = args.retina)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+import threading, time
+from contextlib import contextmanager
+
+try:
+    from contextvars import ContextVar
+except ImportError:
+    ContextVar = None
+
+STAGE_FETCH = 'fetch'
+STAGE_PROBE = 'probe'
+STAGE_PROMOTE = 'promote'
+STAGE_RESIZE = 'resize'
+STAGE_ASSEMBLE = 'assemble'
+STAGE_VERIFY = 'verify'
+STAGE_COMPRESS = 'compress'
+
+clock = getattr(time, 'monotonic', time.time)
+"""Monotonic clock where available.
+"""
+
+
+class StageStats(object):
+    """Accumulated measurements of a single conversion stage.
+    """
+
+    __slots__ = ('calls', 'seconds', 'bytes_in', 'bytes_out', 'subprocesses')
+
+    def __init__(self):
+        """Initializer.
+        """
+
+        self.calls = 0
+        self.seconds = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.subprocesses = 0
+
+    def add(self, other):
+        """Add the measurements of another :class:`StageStats`.
+
+        :param other: :class:`StageStats` to add.
+        """
+
+        self.calls += other.calls
+        self.seconds += other.seconds
+        self.bytes_in += other.bytes_in
+        self.bytes_out += other.bytes_out
+        self.subprocesses += other.subprocesses
+
+    def as_dict(self):
+        """Convert the measurements to a dictionary.
+
+        :returns:
+            ``Dictionary`` of measurement names and values.
+        """
+
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __repr__(self):
+        return 'StageStats(calls=%d, seconds=%.6f)' % (self.calls,
+                                                      self.seconds)
+
+
+class ConversionStats(object):
+    """Timings and counters of a single conversion, per stage.
+
+    Stage times are summed over all calls, so stages running concurrently
+    can add up to more than the total time of the conversion.
+    """
+
+    def __init__(self):
+        """Initializer.
+        """
+
+        self.lock = threading.Lock()
+        self.started = clock()
+        self.seconds = None
+        self.stages = {}
+        self.entries = []
+
+    @contextmanager
+    def measure(self, stage):
+        """Measure a call of a stage.
+
+        The time spent in the block is recorded when it is left, with or
+        without an exception.
+
+        :param stage: Name of the stage, e.g. ``STAGE_RESIZE``.
+        :returns:
+            a context manager yielding a :class:`StageStats` to record the
+            byte and subprocess counts of the call in.
+        """
+
+        measurement = StageStats()
+        measurement.calls = 1
+        started = clock()
+        try:
+            yield measurement
+        finally:
+            measurement.seconds = clock() - started
+            with self.lock:
+                self.stages.setdefault(stage, StageStats()).add(measurement)
+
+    def record_entry(self, entry):
+        """Record the outcome of compressing a container entry.
+
+        :param entry: :class:`iconmaker.compression.EntryCompression`.
+        """
+
+        with self.lock:
+            self.entries.append(entry)
+
+    def finish(self):
+        """Record the total time of the conversion.
+        """
+
+        self.seconds = clock() - self.started
+
+    def as_dict(self):
+        """Convert the stats to a dictionary, e.g. for serialization.
+
+        :returns:
+            ``Dictionary`` with the total time of the conversion, the
+            measurements of every stage and the compression of every entry.
+        """
+
+        with self.lock:
+            return {
+                'seconds': self.seconds,
+                'stages': dict((stage, stats.as_dict())
+                               for (stage, stats) in self.stages.items()),
+                'entries': [entry.as_dict() for entry in self.entries],
+            }
+
+
+class StatsScope(object):
+    """Keeps track of the :class:`ConversionStats` of the conversion running
+    in the current context.
+
+    Contexts are asyncio tasks where context variables are available and
+    threads otherwise, so that conversions running concurrently on the same
+    converter each collect their own stats.
+    """
+
+    def __init__(self):
+        """Initializer.
+        """
+
+        if ContextVar is not None:
+            self.var = ContextVar('iconmaker_stats_%x' % (id(self)),
+                                  default = None)
+        else:
+            self.local = threading.local()
+
+    def get(self):
+        """Get the stats of the current context, starting new stats if there
+            are none yet.
+
+        :returns:
+            a :class:`ConversionStats`.
+        """
+
+        if ContextVar is not None:
+            stats = self.var.get()
+        else:
+            stats = getattr(self.local, 'stats', None)
+
+        if stats is None:
+            stats = self.start()
+
+        return stats
+
+    def start(self):
+        """Start new stats in the current context.
+
+        :returns:
+            the new :class:`ConversionStats`.
+        """
+
+        stats = ConversionStats()
+        if ContextVar is not None:
+            self.var.set(stats)
+        else:
+            self.local.stats = stats
+
+        return stats
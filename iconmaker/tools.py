@@ -0,0 +1,117 @@
+import os, threading
+
+from .exceptions import ConversionError
+from .logger import logging
+from .utils import which
+
+TOOL_CONVERT = 'convert'
+
+DEFAULT_TOOL_PATHS = {
+    TOOL_CONVERT: '/opt/local/bin/convert',
+}
+"""Locations checked for the external tools before searching ``PATH``.
+"""
+
+TOOL_ENVIRONMENT = {
+    TOOL_CONVERT: 'ICONMAKER_CONVERT',
+}
+"""Environment variables overriding the locations of the external tools.
+"""
+
+
+def is_executable(path):
+    """Check whether a path is an executable file.
+
+    :param path: Path to check.
+    :returns:
+        ``True`` if the path is an executable file otherwise ``False``.
+    """
+
+    return os.path.isfile(path) and os.access(path, os.X_OK)
+
+
+class ToolRegistry(object):
+    """Process-wide registry of external tool locations.
+
+    Every tool is looked up once, on first use, and the result is cached,
+    including the fact that a tool is missing.
+    """
+
+    def __init__(self):
+        """Initializer.
+        """
+
+        self.lock = threading.Lock()
+        self.paths = {}
+
+    def locate(self, name, path = None):
+        """Look up a tool without consulting the cache.
+
+        A configured path is used as is. Otherwise the tool's environment
+        variable, its default location and finally ``PATH`` are tried in that
+        order.
+
+        :param name: Name of the tool, e.g. ``TOOL_CONVERT``.
+        :param path: Configured path of the tool or ``None``.
+        :returns:
+            the path of the tool or ``None`` if it cannot be found.
+        """
+
+        if path:
+            return path if is_executable(path) else which(path)
+
+        path = os.environ.get(TOOL_ENVIRONMENT[name])
+        if path:
+            return path if is_executable(path) else which(path)
+
+        if is_executable(DEFAULT_TOOL_PATHS[name]):
+            return DEFAULT_TOOL_PATHS[name]
+
+        return which(name)
+
+    def find(self, name, path = None):
+        """Look up a tool.
+
+        :param name: Name of the tool, e.g. ``TOOL_CONVERT``.
+        :param path: Configured path of the tool or ``None``.
+        :returns:
+            the path of the tool or ``None`` if it cannot be found.
+        """
+
+        key = (name, path)
+        with self.lock:
+            if key not in self.paths:
+                self.paths[key] = self.locate(name, path)
+                if self.paths[key] is None:
+                    logging.debug('Tool not found: %s' % (name))
+
+            return self.paths[key]
+
+    def require(self, name, path = None):
+        """Look up a tool that must be present.
+
+        :param name: Name of the tool, e.g. ``TOOL_CONVERT``.
+        :param path: Configured path of the tool or ``None``.
+        :returns:
+            the path of the tool.
+        :raises ConversionError: if the tool cannot be found.
+        """
+
+        found = self.find(name, path)
+        if found is None:
+            raise ConversionError('Unable to locate %s, set %s or install it' % (
+                name, TOOL_ENVIRONMENT[name]))
+
+        return found
+
+    def clear(self):
+        """Forget all looked up tools, e.g. after changing the environment.
+        """
+
+        with self.lock:
+            self.paths.clear()
+
+
+registry = ToolRegistry()
+"""Tool registry shared by all converters of the process.
+"""
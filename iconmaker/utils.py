@@ -1,45 +1,7 @@
-import os
-from PIL import Image
-from exceptions import ImageError
-
-
-def check_and_get_image_sizes(image_list):
-    """Set the sizes for each image
-
-    :param image_list:
-        a ``list`` of local paths to images
-    :returns:
-        a ``dict`` with image name, image size mapping
-    """
-
-    image_dict = {}
-    for image in image_list:
-        try:
-            image_dict[image] = get_image_size(image)
-        except ImageError:  # ignore images with invalid sizes
-            pass
-
-    # raise exception if we don't have any valid images to work with
-    if not image_dict:
-        raise ImageError('Failed to create container icon: invalid images specified: %s', image_list)
-
-    return image_dict
-
-
-def get_image_size(path):
-    """Return the size of the image
-
-    :param path:
-        path to the local image
-    :returns:
-        the size of the icon or raises an exception if width doesn't equal height
-    """
-
-    im = Image.open(path)
-    if im.size[0] != im.size[1]:
-        raise ImageError('width is not the same as height: %s:%dx%d', path, im.size[0], im.size[1])
-
-    return im.size[0]
+import os, binascii, struct, subprocess
+import requests
+from requests.adapters import HTTPAdapter
+from .exceptions import ImageError
 
 
 def which(program):
@@ -66,6 +28,126 @@ def which(program):
 
     return None
 
+def run_command(args, input_data = None):
+    """Run an external command, feeding it data through stdin
+
+    :param args:
+        command and arguments to run
+    :param input_data:
+        data to write to the standard input of the command
+    :returns:
+        the standard output of the command
+    :raises subprocess.CalledProcessError:
+        if the command exits with a non-zero status, with the standard error
+        output as its ``output``
+    """
+
+    process = subprocess.Popen(args,
+                               stdin = subprocess.PIPE,
+                               stdout = subprocess.PIPE,
+                               stderr = subprocess.PIPE)
+    (output, error) = process.communicate(input_data)
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode,
+                                            args,
+                                            output = error)
+
+    return output
+
+def read_file(path):
+    """Read the contents of a file
+
+    :param path:
+        path of the file
+    :returns:
+        contents of the file
+    """
+
+    with open(path, 'rb') as f:
+        return f.read()
+
+def temporary_path(path):
+    """Pick an unused temporary path next to a file
+
+    :param path:
+        path of the file
+    :returns:
+        a path in the same directory, so that it can be renamed over the file
+    """
+
+    (directory, filename) = os.path.split(os.path.abspath(path))
+    return os.path.join(directory,
+                        '.%s.%s.tmp' % (filename,
+                                        binascii.hexlify(os.urandom(8))
+                                        .decode('ascii')))
+
+def replace_file(source, destination):
+    """Atomically move a file over another one
+
+    :param source:
+        path of the file to move
+    :param destination:
+        path of the file to replace
+    """
+
+    if hasattr(os, 'replace'):
+        os.replace(source, destination)
+    else:
+        os.rename(source, destination)
+
+def write_file(path, data):
+    """Write data to a file
+
+    The data is written to a temporary file which then replaces the file, so
+    the file is never left partially written and other links to its previous
+    contents, e.g. in a result cache, keep their contents. Paths which exist
+    but aren't regular files, e.g. ``/dev/stdout``, are written in place.
+
+    :param path:
+        path of the file
+    :param data:
+        contents of the file
+    """
+
+    if os.path.exists(path) and not os.path.isfile(path):
+        with open(path, 'wb') as f:
+            f.write(data)
+        return
+
+    temp_path = temporary_path(path)
+    fd = os.open(temp_path,
+                 os.O_WRONLY | os.O_CREAT | os.O_EXCL |
+                 getattr(os, 'O_BINARY', 0),
+                 0o666)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        replace_file(temp_path, path)
+    except:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+def create_session(pool_size):
+    """Create an HTTP session with a keep-alive connection pool
+
+    :param pool_size:
+        maximum number of connections kept alive per host
+    :returns:
+        a :class:`requests.Session`
+    """
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections = pool_size,
+                          pool_maxsize = pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
 def image_mode_to_bit_depth(mode):
     """Convert an image mode to a bit depth.
     
@@ -88,7 +170,59 @@ def image_mode_to_bit_depth(mode):
             'CMYK': 32, 
             'YCbCr': 24, 
             'I': 32, 
+            'I;16': 16,
             'F': 32
         }[mode]
     except KeyError:
         raise ImageError('cannot determine bit depth for unknown image mode: %s' % (mode))
+
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+"""Magic bytes every PNG file starts with.
+"""
+
+
+def read_png_header(data):
+    """Read the IHDR chunk of a PNG file without decoding any pixels.
+
+    :param data:
+        the first (at least 29) bytes of a PNG file
+    :returns:
+        a ``tuple`` of ``(width, height, bit depth, color type)`` or ``None``
+        if the data does not start with a valid PNG header
+    """
+
+    if len(data) < 29 or data[:8] != PNG_SIGNATURE:
+        return None
+
+    (length, chunk_type) = struct.unpack('>I4s', data[8:16])
+    if chunk_type != b'IHDR' or length != 13:
+        return None
+
+    return struct.unpack('>IIBB', data[16:26])
+
+
+def is_png32(data):
+    """Determine whether the data is a PNG with 8 bit RGBA pixels.
+
+    :param data:
+        contents of the file
+    :returns:
+        ``True`` if the data is a 32 bit PNG image otherwise ``False``
+    """
+
+    header = read_png_header(data)
+    return header is not None and header[2:] == (8, 6)
+
+
+def is_png_palette(data):
+    """Determine whether the data is a PNG with palette pixels.
+
+    :param data:
+        contents of the file
+    :returns:
+        ``True`` if the data is a palette PNG image otherwise ``False``
+    """
+
+    header = read_png_header(data)
+    return header is not None and header[3] == 3
@@ -0,0 +1,71 @@
+import os, shutil, tempfile
+
+SCRATCH_MEMFD = 'memfd'
+"""Scratch location keeping intermediate files in anonymous memory files.
+"""
+
+
+class Workspace(object):
+    """Scratch space owning the intermediate files of a single conversion.
+
+    Files are created lazily and removed by ``cleanup``, which also runs when
+    the workspace is used as a context manager, whether the conversion
+    succeeds or fails.
+    """
+
+    def __init__(self, location = None):
+        """Initializer.
+
+        :param location:
+            Directory to create the scratch directory in, e.g. a tmpfs mount
+            such as ``/dev/shm``, or ``SCRATCH_MEMFD`` to back every file
+            with an anonymous memory file where the platform supports it.
+            Defaults to the system's temporary directory.
+        """
+
+        self.location = location
+        self.directory = None
+        self.descriptors = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+
+    def path(self, name):
+        """Allocate the path of an intermediate file.
+
+        Memory files are exposed through ``/proc`` so that external tools can
+        open them like any other file.
+
+        :param name: File name, unique within the workspace.
+        :returns:
+            the path of the file.
+        """
+
+        if self.location == SCRATCH_MEMFD and hasattr(os, 'memfd_create'):
+            descriptor = os.memfd_create(name)
+            self.descriptors.append(descriptor)
+            return '/proc/%d/fd/%d' % (os.getpid(), descriptor)
+
+        if self.directory is None:
+            location = self.location
+            if location == SCRATCH_MEMFD:
+                location = None
+            self.directory = tempfile.mkdtemp(prefix = 'iconmaker_',
+                                              dir = location)
+
+        return os.path.join(self.directory, name)
+
+    def cleanup(self):
+        """Remove all intermediate files.
+        """
+
+        for descriptor in self.descriptors:
+            os.close(descriptor)
+        self.descriptors = []
+
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors = True)
+            self.directory = None
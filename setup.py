@@ -4,8 +4,8 @@ iconmaker
 =========
 
 iconmaker is a simple Python library providing an interface for easily 
-converting PNG or GIF source files to Microsoft Windows ICO or Apple Mac ICNS 
-icon container formats.
+converting PNG, GIF or JPEG source files and existing icon containers to 
+Microsoft Windows ICO or Apple Mac ICNS icon container formats.
 """
 
 from setuptools import setup, find_packages
@@ -17,7 +17,7 @@ tests_require = [
 
 install_requires = [
 #    'PIL>=1.1.7', 
-    'requests>=0.14.1', 
+    'requests>=2.0.0', 
 ]
 
 setup(
@@ -34,4 +34,9 @@ setup(
     extras_require = {
         'test': tests_require
     },
+    entry_points = {
+        'console_scripts': [
+            'iconmaker = iconmaker.cli:main',
+        ],
+    },
 )
@@ -0,0 +1,37 @@
+from io import BytesIO
+
+from PIL import Image
+
+
+def encode_image(image, image_format = 'PNG', **params):
+    """Encode an image.
+
+    :param image: :class:`PIL.Image.Image` to encode.
+    :param image_format: Pillow format name to encode with.
+    :param params: Additional encoder parameters.
+    :returns:
+        the encoded image data.
+    """
+
+    output = BytesIO()
+    image.save(output, image_format, **params)
+    return output.getvalue()
+
+
+def encode(size,
+           image_format = 'PNG',
+           mode = 'RGBA',
+           color = 0,
+           **params):
+    """Encode a solid image, blank unless a color is given.
+
+    :param size: ``Tuple`` consisting of the width and height of the image.
+    :param image_format: Pillow format name to encode with.
+    :param mode: Pillow mode of the image.
+    :param color: Color of the image.
+    :param params: Additional encoder parameters.
+    :returns:
+        the encoded image data.
+    """
+
+    return encode_image(Image.new(mode, size, color), image_format, **params)
@@ -0,0 +1,196 @@
+import os, shutil, sys, tempfile, threading, unittest
+
+from iconmaker import FORMAT_ICO, FORMAT_ICNS, BACKEND_PILLOW, \
+    BACKEND_IMAGEMAGICK
+from iconmaker.cache import ResultCache
+from iconmaker.tools import TOOL_CONVERT
+from iconmaker.utils import write_file
+from iconmaker.workspace import Workspace
+from iconmaker.exceptions import ConversionError
+from iconmaker.inspector import inspect_container
+
+from helpers import encode
+
+try:
+    import asyncio
+    from iconmaker.aio import AsyncConverter
+except (ImportError, SyntaxError):
+    AsyncConverter = None
+
+
+def run(coroutine):
+    """Run a coroutine on a new event loop.
+    """
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+@unittest.skipIf(AsyncConverter is None, 'requires asyncio')
+class AsyncConverterTests(unittest.TestCase):
+    """Unit tests for the asyncio conversion API.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data):
+        """Write a source image to the test directory.
+        """
+
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_convert_async(self):
+        """Test converting local files to both container formats.
+        """
+
+        image_list = [self.write('16.png', encode((16, 16))),
+                      self.write('32.gif', encode((32, 32), 'GIF', 'P')),
+                      self.write('40.jpg', encode((40, 48), 'JPEG', 'RGB'))]
+
+        converter = AsyncConverter(backend = BACKEND_PILLOW)
+        for (target_format, sizes) in [
+            (FORMAT_ICO, [(16, 16), (32, 32), (40, 48)]),
+            (FORMAT_ICNS, [(16, 16), (32, 32), (48, 48)])]:
+            target_path = os.path.join(self.directory,
+                                       'result.%s' % (target_format))
+            run(converter.convert_async(image_list,
+                                        target_format,
+                                        target_path))
+
+            (container_format, entries) = inspect_container(target_path)
+            self.assertEqual(container_format, target_format)
+            self.assertEqual(sorted(set(entry.size for entry in entries)),
+                             sizes)
+
+    def test_blocking_work_on_executor(self):
+        """Test that hashing, probing and assembly run off the event loop.
+        """
+
+        threads = set()
+
+        class RecordingConverter(AsyncConverter):
+            def prepare_sources(self, sources):
+                threads.add(threading.current_thread())
+                return AsyncConverter.prepare_sources(self, sources)
+
+            def result_key(self, *args):
+                threads.add(threading.current_thread())
+                return AsyncConverter.result_key(self, *args)
+
+            def promote_image(self, *args):
+                threads.add(threading.current_thread())
+                return AsyncConverter.promote_image(self, *args)
+
+            def assemble_container(self, *args):
+                threads.add(threading.current_thread())
+                return AsyncConverter.assemble_container(self, *args)
+
+        converter = RecordingConverter(backend = BACKEND_PILLOW)
+        data = run(converter.build_container_async([encode((16, 16),
+                                                           'GIF',
+                                                           'P')],
+                                                   FORMAT_ICO))
+
+        self.assertTrue(data.startswith(b'\x00\x00\x01\x00'))
+        self.assertTrue(len(threads) > 0)
+        self.assertFalse(threading.current_thread() in threads)
+
+    def test_invalid_arguments(self):
+        """Test that invalid arguments are rejected before any work is done.
+        """
+
+        converter = AsyncConverter(backend = BACKEND_PILLOW)
+        target_path = os.path.join(self.directory, 'result.ico')
+
+        with self.assertRaises(ValueError):
+            run(converter.convert_async([], FORMAT_ICO, target_path))
+
+        with self.assertRaises(ConversionError):
+            run(converter.convert_async([self.write('16.png',
+                                                    encode((16, 16)))],
+                                        'bmp',
+                                        target_path))
+        self.assertFalse(os.path.exists(target_path))
+
+    def test_result_cache(self):
+        """Test that cached containers are linked to the target path without
+        rendering them again.
+        """
+
+        cache = ResultCache(os.path.join(self.directory, 'cache'), 100000)
+        image_list = [self.write('16.png', encode((16, 16)))]
+        rendered = []
+
+        class RecordingConverter(AsyncConverter):
+            def render_container_async(self, *args):
+                rendered.append(args)
+                return AsyncConverter.render_container_async(self, *args)
+
+        converter = RecordingConverter(backend = BACKEND_PILLOW,
+                                       result_cache = cache)
+        target_paths = [os.path.join(self.directory, 'result%d.ico' % (index))
+                        for index in range(2)]
+        for target_path in target_paths:
+            run(converter.convert_async(image_list, FORMAT_ICO, target_path))
+
+        self.assertEqual(len(rendered), 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertTrue(os.path.samefile(target_paths[1],
+                                         cache.path(cache.entries()[0][2])))
+
+    def test_workspace_on_executor(self):
+        """Test that the scratch directory is created and removed off the
+        event loop.
+        """
+
+        threads = []
+
+        class RecordingWorkspace(Workspace):
+            def path(self, name):
+                threads.append(threading.current_thread())
+                return Workspace.path(self, name)
+
+            def cleanup(self):
+                threads.append(threading.current_thread())
+                self.removed = self.directory
+                Workspace.cleanup(self)
+
+        class RecordingConverter(AsyncConverter):
+            def workspace(self):
+                self.scratch_workspace = RecordingWorkspace(self.scratch)
+                return self.scratch_workspace
+
+            def run_tool_async(self, stage, args, input_data):
+                for (index, arg) in enumerate(args):
+                    if arg == '-write':
+                        path = args[index + 1].split(':', 1)[1]
+                        side = int(os.path.basename(path).split('.')[0])
+                        write_file(path, encode((side, side)))
+                return asyncio.sleep(0, b'')
+
+        converter = RecordingConverter(backend = BACKEND_IMAGEMAGICK,
+                                       tool_paths = {TOOL_CONVERT:
+                                                     sys.executable},
+                                       scratch = self.directory,
+                                       generate_sizes = [16])
+        target_path = os.path.join(self.directory, 'result.ico')
+        run(converter.convert_async([self.write('64.png', encode((64, 64)))],
+                                    FORMAT_ICO,
+                                    target_path))
+
+        (container_format, entries) = inspect_container(target_path)
+        self.assertEqual(sorted(entry.size for entry in entries),
+                         [(16, 16), (64, 64)])
+        self.assertEqual(len(threads), 2)
+        self.assertFalse(threading.current_thread() in threads)
+        self.assertFalse(os.path.exists(converter.scratch_workspace.removed))
@@ -0,0 +1,112 @@
+import os, shutil, tempfile, unittest
+
+from iconmaker import BACKEND_PILLOW
+from iconmaker.batch import convert_many
+
+ICONS = os.path.join(os.path.dirname(__file__), 'icons')
+
+
+class BatchTests(unittest.TestCase):
+    """Unit tests for converting many image lists on a process pool.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.png = os.path.join(ICONS, 'package_network32x32.png')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def jobs(self, count, target_format = 'ico'):
+        """Build jobs converting the test icon.
+        """
+
+        return [([self.png],
+                 target_format,
+                 os.path.join(self.directory, 'icon%d.%s' % (index,
+                                                             target_format)))
+                for index in range(count)]
+
+    def test_ordered(self):
+        """Test that results are yielded in job order.
+        """
+
+        jobs = self.jobs(6)
+        results = list(convert_many(jobs,
+                                    3,
+                                    ordered = True,
+                                    backend = BACKEND_PILLOW))
+
+        self.assertEqual([result.index for result in results], list(range(6)))
+        self.assertEqual([result.target_path for result in results],
+                         [target_path for (sources, target_format, target_path)
+                          in jobs])
+        for result in results:
+            self.assertIsNone(result.error)
+            self.assertFalse(result.skipped)
+            self.assertTrue(os.path.isfile(result.target_path))
+
+        results = list(convert_many(self.jobs(6),
+                                    3,
+                                    ordered = False,
+                                    backend = BACKEND_PILLOW))
+        self.assertEqual(sorted(result.index for result in results),
+                         list(range(6)))
+
+    def test_errors(self):
+        """Test that failed jobs report their error without stopping the
+        batch.
+        """
+
+        jobs = self.jobs(3)
+        jobs[1] = ([self.png], 'bmp', os.path.join(self.directory, 'icon.bmp'))
+        results = list(convert_many(jobs, 2, backend = BACKEND_PILLOW))
+
+        self.assertEqual([result.error is None for result in results],
+                         [True, False, True])
+        self.assertTrue(results[1].error.startswith('ConversionError: '))
+        self.assertFalse(os.path.exists(jobs[1][2]))
+        self.assertTrue(os.path.isfile(jobs[2][2]))
+
+    def test_skip_existing(self):
+        """Test that jobs with verified outputs are skipped.
+        """
+
+        jobs = self.jobs(3)
+        list(convert_many(jobs[:2], 2, backend = BACKEND_PILLOW))
+        with open(jobs[1][2], 'wb') as f:
+            f.write(b'truncated')
+
+        results = list(convert_many(jobs,
+                                    2,
+                                    skip_existing = True,
+                                    backend = BACKEND_PILLOW))
+        self.assertEqual([result.skipped for result in results],
+                         [True, False, False])
+        self.assertEqual([result.error for result in results],
+                         [None, None, None])
+
+    def test_max_pending(self):
+        """Test that no more than ``max_pending`` jobs are taken ahead of the
+        results.
+        """
+
+        taken = []
+
+        def jobs():
+            for job in self.jobs(8):
+                taken.append(job)
+                yield job
+
+        results = convert_many(jobs(),
+                               1,
+                               max_pending = 2,
+                               backend = BACKEND_PILLOW)
+        first = next(results)
+        self.assertEqual(first.index, 0)
+        # The result just yielded frees a slot for one more job.
+        self.assertTrue(len(taken) <= 3)
+        self.assertEqual(len(list(results)), 7)
+
+        with self.assertRaises(ValueError):
+            list(convert_many(self.jobs(1), 1, chunksize = 4, max_pending = 2))
@@ -0,0 +1,176 @@
+import os, errno, shutil, tempfile, time, unittest
+
+from iconmaker.cache import SourceCache, ResultCache
+from iconmaker.utils import read_file, write_file
+
+
+class SourceCacheTests(unittest.TestCase):
+    """Unit tests for the on-disk source image cache.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_roundtrip(self):
+        """Test storing and revalidating an image.
+        """
+
+        cache = SourceCache(self.directory, 1000)
+        cache.put('http://example.com/a.png', b'a' * 10, '"etag"', None)
+
+        cached = cache.get('http://example.com/a.png')
+        self.assertEqual(cached.data, b'a' * 10)
+        self.assertEqual(cached.validators(), {'If-None-Match': '"etag"'})
+        self.assertIsNone(cache.get('http://example.com/b.png'))
+
+        # Images without validators can't be revalidated.
+        cache.put('http://example.com/b.png', b'b', None, None)
+        self.assertIsNone(cache.get('http://example.com/b.png'))
+
+    def test_lru_eviction(self):
+        """Test that the least recently used images are evicted first.
+        """
+
+        cache = SourceCache(self.directory, 25)
+        for name in ('a', 'b'):
+            cache.put('http://example.com/%s.png' % (name),
+                      b'x' * 10,
+                      None,
+                      'Mon, 01 Jan 2024 00:00:00 GMT')
+
+        # Make the first image the most recently used one.
+        past = time.time() - 60
+        os.utime(cache.path(cache.key('http://example.com/b.png'), 'data'),
+                 (past, past))
+        cache.touch('http://example.com/a.png')
+
+        cache.put('http://example.com/c.png', b'x' * 10, '"c"', None)
+
+        self.assertIsNotNone(cache.get('http://example.com/a.png'))
+        self.assertIsNone(cache.get('http://example.com/b.png'))
+        self.assertIsNotNone(cache.get('http://example.com/c.png'))
+        self.assertEqual(cache.total_bytes, 20)
+
+        # The size budget survives restarts.
+        self.assertEqual(SourceCache(self.directory, 25).total_bytes, 20)
+
+    def test_shared_directory(self):
+        """Test that the size budget covers the entries of every cache
+        instance using the directory.
+        """
+
+        caches = [SourceCache(self.directory, 25) for i in range(2)]
+        for (index, name) in enumerate('abc'):
+            caches[index % 2].put('http://example.com/%s.png' % (name),
+                                  b'x' * 10,
+                                  '"%s"' % (name),
+                                  None)
+            past = time.time() - 60 + index
+            os.utime(caches[0].path(caches[0].key(
+                'http://example.com/%s.png' % (name))), (past, past))
+
+        self.assertEqual([cache.total_bytes for cache in caches], [20, 20])
+        self.assertIsNone(caches[1].get('http://example.com/a.png'))
+        self.assertIsNotNone(caches[1].get('http://example.com/c.png'))
+
+    def test_mismatched_files(self):
+        """Test that metadata and contents of different versions of an image
+        aren't paired up.
+        """
+
+        cache = SourceCache(self.directory, 1000)
+        cache.put('http://example.com/a.png', b'old', '"old"', None)
+        with open(cache.path(cache.key('http://example.com/a.png')),
+                  'wb') as f:
+            f.write(b'new')
+
+        self.assertIsNone(cache.get('http://example.com/a.png'))
+
+
+class ResultCacheTests(unittest.TestCase):
+    """Unit tests for the on-disk container cache.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_hits_and_misses(self):
+        """Test lookups, links and their counters.
+        """
+
+        cache = ResultCache(os.path.join(self.directory, 'cache'), 1000)
+        target_path = os.path.join(self.directory, 'icon.ico')
+        with open(target_path, 'wb') as f:
+            f.write(b'old')
+
+        self.assertIsNone(cache.get('key'))
+        self.assertFalse(cache.link('key', target_path))
+        with open(target_path, 'rb') as f:
+            self.assertEqual(f.read(), b'old')
+
+        cache.put('key', b'container')
+        self.assertEqual(cache.get('key'), b'container')
+        self.assertTrue(cache.link('key', target_path))
+        with open(target_path, 'rb') as f:
+            self.assertEqual(f.read(), b'container')
+
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+    def test_failed_link(self):
+        """Test that the target is kept if the container can't be placed and
+        that containers are copied where they can't be linked.
+        """
+
+        cache = ResultCache(os.path.join(self.directory, 'cache'), 1000)
+        cache.put('key', b'container')
+        target_path = os.path.join(self.directory, 'icon.ico')
+        with open(target_path, 'wb') as f:
+            f.write(b'old')
+
+        def fail(*args):
+            raise OSError(errno.EXDEV, 'Invalid cross-device link')
+
+        link = os.link
+        copyfile = shutil.copyfile
+        os.link = fail
+        try:
+            shutil.copyfile = fail
+            try:
+                self.assertFalse(cache.link('key', target_path))
+            finally:
+                shutil.copyfile = copyfile
+
+            self.assertEqual(read_file(target_path), b'old')
+            self.assertEqual(sorted(os.listdir(self.directory)),
+                             ['cache', 'icon.ico'])
+
+            self.assertTrue(cache.link('key', target_path))
+        finally:
+            os.link = link
+
+        self.assertEqual(read_file(target_path), b'container')
+        self.assertEqual(os.stat(target_path).st_nlink, 1)
+
+    def test_shared_contents(self):
+        """Test that linked targets and cache entries don't affect each other.
+        """
+
+        cache = ResultCache(os.path.join(self.directory, 'cache'), 1000)
+        cache.put('key', b'container')
+        past = int(time.time()) - 60
+        os.utime(cache.path('key'), (past, past))
+
+        target_path = os.path.join(self.directory, 'icon.ico')
+        self.assertTrue(cache.link('key', target_path))
+        self.assertEqual(os.path.getmtime(target_path), past)
+        self.assertTrue(os.path.getmtime(cache.path('key', 'used')) > past)
+
+        write_file(target_path, b'edited')
+        self.assertEqual(cache.get('key'), b'container')
+        self.assertEqual(read_file(target_path), b'edited')
@@ -0,0 +1,108 @@
+import json, os, shutil, tempfile, unittest
+
+from iconmaker.cli import main
+
+ICONS = os.path.join(os.path.dirname(__file__), 'icons')
+
+
+class Output(object):
+    """Stream collecting the written result lines.
+    """
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, data):
+        self.lines.extend(line for line in data.splitlines() if line)
+
+    def flush(self):
+        pass
+
+    def results(self):
+        return [json.loads(line) for line in self.lines]
+
+
+class CliTests(unittest.TestCase):
+    """Unit tests for the manifest command line converter.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_manifest(self, lines, *args):
+        """Run the command line converter on a manifest.
+
+        :returns:
+            ``Tuple`` consisting of the exit status and the result lines.
+        """
+
+        manifest = os.path.join(self.directory, 'manifest.jsonl')
+        with open(manifest, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+        output = Output()
+        status = main(['--workers', '2', manifest] + list(args),
+                      stdout = output)
+        return (status, output.results())
+
+    def test_manifest(self):
+        """Test that jobs are converted, rejected and resumed per line.
+        """
+
+        png = os.path.join(ICONS, 'package_network32x32.png')
+        targets = [os.path.join(self.directory, 'icon%d.ico' % (index))
+                   for index in range(3)]
+        lines = [json.dumps({'sources': [png],
+                             'format': 'ico',
+                             'output': target}) for target in targets]
+        lines.insert(1, '{"sources": []}')
+        lines.append(json.dumps({'sources': [png],
+                                 'format': 'bmp',
+                                 'output': targets[0]}))
+
+        (status, results) = self.run_manifest(lines)
+        self.assertEqual(status, 1)
+        self.assertEqual(sorted(result['line'] for result in results),
+                         [1, 2, 3, 4, 5])
+
+        by_line = dict((result['line'], result) for result in results)
+        self.assertEqual([by_line[line]['status'] for line in range(1, 6)],
+                         ['ok', 'error', 'ok', 'ok', 'error'])
+        self.assertTrue(by_line[1]['stats']['seconds'] > 0)
+        for target in targets:
+            self.assertTrue(os.path.isfile(target))
+
+        # Outputs that fail verification are converted again.
+        with open(targets[2], 'wb') as f:
+            f.write(b'truncated')
+
+        (status, results) = self.run_manifest(lines[:1] + lines[2:4],
+                                              '--resume')
+        self.assertEqual(status, 0)
+        self.assertEqual([result['status'] for result in results],
+                         ['skipped', 'skipped', 'ok'])
+
+    def test_rejected_order(self):
+        """Test that invalid lines are reported in manifest order.
+        """
+
+        png = os.path.join(ICONS, 'package_network32x32.png')
+        lines = []
+        for index in range(4):
+            lines.append('not json')
+            lines.append(json.dumps({'sources': [png],
+                                     'format': 'ico',
+                                     'output': os.path.join(
+                                         self.directory,
+                                         'icon%d.ico' % (index))}))
+            lines.append('{"format": "ico"}')
+
+        (status, results) = self.run_manifest(lines)
+        self.assertEqual(status, 1)
+        self.assertEqual([result['line'] for result in results],
+                         list(range(1, 13)))
+        self.assertEqual([result['status'] for result in results],
+                         ['error', 'ok', 'error'] * 4)
@@ -0,0 +1,123 @@
+import os, sys, unittest
+
+from iconmaker import Converter, FORMAT_ICO, FORMAT_ICNS, BACKEND_IMAGEMAGICK
+from iconmaker.inspector import inspect_buffer
+from iconmaker.tools import TOOL_CONVERT
+from iconmaker.utils import write_file
+from iconmaker.workspace import Workspace
+
+from helpers import encode
+
+CONVERT = sys.executable
+"""Stand-in path of ``convert``; the commands are only built, never run.
+"""
+
+
+class RecordingConverter(Converter):
+    """Converter recording the external tool calls instead of running them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        Converter.__init__(self, *args, **kwargs)
+        self.calls = []
+
+    def run_tool(self, stage, args, input_data):
+        self.calls.append(args)
+
+        # Write the versions of a ladder command, named after their size.
+        for (index, arg) in enumerate(args):
+            if arg == '-write':
+                path = args[index + 1][len('png32:'):]
+                side = int(os.path.basename(path).split('.')[0])
+                write_file(path, encode((side, side)))
+        if args[-1] == 'null:':
+            return b''
+
+        # Answer with an image of the size the last operation produces.
+        size = [arg for arg in args if 'x' in arg and arg[0].isdigit()][-1]
+        return encode(tuple(int(side) for side in size.split('x')))
+
+
+class CommandTests(unittest.TestCase):
+    """Unit tests for the ImageMagick commands of the conversion stages.
+    """
+
+    def setUp(self):
+        self.converter = RecordingConverter(backend = BACKEND_IMAGEMAGICK,
+                                            tool_paths = {TOOL_CONVERT:
+                                                          CONVERT})
+
+    def test_pipeline_command(self):
+        """Test that all resize steps of an image end up in one command.
+        """
+
+        self.assertEqual(self.converter.pipeline_command([(300, 300, True),
+                                                          (256, 256, False)]),
+                         [CONVERT, '-',
+                          '-gravity', 'center',
+                          '-background', 'transparent',
+                          '-extent', '300x300',
+                          '-resize', '256x256',
+                          'png32:-'])
+        self.assertEqual(self.converter.pipeline_command([]),
+                         [CONVERT, '-', 'png32:-'])
+        self.assertEqual(self.converter.resize_command(16, 16, False),
+                         [CONVERT, '-', '-resize', '16x16', 'png32:-'])
+
+    def test_ladder_command(self):
+        """Test that sizes are scaled down through a halving pyramid.
+        """
+
+        with Workspace() as workspace:
+            (args, paths) = self.converter.ladder_command(100,
+                                                          [],
+                                                          [48, 16, 100, 24],
+                                                          workspace)
+
+            self.assertEqual(paths, [workspace.path('%d.png' % (size))
+                                     for size in (48, 16, 100, 24)])
+
+        (p48, p16, p100, p24) = ['png32:%s' % (path) for path in paths]
+        self.assertEqual(args,
+                         [CONVERT, '-',
+                          '-write', p100,
+                          '-scale', '50x50',
+                          '(', '+clone', '-resize', '48x48',
+                          '-write', p48, '+delete', ')',
+                          '-scale', '25x25',
+                          '(', '+clone', '-resize', '24x24',
+                          '-write', p24, '+delete', ')',
+                          '(', '+clone', '-resize', '16x16',
+                          '-write', p16, '+delete', ')',
+                          'null:'])
+
+    def test_single_call_per_source(self):
+        """Test that normalizing a source takes a single call.
+        """
+
+        data = self.converter.convert_bytes([encode((300, 200)),
+                                             encode((16, 16))],
+                                            FORMAT_ICNS)
+
+        self.assertEqual(self.converter.calls,
+                         [self.converter.pipeline_command([(300, 300, True),
+                                                           (256, 256, False)])])
+        self.assertEqual(sorted(set(entry.size
+                                    for entry in inspect_buffer(data)[1])),
+                         [(16, 16), (256, 256)])
+
+    def test_single_call_per_master(self):
+        """Test that the resized entry of a master is written by the ladder
+        command rather than a separate call.
+        """
+
+        self.converter.generate_sizes = [16, 32]
+        data = self.converter.convert_bytes([encode((1024, 1024))],
+                                            FORMAT_ICO)
+
+        self.assertEqual(len(self.converter.calls), 1)
+        self.assertEqual(self.converter.calls[0][:4],
+                         [CONVERT, '-', '-scale', '512x512'])
+        self.assertEqual(sorted(set(entry.size
+                                    for entry in inspect_buffer(data)[1])),
+                         [(16, 16), (32, 32), (256, 256)])
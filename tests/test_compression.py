@@ -0,0 +1,96 @@
+import unittest
+from io import BytesIO
+
+from PIL import Image
+
+from iconmaker import Converter, FORMAT_ICO, FORMAT_ICNS, BACKEND_PILLOW, \
+    COMPRESSION_FAST, COMPRESSION_SMALLEST
+from iconmaker.compression import compress_entries, reduce_palette
+from iconmaker.imaging import encode_png
+from iconmaker.reader import ContainerReader
+
+from helpers import encode_image
+
+
+def shapes(size):
+    """Create an image of a few flat colors with semi-transparent edges.
+    """
+
+    image = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+    for y in range(size):
+        for x in range(size):
+            if x in (0, size - 1) or y in (0, size - 1):
+                image.putpixel((x, y), (255, 0, 0, 128))
+            elif x < size // 2:
+                image.putpixel((x, y), (0, 128, 255, 255))
+    return image
+
+
+class CompressionTests(unittest.TestCase):
+    """Unit tests for the PNG entry compression policies.
+    """
+
+    def test_reduce_palette(self):
+        """Test that palette reduction is lossless and skips rich images.
+        """
+
+        image = shapes(32)
+        (palette_image, params) = reduce_palette(image)
+        decoded = Image.open(BytesIO(encode_image(palette_image,
+                                                  **params))).convert('RGBA')
+        self.assertEqual(decoded.tobytes(), image.tobytes())
+
+        rich = Image.new('RGBA', (32, 32))
+        rich.putdata([(x, y, x ^ y, 255) for y in range(32)
+                      for x in range(32)])
+        self.assertEqual(reduce_palette(rich), None)
+
+    def test_policies(self):
+        """Test that entries are only ever made smaller and reported.
+        """
+
+        sources = [encode_image(shapes(16), compress_level = 0),
+                   shapes(32),
+                   encode_image(shapes(48).convert('RGB'),
+                                compress_level = 0)]
+        fast = compress_entries(sources, COMPRESSION_FAST)
+        smallest = compress_entries(sources, COMPRESSION_SMALLEST, True)
+
+        # Fast leaves 32 bit PNG files alone.
+        self.assertEqual(fast[0][0], sources[0])
+        self.assertEqual(fast[0][1].bytes_saved, 0)
+
+        # Savings are measured against the default encoding.
+        self.assertEqual(fast[1][1].bytes_before,
+                         len(encode_png(sources[1])))
+        self.assertEqual(fast[2][1].bytes_before, len(sources[2]))
+
+        for ((data, compression), (fast_data, _)) in zip(smallest, fast):
+            self.assertTrue(compression.bytes_saved > 0)
+            self.assertTrue(len(data) <= len(fast_data))
+
+    def test_containers(self):
+        """Test that compressed containers decode to the same pixels.
+        """
+
+        sources = [encode_image(shapes(size), compress_level = 0) for size in (16, 32, 48, 64)]
+        for target_format in (FORMAT_ICO, FORMAT_ICNS):
+            plain = Converter(backend = BACKEND_PILLOW)
+            compressed = Converter(backend = BACKEND_PILLOW,
+                                   compression = COMPRESSION_SMALLEST)
+
+            expected = plain.convert_bytes(sources, target_format)
+            data = compressed.convert_bytes(sources, target_format)
+            self.assertTrue(len(data) < len(expected))
+
+            entries = compressed.stats.as_dict()['entries']
+            self.assertEqual(len(entries),
+                             3 if target_format == FORMAT_ICNS else 4)
+
+            expected = ContainerReader(expected)
+            reader = ContainerReader(data)
+            for size in (16, 32, 48, 64):
+                self.assertEqual(reader.read(size).tobytes(),
+                                 expected.read(size).tobytes())
+
+        self.assertRaises(ValueError, Converter, compression = 'tiny')
@@ -1,12 +1,11 @@
 import os, sys, subprocess, unittest, tempfile, random
 from struct import unpack
 from PIL import Image
-try:
-    from cStringIO import StringIO
-except:
-    from StringIO import StringIO
 
-import mysql.connector
+try:
+    import mysql.connector
+except ImportError:
+    mysql = None
 
 from iconmaker import Converter, FORMAT_PNG, FORMAT_GIF, FORMAT_ICO, FORMAT_ICNS
 from iconmaker.exceptions import ConversionError, ImageError
@@ -21,25 +20,13 @@ NONSQUARE_ICONSETS = 10
 INVALID_ICNS_ICONSETS = 10
 
 
-class ConverterTests(unittest.TestCase):
-    """Unit tests for various conversion operations.
+class ConversionTestCase(unittest.TestCase):
+    """Base class of the conversion tests.
     """
 
     def setUp(self):
         self.converter = Converter()
 
-        # connect to the db
-        self.db = mysql.connector.Connect(
-            host = os.getenv('DB_HOST', 'localhost'),
-            user = os.getenv('DB_USER', 'root'),
-            password = os.getenv('DB_PASSWORD', ''),
-            database = os.getenv('DB_DATABASE', 'www_iconfinder'))
-        self.cursor = self.db.cursor()
-
-    def tearDown(self):
-        self.cursor.close()
-        self.db.close()
-
     def assertAllTargetFormatsRaise(self,
                                     exception,
                                     files):
@@ -78,6 +65,11 @@ class ConverterTests(unittest.TestCase):
             self.assertTrue(self.converter.verify_generated_icon(target_format,
                 result_path))
 
+
+class ConverterTests(ConversionTestCase):
+    """Unit tests for various conversion operations.
+    """
+
     def test_convert_empty_image_list(self):
         """Test conversion from an empty source.
         """
@@ -132,15 +124,6 @@ class ConverterTests(unittest.TestCase):
                 os.path.join(ICONS_TEST_DIR, 'icon32x32.png')
             ])
 
-    def test_convert_remote(self):
-        """Test conversion from remote source.
-        """
-
-        self.assertAllTargetFormatsSucceed([
-                'http://cdn1.iconfinder.com/data/icons/yooicons_set01_socialbookmarks/16/social_facebook_box_blue.png', 
-                'http://cdn1.iconfinder.com/data/icons/yooicons_set01_socialbookmarks/32/social_facebook_box_blue.png'
-            ])
-
     def test_convert_MAS_iconset(self):
         """Test conversion of a complete MAS (Mac App Store) iconset.
         """
@@ -155,6 +138,38 @@ class ConverterTests(unittest.TestCase):
                 os.path.join(ICONS_TEST_DIR, 'ttp/icon1024x1024.png'),
             ])
 
+
+
+@unittest.skipIf(mysql is None, 'requires mysql-connector')
+class IconfinderTests(ConversionTestCase):
+    """Conversion tests of iconsets hosted by Iconfinder, which require its
+    database and CDN.
+    """
+
+    def setUp(self):
+        super(IconfinderTests, self).setUp()
+
+        # connect to the db
+        self.db = mysql.connector.Connect(
+            host = os.getenv('DB_HOST', 'localhost'),
+            user = os.getenv('DB_USER', 'root'),
+            password = os.getenv('DB_PASSWORD', ''),
+            database = os.getenv('DB_DATABASE', 'www_iconfinder'))
+        self.cursor = self.db.cursor()
+
+    def tearDown(self):
+        self.cursor.close()
+        self.db.close()
+
+    def test_convert_remote(self):
+        """Test conversion from remote source.
+        """
+
+        self.assertAllTargetFormatsSucceed([
+                'http://cdn1.iconfinder.com/data/icons/yooicons_set01_socialbookmarks/16/social_facebook_box_blue.png', 
+                'http://cdn1.iconfinder.com/data/icons/yooicons_set01_socialbookmarks/32/social_facebook_box_blue.png'
+            ])
+
     def execute_sql_query(self, sqlquery):
         self.cursor.execute(sqlquery)
         rows = self.cursor.fetchall()
@@ -301,7 +316,7 @@ ORDER BY
         # get N random iconsets
         # using 1, 1000 inclusive for iconid
         random_iconsets = [random.randint(1, 1000) for r in
-                            xrange(RANDOM_ICONSETS)]
+                            range(RANDOM_ICONSETS)]
 
         sqlquery = """
 SELECT
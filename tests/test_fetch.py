@@ -0,0 +1,263 @@
+import os, tempfile, threading, time, unittest
+
+from PIL import Image
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+
+from iconmaker import Converter, FORMAT_ICO, FORMAT_ICNS, BACKEND_PILLOW
+from iconmaker.exceptions import ImageError
+from iconmaker.ico import build_ico
+from iconmaker.icns import build_icns
+from iconmaker.inspector import inspect_buffer, inspect_container
+
+from helpers import encode, encode_image
+
+FETCH_DELAY = 0.2
+
+
+class StreamedResponse(object):
+    """Stand-in for a streamed :class:`requests.Response`, counting the
+    chunks read.
+    """
+
+    def __init__(self, chunks, headers = None):
+        self.chunks = chunks
+        self.headers = headers or {}
+        self.read = 0
+
+    def iter_content(self, chunk_size):
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """HTTP server handling every request in a thread.
+    """
+
+    daemon_threads = True
+
+
+class ImageServer(object):
+    """In-process HTTP server serving canned responses.
+    """
+
+    def __init__(self):
+        """Initializer.
+        """
+
+        self.routes = {}
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.requests = 0
+
+        image_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                image_server.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target = self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        """Stop the server.
+        """
+
+        self.server.shutdown()
+        self.server.server_close()
+
+    def url(self, path):
+        """Get the URL of a path on the server.
+        """
+
+        return 'http://127.0.0.1:%d%s' % (self.server.server_address[1], path)
+
+    def route(self,
+              path,
+              body,
+              status = 200,
+              delay = 0,
+              headers = None):
+        """Add a canned response.
+
+        :returns:
+            the URL of the response.
+        """
+
+        self.routes[path] = (status, body, delay, headers or {})
+        return self.url(path)
+
+    def handle(self, handler):
+        """Answer a request with its canned response.
+        """
+
+        with self.lock:
+            self.requests += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+
+        try:
+            (status, body, delay, headers) = self.routes.get(
+                handler.path, (404, b'', 0, {}))
+            time.sleep(delay)
+
+            handler.send_response(status)
+            for (name, value) in headers.items():
+                handler.send_header(name, value)
+            if not 'Content-Length' in headers:
+                handler.send_header('Content-Length', str(len(body)))
+            handler.end_headers()
+            handler.wfile.write(body)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+class FetchTests(unittest.TestCase):
+    """Unit tests for fetching remote images.
+    """
+
+    def setUp(self):
+        self.server = ImageServer()
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_concurrent(self):
+        """Test that images are fetched concurrently and returned in order.
+        """
+
+        images = [encode((size, size)) for size in (16, 32, 48, 64)]
+        urls = [self.server.route('/%d.png' % (index),
+                                  image,
+                                  delay = FETCH_DELAY)
+                for (index, image) in enumerate(images)]
+
+        converter = Converter(backend = BACKEND_PILLOW, fetch_workers = 4)
+        self.assertEqual(converter.fetch_images(urls), images)
+        self.assertTrue(self.server.max_active > 1)
+        self.assertEqual(converter.stats.stages['fetch'].calls, 4)
+
+    def test_fetch_workers(self):
+        """Test that no more than ``fetch_workers`` images are fetched at a
+        time.
+        """
+
+        urls = [self.server.route('/%d.png' % (index),
+                                  encode((16, 16)),
+                                  delay = FETCH_DELAY / 4)
+                for index in range(6)]
+
+        converter = Converter(backend = BACKEND_PILLOW, fetch_workers = 2)
+        converter.fetch_images(urls)
+        self.assertTrue(self.server.max_active <= 2)
+
+    def test_notices(self):
+        """Test that failed fetches are reported in the notices and leave a
+        gap in the results.
+        """
+
+        image = encode((16, 16))
+        urls = [self.server.route('/missing.png', b'', status = 404),
+                self.server.route('/icon.png', image),
+                self.server.route('/text.png', b'<html>not an image</html>')]
+
+        converter = Converter(backend = BACKEND_PILLOW)
+        self.assertEqual(converter.fetch_images(urls), [None, image, None])
+        self.assertEqual(len(converter.notices), 2)
+        self.assertTrue(converter.notices[0].startswith(
+            'Could not retrieve image'))
+        self.assertTrue(converter.notices[1].startswith(
+            'Could not save image'))
+
+    def test_convert(self):
+        """Test that ``convert`` fetches every remote image once.
+        """
+
+        urls = [self.server.route('/16.gif', encode((16, 16), 'GIF', 'P')),
+                self.server.route('/32.png', encode((32, 32)))]
+
+        (handle, target_path) = tempfile.mkstemp('.ico')
+        os.close(handle)
+        try:
+            converter = Converter(backend = BACKEND_PILLOW)
+            converter.convert(urls + urls, FORMAT_ICO, target_path)
+
+            (container_format, entries) = inspect_container(target_path)
+        finally:
+            os.remove(target_path)
+
+        self.assertEqual(self.server.requests, 2)
+        self.assertEqual(sorted(entry.size for entry in entries),
+                         [(16, 16), (32, 32)])
+
+    def test_containers(self):
+        """Test that ICO and ICNS containers are accepted as remote sources.
+        """
+
+        image = Image.new('RGBA', (32, 32), (255, 0, 0, 255))
+        urls = [self.server.route('/icon.ico', build_ico([image])),
+                self.server.route('/icon.icns', build_icns([image]))]
+
+        converter = Converter(backend = BACKEND_PILLOW)
+        sources = converter.fetch_images(urls)
+        self.assertEqual(converter.notices, [])
+
+        for source in sources:
+            data = converter.convert_bytes([source], FORMAT_ICNS)
+            self.assertEqual(inspect_buffer(data)[0], FORMAT_ICNS)
+
+    def test_max_bytes(self):
+        """Test that images larger than ``fetch_max_bytes`` are rejected.
+        """
+
+        url = self.server.route('/large.png',
+                                encode_image(Image.frombytes(
+                                    'RGBA',
+                                    (16, 16),
+                                    os.urandom(16 * 16 * 4))))
+
+        converter = Converter(backend = BACKEND_PILLOW, fetch_max_bytes = 100)
+        self.assertEqual(converter.fetch_images([url]), [None])
+        self.assertTrue('exceeds 100 bytes' in converter.notices[0])
+
+    def test_streamed_max_bytes(self):
+        """Test that downloads without a length stop once they exceed
+        ``fetch_max_bytes``.
+        """
+
+        converter = Converter(backend = BACKEND_PILLOW, fetch_max_bytes = 100)
+        response = StreamedResponse([encode((16, 16))[:64]] + [b'\x00' * 64] * 8)
+        with self.assertRaises(ImageError):
+            converter.read_response('http://example.com/', response)
+        self.assertEqual(response.read, 2)
+
+    def test_early_rejection(self):
+        """Test that the download stops once the magic bytes show that the
+        body isn't a supported image.
+        """
+
+        converter = Converter(backend = BACKEND_PILLOW)
+        for head in [b'<html><body>', b'BM\x00\x00\x00\x00\x00\x00']:
+            response = StreamedResponse([head] + [b'\x00' * 64] * 8)
+            with self.assertRaises(ImageError):
+                converter.read_response('http://example.com/', response)
+            self.assertEqual(response.read, 1)
+
+        image = encode((16, 16))
+        response = StreamedResponse([image[:4], image[4:]])
+        self.assertEqual(converter.read_response('http://example.com/',
+                                                 response),
+                         image)
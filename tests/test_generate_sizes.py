@@ -0,0 +1,96 @@
+import unittest
+from io import BytesIO
+
+from PIL import Image
+
+from iconmaker import Converter, FORMAT_ICO, BACKEND_PILLOW
+from iconmaker import imaging
+from iconmaker.imaging import resize_ladder
+
+from helpers import encode
+
+
+class GenerateSizesTests(unittest.TestCase):
+    """Unit tests for generating sizes from a single master image.
+    """
+
+    def test_resize_ladder(self):
+        """Test that every requested size is generated.
+        """
+
+        master = Image.new('RGBA', (100, 100), (255, 0, 0, 255))
+        ladder = resize_ladder(master, [48, 16, 100, 24])
+
+        self.assertEqual([image.size for image in ladder],
+                         [(48, 48), (16, 16), (100, 100), (24, 24)])
+        self.assertEqual(ladder[1].getpixel((8, 8)), (255, 0, 0, 255))
+
+    def test_missing_sizes(self):
+        """Test that only missing sizes are generated, never scaled up.
+        """
+
+        master = encode((60, 40), color = (255, 0, 0, 255))
+        small = encode((16, 16), color = (0, 0, 255, 255))
+        converter = Converter(backend = BACKEND_PILLOW, generate_sizes = True)
+
+        icon = Image.open(BytesIO(converter.convert_bytes([master, small],
+                                                          FORMAT_ICO)))
+        self.assertEqual(sorted(icon.info['sizes']),
+                         [(16, 16), (24, 24), (32, 32), (48, 48), (60, 40)])
+
+        # The given 16 px image is kept.
+        icon.size = (16, 16)
+        self.assertEqual(icon.convert('RGBA').getpixel((8, 8)),
+                         (0, 0, 255, 255))
+
+    def test_resized_master(self):
+        """Test that a resized entry of the master is generated through the
+        halving pyramid along with the missing sizes.
+        """
+
+        master = encode((1024, 1024), color = (255, 0, 0, 255))
+        converter = Converter(backend = BACKEND_PILLOW, generate_sizes = True)
+
+        infos = converter.probe_sources([master])
+        plan = converter.plan_container([master], FORMAT_ICO, infos)
+        self.assertEqual([steps for (image, info, steps) in plan],
+                         [[(256, 256, False)]])
+
+        (plan, ladder) = converter.plan_ladder([master],
+                                               infos,
+                                               plan,
+                                               FORMAT_ICO)
+        self.assertEqual(plan, [])
+        self.assertEqual(ladder[2:], ([], [16, 24, 32, 48, 64, 128, 256]))
+
+        icon = Image.open(BytesIO(converter.convert_bytes([master],
+                                                          FORMAT_ICO)))
+        self.assertEqual(sorted(icon.info['sizes']),
+                         [(16, 16), (24, 24), (32, 32), (48, 48), (64, 64),
+                          (128, 128), (256, 256)])
+
+    def test_single_decode(self):
+        """Test that a master which must be promoted is decoded once.
+        """
+
+        master = encode((64, 64), mode = 'P')
+
+        decoded = []
+        open_image = imaging.open_image
+
+        def recording_open_image(source):
+            if source == master:
+                decoded.append(source)
+            return open_image(source)
+
+        imaging.open_image = recording_open_image
+        try:
+            converter = Converter(backend = BACKEND_PILLOW,
+                                  generate_sizes = True)
+            data = converter.convert_bytes([master], FORMAT_ICO)
+        finally:
+            imaging.open_image = open_image
+
+        self.assertEqual(len(decoded), 1)
+        self.assertEqual(sorted(Image.open(BytesIO(data)).info['sizes']),
+                         [(16, 16), (24, 24), (32, 32), (48, 48), (64, 64)])
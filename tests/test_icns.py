@@ -0,0 +1,146 @@
+import os, struct, unittest
+from PIL import Image
+
+from iconmaker import Converter, FORMAT_ICNS, BACKEND_PILLOW
+from iconmaker.icns import build_icns, build_icns_chunks, encode_rle
+from iconmaker.exceptions import ConversionError
+
+from helpers import encode, encode_image
+
+
+ICONS_TEST_DIR = os.path.join(os.path.dirname(
+                                os.path.abspath(__file__)),
+                                'icons')
+
+
+def decode_rle(data, length):
+    """Decompress a single channel of ICNS run length encoded data.
+    """
+
+    data = bytearray(data)
+    output = bytearray()
+    index = 0
+    while len(output) < length:
+        header = data[index]
+        if header < 0x80:
+            output.extend(data[index + 1:index + header + 2])
+            index += header + 2
+        else:
+            output.extend(bytearray([data[index + 1]]) * (header - 0x80 + 3))
+            index += 2
+
+    return bytes(output), index
+
+
+class IcnsWriterTests(unittest.TestCase):
+    """Unit tests for the in-process ICNS writer.
+    """
+
+    def read_chunks(self, data):
+        """Parse the chunks of an ICNS container.
+
+        :param data: ICNS container data.
+        :returns: list of ``(ostype, data)`` tuples.
+        """
+
+        (magic, length) = struct.unpack('>4sI', data[:8])
+        self.assertEqual(magic, b'icns')
+        self.assertEqual(length, len(data))
+
+        chunks = []
+        offset = 8
+        while offset < length:
+            (ostype, chunk_length) = struct.unpack('>4sI', data[offset:offset + 8])
+            chunks.append((ostype, data[offset + 8:offset + chunk_length]))
+            offset += chunk_length
+
+        self.assertEqual(offset, length)
+        return chunks
+
+    def test_png_chunks(self):
+        """Test that PNG sources are stored under their primary OSType.
+        """
+
+        sources = []
+        for size in (16, 32, 64, 128, 256, 512, 1024):
+            path = os.path.join(ICONS_TEST_DIR, 'ttp/icon%dx%d.png' % (size, size))
+            with open(path, 'rb') as f:
+                sources.append(f.read())
+
+        chunks = self.read_chunks(build_icns(sources))
+
+        self.assertEqual([ostype for (ostype, data) in chunks],
+                         [b'icp4', b'icp5', b'icp6', b'ic07', b'ic08', b'ic09', b'ic10'])
+        self.assertEqual([data for (ostype, data) in chunks], sources)
+
+    def test_legacy_chunks(self):
+        """Test that 48 pixel sources are stored as RLE RGB data and a mask.
+        """
+
+        image = Image.new('RGBA', (48, 48), (10, 20, 30, 40))
+        image.putpixel((5, 5), (1, 2, 3, 4))
+
+        chunks = self.read_chunks(build_icns([image]))
+
+        self.assertEqual([ostype for (ostype, data) in chunks], [b'ih32', b'h8mk'])
+        (rgb_data, mask_data) = (chunks[0][1], chunks[1][1])
+        self.assertEqual(mask_data, image.split()[3].tobytes())
+
+        offset = 0
+        for channel in image.split()[:3]:
+            (decoded, consumed) = decode_rle(rgb_data[offset:], 48 * 48)
+            self.assertEqual(decoded, channel.tobytes())
+            offset += consumed
+        self.assertEqual(offset, len(rgb_data))
+
+    def test_rle_roundtrip(self):
+        """Test run length encoding of literal and repeated runs.
+        """
+
+        data = b'abc' + b'x' * 300 + bytes(bytearray(range(256))) + b'yy'
+        (decoded, consumed) = decode_rle(encode_rle(data), len(data))
+        self.assertEqual(decoded, data)
+
+    def test_explicit_chunks(self):
+        """Test assembling high resolution chunks.
+        """
+
+        png = encode((32, 32))
+
+        data = build_icns_chunks([(b'ic11', png)])
+        chunks = self.read_chunks(data)
+        self.assertEqual(chunks, [(b'ic11', png)])
+
+    def test_retina_aliases(self):
+        """Test that entries are shared with the @2x OSTypes of their size.
+        """
+
+        sources = [Image.new('RGBA', (size, size), (size, 0, 0, 255))
+                   for size in (16, 32, 48, 64, 256, 1024)]
+
+        chunks = self.read_chunks(build_icns(sources, retina = True))
+        self.assertEqual([ostype for (ostype, data) in chunks],
+                         [b'icp4', b'icp5', b'ic11', b'ih32', b'h8mk', b'icp6',
+                          b'ic12', b'ic08', b'ic13', b'ic10'])
+
+        payloads = dict(chunks)
+        for (ostype, alias) in ((b'icp5', b'ic11'),
+                                (b'icp6', b'ic12'),
+                                (b'ic08', b'ic13')):
+            self.assertEqual(payloads[ostype], payloads[alias])
+
+        pngs = [encode_image(source) for source in sources[:2]]
+
+        converter = Converter(backend = BACKEND_PILLOW, retina = True)
+        data = converter.convert_bytes(pngs, FORMAT_ICNS)
+        self.assertEqual([ostype for (ostype, data) in self.read_chunks(data)],
+                         [b'icp4', b'icp5', b'ic11'])
+
+    def test_invalid_entries(self):
+        """Test that non-square and unsupported sizes are rejected.
+        """
+
+        with self.assertRaises(ConversionError):
+            build_icns([Image.new('RGBA', (32, 16))])
+        with self.assertRaises(ConversionError):
+            build_icns([Image.new('RGBA', (20, 20))])
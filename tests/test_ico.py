@@ -0,0 +1,98 @@
+import os, struct, unittest
+from io import BytesIO
+from PIL import Image
+
+from iconmaker.ico import build_ico, ENCODING_BMP, ENCODING_PNG
+from iconmaker.exceptions import ConversionError
+
+
+ICONS_TEST_DIR = os.path.join(os.path.dirname(
+                                os.path.abspath(__file__)),
+                                'icons')
+
+
+class IcoWriterTests(unittest.TestCase):
+    """Unit tests for the in-process ICO writer.
+    """
+
+    def read_directory(self, data):
+        """Parse the directory of an ICO container.
+
+        :param data: ICO container data.
+        :returns: list of ``(width, height, size, offset)`` tuples.
+        """
+
+        (reserved, image_type, count) = struct.unpack('<3H', data[:6])
+        self.assertEqual((reserved, image_type), (0, 1))
+
+        entries = []
+        for index in range(count):
+            entry = struct.unpack('<4B2H2I', data[6 + index * 16:22 + index * 16])
+            entries.append((entry[0] or 256, entry[1] or 256, entry[6], entry[7]))
+
+        return entries
+
+    def test_png32_embedded_verbatim(self):
+        """Test that 32 bit PNG sources are not re-encoded.
+        """
+
+        with open(os.path.join(ICONS_TEST_DIR, 'ttp/icon256x256.png'), 'rb') as f:
+            source = f.read()
+
+        data = build_ico([source])
+        entries = self.read_directory(data)
+
+        self.assertEqual(len(entries), 1)
+        (width, height, size, offset) = entries[0]
+        self.assertEqual((width, height), (256, 256))
+        self.assertEqual(data[offset:offset + size], source)
+
+    def test_mixed_sources(self):
+        """Test building an ICO file from images and file contents.
+        """
+
+        with open(os.path.join(ICONS_TEST_DIR, 'icon16x16.gif'), 'rb') as f:
+            gif = f.read()
+
+        image = Image.new('RGBA', (32, 32), (255, 0, 0, 128))
+        data = build_ico([gif, image])
+        entries = self.read_directory(data)
+
+        self.assertEqual([e[:2] for e in entries], [(16, 16), (32, 32)])
+        for (width, height, size, offset) in entries:
+            decoded = Image.open(BytesIO(data[offset:offset + size]))
+            self.assertEqual(decoded.size, (width, height))
+            self.assertEqual(decoded.mode, 'RGBA')
+
+    def test_bmp_entries(self):
+        """Test BMP encoded entries with an AND mask.
+        """
+
+        image = Image.new('RGBA', (20, 20), (0, 0, 255, 255))
+        image.putpixel((0, 0), (0, 0, 0, 0))
+
+        data = build_ico([image, Image.new('RGBA', (256, 256))],
+                         ENCODING_BMP)
+        entries = self.read_directory(data)
+        (width, height, size, offset) = entries[0]
+
+        # 40 byte header, 20 rows of BGRA pixels and 20 rows of 4 byte masks.
+        self.assertEqual(size, 40 + 20 * 20 * 4 + 20 * 4)
+        header = struct.unpack('<3I2H', data[offset:offset + 16])
+        self.assertEqual(header, (40, 20, 40, 1, 32))
+
+        # The transparent top left pixel is the first bit of the last row.
+        mask_start = offset + 40 + 20 * 20 * 4
+        self.assertEqual(data[mask_start + 19 * 4:mask_start + 20 * 4],
+                         b'\x80\x00\x00\x00')
+
+        # 256 pixel entries are always PNG.
+        (width, height, size, offset) = entries[1]
+        self.assertEqual(data[offset:offset + 4], b'\x89PNG')
+
+    def test_oversized_entry(self):
+        """Test that entries larger than 256 pixels are rejected.
+        """
+
+        with self.assertRaises(ConversionError):
+            build_ico([Image.new('RGBA', (512, 512))], ENCODING_PNG)
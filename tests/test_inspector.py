@@ -0,0 +1,77 @@
+import os, shutil, tempfile, unittest
+
+from PIL import Image
+
+from iconmaker.exceptions import ImageError
+from iconmaker.ico import build_ico, ENCODING_BMP, ENCODING_PNG
+from iconmaker.icns import build_icns
+from iconmaker.inspector import inspect_container, inspect_icns, \
+    CONTAINER_ICO, CONTAINER_ICNS, ENCODING_RLE, ENCODING_MASK
+
+
+class InspectorTests(unittest.TestCase):
+    """Unit tests for structural container inspection.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data):
+        """Write a file to the test directory.
+        """
+
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_ico(self):
+        """Test listing the entries of ICO containers.
+        """
+
+        images = [Image.new('RGBA', (size, size)) for size in (16, 256)]
+        for encoding in (ENCODING_PNG, ENCODING_BMP):
+            path = self.write('icon.ico', build_ico(images, encoding))
+            (container_format, entries) = inspect_container(path)
+
+            self.assertEqual(container_format, CONTAINER_ICO)
+            self.assertEqual([entry.size for entry in entries],
+                             [(16, 16), (256, 256)])
+            # 256 px entries are always PNG encoded.
+            self.assertEqual([entry.encoding for entry in entries],
+                             [encoding, ENCODING_PNG])
+
+    def test_icns(self):
+        """Test listing the chunks of ICNS containers.
+        """
+
+        images = [Image.new('RGBA', (size, size)) for size in (48, 1024)]
+        data = build_icns(images)
+        (container_format, entries) = inspect_container(
+            self.write('icon.icns', data))
+
+        self.assertEqual(container_format, CONTAINER_ICNS)
+        self.assertEqual([(entry.ostype, entry.encoding) for entry in entries],
+                         [(b'ih32', ENCODING_RLE),
+                          (b'h8mk', ENCODING_MASK),
+                          (b'ic10', ENCODING_PNG)])
+        self.assertEqual(entries[-1].offset + entries[-1].length, len(data))
+
+    def test_truncated(self):
+        """Test that truncated and corrupt containers are rejected.
+        """
+
+        ico = build_ico([Image.new('RGBA', (32, 32))])
+        icns = build_icns([Image.new('RGBA', (32, 32))])
+
+        for data in (ico[:-1], icns[:-1], ico[:10], b''):
+            self.assertRaises(ImageError,
+                              inspect_container,
+                              self.write('icon', data))
+
+        # A chunk running past the end of the container.
+        corrupt = icns[:12] + b'\xff' + icns[13:]
+        self.assertRaises(ImageError, inspect_icns, corrupt)
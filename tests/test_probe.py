@@ -0,0 +1,68 @@
+import os, unittest
+
+from PIL import Image
+
+from iconmaker.exceptions import ImageError
+from iconmaker.probe import probe_image
+
+from helpers import encode
+
+
+class ProbeTests(unittest.TestCase):
+    """Unit tests for header based image probing.
+    """
+
+    def test_png(self):
+        """Test reading the size and mode of PNG images.
+        """
+
+        for mode in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA'):
+            info = probe_image(encode((24, 12), 'PNG', mode))
+            self.assertEqual((info.format, info.size, info.mode),
+                             ('png', (24, 12), mode))
+
+        self.assertEqual(probe_image(encode((1, 1))).bit_depth,
+                         32)
+
+    def test_gif_and_jpeg(self):
+        """Test reading the size and mode of GIF and JPEG images.
+        """
+
+        info = probe_image(encode((30, 20), 'GIF', 'P'))
+        self.assertEqual((info.format, info.size, info.bit_depth),
+                         ('gif', (30, 20), 8))
+
+        for mode in ('L', 'RGB', 'CMYK'):
+            info = probe_image(encode((40, 50), 'JPEG', mode, progressive = True))
+            self.assertEqual((info.format, info.size, info.mode),
+                             ('jpeg', (40, 50), mode))
+
+    def test_matches_pillow(self):
+        """Test that probing agrees with Pillow on the test icons.
+        """
+
+        directory = os.path.join(os.path.dirname(__file__), 'icons')
+        for filename in os.listdir(directory):
+            if not filename.endswith(('.png', '.gif')):
+                continue
+
+            path = os.path.join(directory, filename)
+            try:
+                im = Image.open(path)
+            except IOError:
+                continue
+
+            with open(path, 'rb') as f:
+                info = probe_image(f.read())
+
+            self.assertEqual((info.format, info.size),
+                             (im.format.lower(), im.size))
+
+    def test_invalid(self):
+        """Test that unidentifiable data is rejected.
+        """
+
+        self.assertRaises(ImageError, probe_image, b'not an image')
+        self.assertRaises(ImageError,
+                          probe_image,
+                          encode((1, 1), mode = 'RGB')[:20])
@@ -0,0 +1,134 @@
+import struct, unittest, zlib
+from io import BytesIO
+
+from PIL import Image
+
+from iconmaker import Converter, FORMAT_ICO, BACKEND_PILLOW
+from iconmaker.imaging import promote_image
+from iconmaker.probe import probe_image
+
+from helpers import encode_image
+
+
+def pixels(image):
+    """List the pixels of an image.
+    """
+
+    return [image.getpixel((x, 0)) for x in range(image.size[0])]
+
+
+def create(mode, data, transparency = None):
+    """Create a single row image.
+    """
+
+    image = Image.new(mode, (len(data), 1))
+    image.putdata(data)
+    if transparency is not None:
+        image.info['transparency'] = transparency
+    return image
+
+
+def encode_wide_png(color_type, samples, size = 16):
+    """Encode a square PNG image with 16 bit samples, repeating a row of
+    pixels.
+    """
+
+    def chunk(chunk_type, data):
+        return (struct.pack('>I', len(data)) + chunk_type + data +
+                struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff))
+
+    row = b'\x00' + struct.pack('>%dH' % (size * len(samples[0])),
+                                 *[sample
+                                   for pixel in samples * (size // len(samples))
+                                   for sample in pixel])
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB',
+                                       size, size, 16, color_type, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(row * size)) +
+            chunk(b'IEND', b''))
+
+
+class PromoteTests(unittest.TestCase):
+    """Unit tests for promoting images to 32 bit RGBA in memory.
+    """
+
+    def test_modes(self):
+        """Test the promotion of every mode, including transparency.
+        """
+
+        palette = create('P', [0, 1, 2], b'\x00\x80')
+        palette.putpalette([255, 0, 0, 0, 255, 0, 0, 0, 255] + [0] * 759)
+        self.assertEqual(pixels(promote_image(palette)),
+                         [(255, 0, 0, 0), (0, 255, 0, 128), (0, 0, 255, 255)])
+
+        gif = create('P', [0, 1], 1)
+        gif.putpalette([255, 0, 0, 0, 255, 0] + [0] * 762)
+        self.assertEqual(pixels(promote_image(gif)),
+                         [(255, 0, 0, 255), (0, 255, 0, 0)])
+
+        self.assertEqual(pixels(promote_image(create('L', [5, 9], 5))),
+                         [(5, 5, 5, 0), (9, 9, 9, 255)])
+        self.assertEqual(pixels(promote_image(create('RGB',
+                                                     [(1, 2, 3), (4, 5, 6)],
+                                                     (1, 2, 3)))),
+                         [(1, 2, 3, 0), (4, 5, 6, 255)])
+        self.assertEqual(pixels(promote_image(create('LA', [(10, 20)]))),
+                         [(10, 10, 10, 20)])
+        self.assertEqual(pixels(promote_image(create('1', [0, 255]))),
+                         [(0, 0, 0, 255), (255, 255, 255, 255)])
+        self.assertEqual(pixels(promote_image(create('CMYK',
+                                                     [(0, 255, 0, 0)]))),
+                         [(255, 0, 255, 255)])
+
+        # 16 bit samples are scaled down and compared exactly.
+        self.assertEqual(pixels(promote_image(create('I',
+                                                     [1000, 65535, 1001],
+                                                     1000))),
+                         [(4, 4, 4, 0), (255, 255, 255, 255),
+                          (4, 4, 4, 255)])
+        self.assertEqual(pixels(promote_image(create('F', [0.0, 65535.0]))),
+                         [(0, 0, 0, 255), (255, 255, 255, 255)])
+
+    def test_no_subprocess(self):
+        """Test that palette images are promoted without running any tools.
+        """
+
+        image = Image.new('P', (16, 16), 1)
+        image.putpalette([0, 0, 0, 255, 0, 0] + [0] * 762)
+        converter = Converter(backend = BACKEND_PILLOW)
+        data = converter.convert_bytes([encode_image(image, transparency = 0)],
+                                       FORMAT_ICO)
+
+        stats = converter.stats.as_dict()['stages']
+        self.assertEqual(stats['promote']['calls'], 1)
+        self.assertEqual(sum(stage['subprocesses']
+                             for stage in stats.values()), 0)
+        self.assertEqual(Image.open(BytesIO(data)).convert('RGBA')
+                         .getpixel((0, 0)), (255, 0, 0, 255))
+
+    def test_wide_grayscale(self):
+        """Test that 16 bit grayscale PNG images are promoted, with and
+        without alpha.
+        """
+
+        for (color_type, samples, expected) in [
+            (0, [(1000, ), (65535, )],
+             [(4, 4, 4, 255), (255, 255, 255, 255)]),
+            (4, [(1000, 65535), (65535, 0)],
+             [(3, 3, 3, 255), (255, 255, 255, 0)])]:
+            source = encode_wide_png(color_type, samples)
+
+            # The probed mode matches the mode Pillow decodes to.
+            info = probe_image(source)
+            self.assertEqual(info.mode.split(';')[0],
+                             Image.open(BytesIO(source)).mode.split(';')[0])
+
+            converter = Converter(backend = BACKEND_PILLOW)
+            data = converter.convert_bytes([source], FORMAT_ICO)
+
+            icon = Image.open(BytesIO(data)).convert('RGBA')
+            self.assertEqual([icon.getpixel((x, 0)) for x in range(2)],
+                             expected)
+
+            stages = converter.stats.as_dict()['stages']
+            self.assertEqual('promote' in stages, color_type == 0)
@@ -0,0 +1,76 @@
+import os, unittest
+from io import BytesIO
+
+from PIL import Image
+from PIL.IcoImagePlugin import IcoFile
+from PIL.IcnsImagePlugin import IcnsFile
+
+from iconmaker import Converter, FORMAT_ICO, BACKEND_PILLOW
+from iconmaker.exceptions import ImageError
+from iconmaker.icns import build_icns
+from iconmaker.reader import ContainerReader, open_container
+
+ICONS = os.path.join(os.path.dirname(__file__), 'icons')
+
+
+def gradient(size):
+    """Create a semi-transparent gradient.
+    """
+
+    image = Image.new('RGBA', (size, size))
+    image.putdata([(x * 4 % 256, y * 4 % 256, 128, (x + y) % 256)
+                   for y in range(size) for x in range(size)])
+    return image
+
+
+class ReaderTests(unittest.TestCase):
+    """Unit tests for the ICO and ICNS reader.
+    """
+
+    def test_existing_containers(self):
+        """Test that frames decode the same as with Pillow.
+        """
+
+        for (name, container_file, size) in (
+                ('package_network16x16.ico', IcoFile, (32, 32)),
+                ('package_network16x16.icns', IcnsFile, (32, 32, 1))):
+            path = os.path.join(ICONS, name)
+            with open(path, 'rb') as f:
+                expected = container_file(f).getimage(size).convert('RGBA')
+
+            reader = open_container(path)
+            try:
+                self.assertEqual(reader.sizes(),
+                                 [(16, 16), (32, 32), (48, 48)])
+                self.assertEqual(reader.read(32).tobytes(),
+                                 expected.tobytes())
+            finally:
+                reader.close()
+
+    def test_selective_reads(self):
+        """Test reading single frames of an ICNS container.
+        """
+
+        data = build_icns([gradient(48), gradient(256)])
+        reader = ContainerReader(data)
+
+        # Legacy frames are decoded together with their mask.
+        self.assertEqual(reader.read(48).tobytes(), gradient(48).tobytes())
+
+        # PNG frames are returned as stored.
+        frame = reader.find(256)
+        self.assertEqual(reader.read_png(frame), reader.payload(frame))
+
+        self.assertRaises(ImageError, reader.read, 64)
+
+    def test_container_source(self):
+        """Test converting an existing container.
+        """
+
+        converter = Converter(backend = BACKEND_PILLOW)
+        data = converter.convert_bytes(
+            [build_icns([gradient(16), gradient(128)])],
+            FORMAT_ICO)
+
+        self.assertEqual(sorted(Image.open(BytesIO(data)).info['sizes']),
+                         [(16, 16), (128, 128)])
@@ -0,0 +1,124 @@
+import json, os, unittest
+from io import BytesIO
+from wsgiref import util
+
+from PIL import Image
+
+from iconmaker.server import ConversionServer, parse_multipart
+
+ICONS = os.path.join(os.path.dirname(__file__), 'icons')
+
+
+def read_icon(name):
+    with open(os.path.join(ICONS, name), 'rb') as f:
+        return f.read()
+
+
+class ServerTests(unittest.TestCase):
+    """Unit tests for the WSGI conversion server.
+    """
+
+    def setUp(self):
+        self.server = ConversionServer(workers = 1, queue_size = 1)
+
+    def tearDown(self):
+        self.server.close()
+
+    def request(self,
+                method = 'POST',
+                query = '',
+                body = b'',
+                content_type = 'application/octet-stream'):
+        """Send a request to the server.
+
+        :returns:
+            ``Tuple`` consisting of the status line, the headers and the body.
+        """
+
+        environ = {
+            'REQUEST_METHOD': method,
+            'QUERY_STRING': query,
+            'CONTENT_TYPE': content_type,
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': BytesIO(body),
+        }
+        util.setup_testing_defaults(environ)
+
+        response = {}
+
+        def start_response(status, headers):
+            response['status'] = status
+            response['headers'] = dict(headers)
+
+        chunks = self.server(environ, start_response)
+        return (response['status'],
+                response['headers'],
+                b''.join(chunks))
+
+    def test_convert(self):
+        """Test conversions of raw and multipart uploads.
+        """
+
+        (status, headers, body) = self.request(
+            query = 'format=ico',
+            body = read_icon('package_network32x32.png'))
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers['Content-Type'], 'image/x-icon')
+        self.assertEqual(Image.open(BytesIO(body)).size, (32, 32))
+
+        boundary = 'iconmakerboundary'
+        parts = [b'--' + boundary.encode('ascii') + b'\r\n'
+                 b'Content-Disposition: form-data; name="format"\r\n\r\n'
+                 b'icns\r\n']
+        for name in ('package_network16x16.png', 'package_network32x32.png'):
+            parts.append(b'--' + boundary.encode('ascii') + b'\r\n'
+                         b'Content-Disposition: form-data; name="image"; '
+                         b'filename="' + name.encode('ascii') + b'"\r\n'
+                         b'Content-Type: image/png\r\n\r\n' +
+                         read_icon(name) + b'\r\n')
+        parts.append(b'--' + boundary.encode('ascii') + b'--\r\n')
+
+        body = b''.join(parts)
+        fields = parse_multipart('multipart/form-data; boundary=' + boundary,
+                                 body)
+        self.assertEqual([name for (name, filename, value) in fields],
+                         ['format', 'image', 'image'])
+
+        (status, headers, body) = self.request(
+            body = body,
+            content_type = 'multipart/form-data; boundary=' + boundary)
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers['Content-Type'], 'image/icns')
+        self.assertEqual(body[:4], b'icns')
+
+    def test_rejected_requests(self):
+        """Test that invalid requests and requests over capacity are rejected.
+        """
+
+        png = read_icon('package_network32x32.png')
+
+        (status, headers, body) = self.request(query = 'format=bmp',
+                                               body = png)
+        self.assertEqual(status, '400 Bad Request')
+
+        (status, headers, body) = self.request(query = 'format=ico',
+                                               body = b'not an image')
+        self.assertEqual(status, '422 Unprocessable Entity')
+
+        for i in range(2):
+            self.server.acquire()
+        try:
+            (status, headers, body) = self.request(query = 'format=ico',
+                                                   body = png)
+            self.assertEqual(status, '503 Service Unavailable')
+            self.assertIn('Retry-After', headers)
+
+            (status, headers, body) = self.request(method = 'GET')
+            self.assertEqual(json.loads(body.decode('utf-8'))['available'], 0)
+        finally:
+            for i in range(2):
+                self.server.release()
+
+        (status, headers, body) = self.request(query = 'format=ico',
+                                               body = png)
+        self.assertEqual(status, '200 OK')
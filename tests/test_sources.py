@@ -0,0 +1,45 @@
+import unittest
+from io import BytesIO
+
+from PIL import Image
+
+from iconmaker import Converter, FORMAT_ICO, BACKEND_PILLOW
+
+from helpers import encode
+
+
+class SourceTests(unittest.TestCase):
+    """Unit tests for deduplicating and choosing source images.
+    """
+
+    def test_duplicates(self):
+        """Test that byte-identical images are processed once.
+        """
+
+        image = encode((32, 32), color = (255, 0, 0, 255))
+        converter = Converter(backend = BACKEND_PILLOW)
+
+        data = converter.convert_bytes([image, image, image], FORMAT_ICO)
+        self.assertEqual(Image.open(BytesIO(data)).size, (32, 32))
+        self.assertEqual(converter.stats.stages['probe'].bytes_in, len(image))
+        self.assertEqual(converter.notices, [])
+
+    def test_size_conflicts(self):
+        """Test that the image of the highest depth wins regardless of order.
+        """
+
+        rgba = encode((32, 32), color = (0, 0, 255, 255))
+        gif = encode((32, 32), 'GIF', 'P', 1)
+        grey = encode((32, 32), mode = 'L', color = 128)
+
+        results = []
+        for sources in ([gif, rgba, grey], [grey, gif, rgba]):
+            converter = Converter(backend = BACKEND_PILLOW)
+            results.append(converter.convert_bytes(sources, FORMAT_ICO))
+            self.assertEqual(converter.notices,
+                             ['Found 3 images of 32x32, using the 32 bit png '
+                              'image'])
+
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(Image.open(BytesIO(results[0])).convert('RGBA')
+                         .getpixel((0, 0)), (0, 0, 255, 255))
@@ -0,0 +1,105 @@
+import os, shutil, sys, tempfile, unittest
+
+from iconmaker import Converter, FORMAT_ICO, BACKEND_PILLOW
+from iconmaker.stats import ConversionStats, STAGE_PROBE, STAGE_RESIZE, \
+    STAGE_ASSEMBLE, STAGE_VERIFY
+
+from helpers import encode
+
+
+class StatsTests(unittest.TestCase):
+    """Unit tests for per-stage conversion stats.
+    """
+
+    def test_measure(self):
+        """Test that failed calls are measured too.
+        """
+
+        stats = ConversionStats()
+        with stats.measure(STAGE_RESIZE) as measurement:
+            measurement.bytes_in = 10
+
+        try:
+            with stats.measure(STAGE_RESIZE):
+                raise ValueError()
+        except ValueError:
+            pass
+
+        stage = stats.stages[STAGE_RESIZE]
+        self.assertEqual((stage.calls, stage.bytes_in), (2, 10))
+        self.assertTrue(stage.seconds >= 0)
+
+    def test_hook(self):
+        """Test that every conversion reports its stats.
+        """
+
+        reported = []
+        converter = Converter(backend = BACKEND_PILLOW,
+                              stats_hook = reported.append)
+        sources = [encode((16, 16)), encode((300, 300))]
+        data = converter.convert_bytes(sources, FORMAT_ICO)
+
+        self.assertEqual(reported, [converter.stats])
+        stats = converter.stats.as_dict()
+        self.assertTrue(stats['seconds'] > 0)
+        self.assertEqual(stats['stages'][STAGE_PROBE]['bytes_in'],
+                         sum(len(source) for source in sources))
+        self.assertEqual(stats['stages'][STAGE_RESIZE]['calls'], 1)
+        self.assertEqual(stats['stages'][STAGE_ASSEMBLE]['bytes_out'],
+                         len(data))
+        self.assertEqual(stats['stages'][STAGE_VERIFY]['bytes_in'], len(data))
+
+        converter.convert_bytes(sources, FORMAT_ICO)
+        self.assertEqual(len(reported), 2)
+        self.assertEqual(reported[1].stages[STAGE_PROBE].calls, 1)
+
+    @unittest.skipIf(sys.version_info < (3, 7), 'requires asyncio')
+    def test_overlapping_conversions(self):
+        """Test that conversions in flight on the same converter collect
+        their own stats.
+        """
+
+        import asyncio
+        from iconmaker.aio import AsyncConverter
+
+        directory = tempfile.mkdtemp()
+        try:
+            jobs = []
+            for (index, sizes) in enumerate([[(16, 16)],
+                                             [(16, 16), (32, 32)]]):
+                image_list = []
+                for size in sizes:
+                    path = os.path.join(directory, '%d_%d.png' % (index,
+                                                                  size[0]))
+                    with open(path, 'wb') as f:
+                        f.write(encode(size))
+                    image_list.append(path)
+                jobs.append((image_list,
+                             os.path.join(directory, '%d.ico' % (index))))
+
+            reported = []
+            converter = AsyncConverter(backend = BACKEND_PILLOW,
+                                       stats_hook = reported.append)
+
+            loop = asyncio.new_event_loop()
+            try:
+                tasks = [loop.create_task(converter.convert_async(image_list,
+                                                                  FORMAT_ICO,
+                                                                  target_path))
+                         for (image_list, target_path) in jobs]
+                for task in tasks:
+                    loop.run_until_complete(task)
+            finally:
+                loop.close()
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertEqual(len(reported), 2)
+        self.assertFalse(reported[0] is reported[1])
+        self.assertEqual(sorted(stats.stages[STAGE_PROBE].bytes_in
+                                for stats in reported),
+                         [len(encode((16, 16))),
+                          len(encode((16, 16))) + len(encode((32, 32)))])
+        for stats in reported:
+            self.assertEqual(stats.stages[STAGE_PROBE].calls, 1)
+            self.assertEqual(stats.stages[STAGE_ASSEMBLE].calls, 1)
@@ -0,0 +1,58 @@
+import os, shutil, stat, tempfile, unittest
+
+from iconmaker import Converter, BACKEND_IMAGEMAGICK
+from iconmaker.exceptions import ConversionError
+from iconmaker.tools import ToolRegistry, TOOL_CONVERT, TOOL_ENVIRONMENT
+
+
+class ToolRegistryTests(unittest.TestCase):
+    """Unit tests for the external tool registry.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.environ = dict(os.environ)
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.directory)
+
+    def make_tool(self, name):
+        """Create an executable file.
+        """
+
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write('#!/bin/sh\n')
+        os.chmod(path, stat.S_IRWXU)
+        return path
+
+    def test_lookup_order(self):
+        """Test configured paths, the environment and caching.
+        """
+
+        configured = self.make_tool('configured')
+        environment = self.make_tool('environment')
+        os.environ[TOOL_ENVIRONMENT[TOOL_CONVERT]] = environment
+
+        registry = ToolRegistry()
+        self.assertEqual(registry.find(TOOL_CONVERT, configured), configured)
+        self.assertEqual(registry.find(TOOL_CONVERT), environment)
+
+        # Lookups are cached until cleared.
+        os.environ[TOOL_ENVIRONMENT[TOOL_CONVERT]] = configured
+        self.assertEqual(registry.find(TOOL_CONVERT), environment)
+        registry.clear()
+        self.assertEqual(registry.find(TOOL_CONVERT), configured)
+
+    def test_missing_tool(self):
+        """Test that missing tools only fail when they are needed.
+        """
+
+        missing = os.path.join(self.directory, 'missing')
+        converter = Converter(backend = BACKEND_IMAGEMAGICK,
+                              tool_paths = {TOOL_CONVERT: missing})
+
+        self.assertIsNone(converter.capabilities()[BACKEND_IMAGEMAGICK])
+        self.assertRaises(ConversionError, lambda: converter.converttool)
@@ -0,0 +1,95 @@
+import os, shutil, sys, tempfile, unittest
+
+from iconmaker import Converter, FORMAT_ICO, BACKEND_IMAGEMAGICK
+from iconmaker.tools import TOOL_CONVERT
+from iconmaker.workspace import Workspace, SCRATCH_MEMFD
+
+from helpers import encode
+
+
+class WorkspaceConverter(Converter):
+    """Converter recording its workspaces, with external tool calls faked by
+    writing blank images to the requested paths.
+    """
+
+    def __init__(self, *args, **kwargs):
+        Converter.__init__(self, *args, **kwargs)
+        self.workspaces = []
+
+    def workspace(self):
+        workspace = Converter.workspace(self)
+        self.workspaces.append(workspace)
+        return workspace
+
+    def run_tool(self, stage, args, input_data):
+        for (index, arg) in enumerate(args):
+            if arg == '-write':
+                path = args[index + 1].split(':', 1)[1]
+                size = int(os.path.basename(path).split('.')[0])
+                with open(path, 'wb') as f:
+                    f.write(encode((size, size)))
+        return encode((256, 256))
+
+
+class WorkspaceTests(unittest.TestCase):
+    """Unit tests for the scratch workspace.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_cleanup_on_failure(self):
+        """Test that intermediate files are removed when a conversion fails.
+        """
+
+        try:
+            with Workspace(self.directory) as workspace:
+                with open(workspace.path('0.png'), 'wb') as f:
+                    f.write(b'data')
+                self.assertEqual(len(os.listdir(self.directory)), 1)
+                raise ValueError()
+        except ValueError:
+            pass
+
+        self.assertEqual(os.listdir(self.directory), [])
+
+    @unittest.skipUnless(hasattr(os, 'memfd_create'), 'requires memfd')
+    def test_memfd(self):
+        """Test that memory files can be opened by path.
+        """
+
+        with Workspace(SCRATCH_MEMFD) as workspace:
+            path = workspace.path('0.png')
+            with open(path, 'wb') as f:
+                f.write(b'data')
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), b'data')
+
+        self.assertEqual(workspace.descriptors, [])
+        self.assertIsNone(workspace.directory)
+
+    def test_single_workspace_per_conversion(self):
+        """Test that a conversion keeps all intermediate files in one
+        workspace and removes them when it is done.
+        """
+
+        source = os.path.join(self.directory, 'source.png')
+        with open(source, 'wb') as f:
+            f.write(encode((300, 300)))
+        scratch = os.path.join(self.directory, 'scratch')
+        os.mkdir(scratch)
+
+        converter = WorkspaceConverter(backend = BACKEND_IMAGEMAGICK,
+                                       tool_paths = {TOOL_CONVERT:
+                                                     sys.executable},
+                                       scratch = scratch,
+                                       generate_sizes = [16, 32, 48])
+        converter.convert([source],
+                          FORMAT_ICO,
+                          os.path.join(self.directory, 'result.ico'))
+
+        self.assertEqual(len(converter.workspaces), 1)
+        self.assertEqual(os.listdir(scratch), [])